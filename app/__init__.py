@@ -1,33 +1,17 @@
-import nltk
 import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from dotenv import load_dotenv
-from flask_login import LoginManager
-
+from app.nltk_resources import NLTK_PATH, configurer_chemin, verifier_manifest, prefetch
+from app.database import configurer_base, activer_pragmas, proteger_fork
+from app.hachage import HachageMotsDePasse
 
-# Créer un dossier pour stocker les données NLTK sur Render
-NLTK_PATH = os.path.join(os.getcwd(), "nltk_data")
-os.makedirs(NLTK_PATH, exist_ok=True)
 
-# Ajouter ce chemin à NLTK
-nltk.data.path.append(NLTK_PATH)
-
-# Téléchargement automatique (ne plante pas sur Render)
-resources = [
-    "punkt",
-    "punkt_tab",
-    "wordnet",
-    "omw-1.4",
-    "stopwords",
-]
-for r in resources:
-    try:
-        nltk.data.find(r)
-    except LookupError:
-        nltk.download(r, download_dir=NLTK_PATH) 
+# Données NLTK vendorisées dans NLTK_PATH (étape `release` du Procfile :
+# `python -m app.nltk_resources`)
+configurer_chemin()
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -35,6 +19,7 @@ load_dotenv()
 # Instances globales
 db = SQLAlchemy()
 bcrypt = Bcrypt()
+hachage = HachageMotsDePasse()
 login_manager = LoginManager()
 
 
@@ -51,9 +36,26 @@ def create_app():
     # -----------------------------
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'cle_secrete_defaut')
 
-    # Base de données SQLite dans /instance/site.db
-    db_path = os.path.join(app.instance_path, 'site.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+    # Démarrage hors-ligne : on vérifie seulement le manifeste du bundle.
+    # NLTK_AUTO_DOWNLOAD=1 retrouve l'ancien comportement (téléchargement au boot).
+    # En production (APP_ENV), un bundle incomplet empêche le démarrage : sinon
+    # chaque worker tenterait le téléchargement à la première requête.
+    manquantes = verifier_manifest()
+    if manquantes:
+        if os.environ.get("NLTK_AUTO_DOWNLOAD") == "1":
+            prefetch()
+        elif os.environ.get("APP_ENV", "production") == "production":
+            raise RuntimeError(
+                f"Ressources NLTK manquantes dans {NLTK_PATH} : {', '.join(manquantes)}. "
+                "Lancer `python -m app.nltk_resources` avant le démarrage (étape release), "
+                "ou définir NLTK_AUTO_DOWNLOAD=1"
+            )
+        else:
+            print(f"⚠️  Ressources NLTK manquantes dans {NLTK_PATH} : {', '.join(manquantes)}")
+
+    # Base de données : SQLite dans /instance/site.db (profil DB_PROFILE)
+    # ou DATABASE_URL (Postgres)
+    configurer_base(app)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
     # S’assurer que /instance existe
@@ -66,6 +68,15 @@ def create_app():
     # INITIALISATION EXTENSIONS
     # -----------------------------
     db.init_app(app)
+    activer_pragmas(app, db)
+    proteger_fork(app, db)
+
+    # Métriques Prometheus (/metrics) : requêtes HTTP et SQL chronométrées
+    from app import metrics
+    metrics.installer(app, db)
+
+    # Coût bcrypt (BCRYPT_LOG_ROUNDS / APP_ENV) et pool de hachage
+    hachage.init_app(app)
     bcrypt.init_app(app)
 
     login_manager.init_app(app)
@@ -73,17 +84,82 @@ def create_app():
     login_manager.login_view = "main.login"
     login_manager.login_message_category = "info"
 
+    # État de conversation du chatbot (memory / sqlite)
+    from app.dialogue_state import creer_state_store
+    app.extensions["dialogue_state"] = creer_state_store()
+
+    # Écriture différée des échanges du chatbot (CHAT_WRITE_BEHIND=0 : commit à chaque requête)
+    if os.environ.get("CHAT_WRITE_BEHIND", "1") == "1":
+        from app.write_behind import WriteBehindBuffer
+        app.extensions["write_behind"] = WriteBehindBuffer(
+            app,
+            intervalle_ms=int(os.environ.get("CHAT_WRITE_BEHIND_MS", 200)),
+            max_echanges=int(os.environ.get("CHAT_WRITE_BEHIND_MAX", 200)),
+            max_en_attente=int(os.environ.get("CHAT_WRITE_BEHIND_MAX_ATTENTE", 10000)),
+            max_tentatives=int(os.environ.get("CHAT_WRITE_BEHIND_TENTATIVES", 8))
+        )
+
     # -----------------------------
     # IMPORTATION & ENREGISTREMENT DES BLUEPRINTS
     # -----------------------------
     from app.routes import main
     app.register_blueprint(main)
 
+    # -----------------------------
+    # COMMANDES CLI
+    # -----------------------------
+    from app.commands import register_commands
+    register_commands(app)
+
     # -----------------------------
     # CREATION DB SI NECESSAIRE
     # -----------------------------
     with app.app_context():
         db.create_all()
+
+        # Colonnes et index ajoutés aux modèles après la création des tables
+        from app.migrations import creer_colonnes_manquantes, creer_index_manquants
+        creer_colonnes_manquantes(db)
+        creer_index_manquants(db)
+
+    # -----------------------------
+    # RECHARGEMENT A CHAUD DU CORPUS
+    # -----------------------------
+    # CORPUS_WATCH=1 : chaque processus surveille corpus.json ; sinon le
+    # rechargement ne se fait que sur demande (/api/admin/corpus/reload).
+    from app import chatbot
+    from app.corpus_watcher import CorpusWatcher
+    watcher = CorpusWatcher(
+        chatbot.CORPUS_PATH,
+        chatbot.recharger_corpus,
+        intervalle=float(os.environ.get("CORPUS_WATCH_INTERVALLE", 5)),
+        surveiller=os.environ.get("CORPUS_WATCH", "1") == "1"
+    )
+    app.extensions["corpus_watcher"] = watcher.start() if watcher.surveiller else watcher
+
+    # -----------------------------
+    # FILE D'ENVOI SMS (mode async)
+    # -----------------------------
+    # Les workers tournent soit dans un processus dédié (`flask sms-worker`),
+    # soit dans chaque processus web avec SMS_QUEUE_EMBEDDED=1.
+    from app.twilio_service import twilio_service
+    if twilio_service.mode_async and os.environ.get("SMS_QUEUE_EMBEDDED") == "1":
+        app.extensions["sms_workers"] = twilio_service.demarrer_workers(app)
+
+    # -----------------------------
+    # SCHEDULER DES RAPPELS
+    # -----------------------------
+    # Processus dédié (`flask rappel-scheduler`) ou thread embarqué avec
+    # RAPPEL_SCHEDULER_EMBEDDED=1 (les réservations atomiques évitent les
+    # doubles envois si plusieurs workers l'activent).
+    if os.environ.get("RAPPEL_SCHEDULER_EMBEDDED") == "1":
+        from app.scheduler import RappelScheduler
+        app.extensions["rappel_scheduler"] = RappelScheduler(
+            app,
+            twilio_service,
+            batch=int(os.environ.get("RAPPEL_SCHEDULER_BATCH", 200)),
+            intervalle=float(os.environ.get("RAPPEL_SCHEDULER_INTERVALLE", 30))
+        ).start()
     
     
 
@@ -0,0 +1,113 @@
+"""
+Cache LRU borné, thread-safe, avec expiration (TTL) optionnelle
+et statistiques de hits/misses
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+_MANQUANT = object()
+
+
+class LRUCache:
+    """Cache LRU borné en nombre d'entrées"""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Args:
+            maxsize: Nombre maximum d'entrées (les plus anciennes sont évincées)
+            ttl: Durée de vie d'une entrée en secondes (None = pas d'expiration)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MANQUANT) is not _MANQUANT
+
+    def _expire(self, expire_at):
+        return expire_at is not None and time.monotonic() > expire_at
+
+    def get(self, key, default=None):
+        """Lire une entrée et la marquer comme récemment utilisée"""
+        with self._lock:
+            entree = self._data.get(key, _MANQUANT)
+            if entree is _MANQUANT:
+                self.misses += 1
+                return default
+
+            value, expire_at = entree
+            if self._expire(expire_at):
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Ajouter ou remplacer une entrée"""
+        if self.maxsize <= 0:
+            return
+        expire_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expire_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Retirer une entrée et renvoyer sa valeur"""
+        with self._lock:
+            entree = self._data.pop(key, _MANQUANT)
+            if entree is _MANQUANT:
+                return default
+            value, expire_at = entree
+            if self._expire(expire_at):
+                self.expirations += 1
+                return default
+            return value
+
+    def purger_expires(self):
+        """Supprimer toutes les entrées expirées"""
+        if not self.ttl:
+            return 0
+        maintenant = time.monotonic()
+        with self._lock:
+            expirees = [k for k, (_, expire_at) in self._data.items() if expire_at < maintenant]
+            for key in expirees:
+                del self._data[key]
+            self.expirations += len(expirees)
+        return len(expirees)
+
+    def clear(self):
+        """Vider le cache (les statistiques sont conservées)"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Statistiques d'utilisation du cache"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,349 @@
+"""
+Calendriers de vaccination et de grossesse
+
+Le calendrier vaccinal (app/data/calendrier_vaccinal.json) est lu une seule
+fois et gardé en tableaux compacts : noms des vaccins et âge de chaque dose
+en mois (int16). Les dates sont calculées en mois calendaires, et non plus
+en `mois * 30` jours : naissance le 31/01 + 1 mois = 28 (ou 29) février,
+naissance le 15/03 + 2 mois = 15 mai. Le calcul est vectorisé (numpy
+datetime64) : toutes les doses d'un enfant, ou la matrice enfants x doses
+d'un lot, en une seule passe.
+
+Les réponses du chatbot sont mémorisées par (calendrier, date) dans un LRU
+(CALENDRIER_CACHE_SIZE) : une même date de naissance n'est calculée et
+formatée qu'une fois par processus.
+
+generer_rappels_vaccination() crée en masse les rappels SMS (Rappel) des
+doses à venir pour une liste d'enfants (user_id, date de naissance).
+"""
+
+import json
+import os
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+from app.cache import LRUCache
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CALENDRIER_PATH = os.environ.get("CALENDRIER_PATH", os.path.join(BASE_DIR, "data", "calendrier_vaccinal.json"))
+
+FORMAT_SAISIE = "%d/%m/%Y"
+FORMAT_AFFICHAGE = "%d %B %Y"
+MESSAGE_DATE_INVALIDE = "La date n'est pas valide ❗ Utilise le format JJ/MM/AAAA."
+
+# Rappels SMS de vaccination : veille de la dose, à 9 h (UTC, comme les
+# dates comparées par le scheduler ; heure locale au Burkina Faso)
+AVANCE_RAPPEL_JOURS = int(os.environ.get("VACCINATION_RAPPEL_AVANCE_J", 1))
+HEURE_RAPPEL = int(os.environ.get("VACCINATION_RAPPEL_HEURE", 9))
+PREFIXE_TITRE = "Vaccination : "
+TAILLE_LOT = 500
+
+calendrier_cache = LRUCache(maxsize=int(os.environ.get("CALENDRIER_CACHE_SIZE", 5000)))
+
+
+def lire_date(texte):
+    """
+    Date saisie par l'utilisateur (JJ/MM/AAAA)
+
+    Returns:
+        date, ou None si le texte n'est pas une date valide
+    """
+    if isinstance(texte, datetime):
+        return texte.date()
+    if isinstance(texte, date):
+        return texte
+    try:
+        return datetime.strptime(texte.strip(), FORMAT_SAISIE).date()
+    except (AttributeError, ValueError):
+        return None
+
+
+def ajouter_mois(jours, mois):
+    """
+    Ajouter des mois calendaires à des dates (numpy, avec diffusion)
+
+    Le jour est conservé, ou ramené au dernier jour du mois cible quand
+    celui-ci est plus court (31/01 + 1 mois = 28/02 ou 29/02).
+
+    Args:
+        jours: Dates, tableau datetime64[D]
+        mois: Nombre de mois à ajouter, tableau d'entiers
+
+    Returns:
+        np.ndarray: datetime64[D], de la forme diffusée de (jours, mois)
+    """
+    debut_mois = jours.astype("datetime64[M]")
+    jour = (jours - debut_mois.astype("datetime64[D]")).astype(np.int64)
+    cible = debut_mois + mois
+    premier = cible.astype("datetime64[D]")
+    longueur = ((cible + 1).astype("datetime64[D]") - premier).astype(np.int64)
+    return premier + np.minimum(jour, longueur - 1)
+
+
+class CalendrierVaccinal:
+    """Doses d'un calendrier vaccinal, en tableaux compacts"""
+
+    def __init__(self, nom, vaccins, mois, source=None):
+        """
+        Args:
+            nom: Nom du calendrier (clé du cache)
+            vaccins: Noms des vaccins, dans l'ordre du calendrier
+            mois: Âge de chaque dose en mois
+            source: Référence du calendrier officiel
+        """
+        self.nom = nom
+        self.vaccins = tuple(vaccins)
+        self.mois = np.asarray(mois, dtype=np.int16)
+        self.source = source
+
+    def __len__(self):
+        return len(self.vaccins)
+
+    def dates_lot(self, naissances):
+        """
+        Dates des doses pour plusieurs enfants, en une passe
+
+        Args:
+            naissances: Dates de naissance (liste de date ou tableau datetime64)
+
+        Returns:
+            np.ndarray: datetime64[D] de forme (enfants, doses)
+        """
+        naissances = np.asarray(naissances, dtype="datetime64[D]").reshape(-1, 1)
+        return ajouter_mois(naissances, self.mois[np.newaxis, :])
+
+    def dates(self, naissance):
+        """
+        Dates des doses pour un enfant (mémorisées par date de naissance)
+
+        Returns:
+            tuple: date de chaque dose, dans l'ordre de self.vaccins
+        """
+        cle = (self.nom, "dates", naissance)
+        resultat = calendrier_cache.get(cle)
+        if resultat is None:
+            resultat = tuple(self.dates_lot([naissance])[0].astype(object))
+            calendrier_cache.set(cle, resultat)
+        return resultat
+
+    def texte(self, naissance):
+        """Réponse du chatbot pour une date de naissance (mémorisée)"""
+        cle = (self.nom, "texte", naissance)
+        reponse = calendrier_cache.get(cle)
+        if reponse is None:
+            # Une même date revient plusieurs fois (doses groupées) : formatée une fois
+            formatees = {}
+            lignes = ["💉 **Calendrier de vaccination pour votre enfant :**\n\n"]
+            for vaccin, jour in zip(self.vaccins, self.dates(naissance)):
+                if jour not in formatees:
+                    formatees[jour] = jour.strftime(FORMAT_AFFICHAGE)
+                lignes.append(f"• {vaccin} : {formatees[jour]}\n")
+            reponse = "".join(lignes)
+            calendrier_cache.set(cle, reponse)
+        return reponse
+
+
+def charger_calendriers(chemin=CALENDRIER_PATH):
+    """
+    Lire le fichier des calendriers
+
+    Returns:
+        tuple: (CalendrierVaccinal, durée de grossesse en jours)
+    """
+    with open(chemin, encoding="utf-8") as file:
+        donnees = json.load(file)
+    vaccination = donnees["vaccination"]
+    doses = vaccination["doses"]
+    calendrier = CalendrierVaccinal(
+        vaccination.get("nom", "vaccination"),
+        [dose["vaccin"] for dose in doses],
+        [dose["mois"] for dose in doses],
+        source=vaccination.get("source"),
+    )
+    return calendrier, int(donnees["grossesse"]["duree_jours"])
+
+
+vaccination, DUREE_GROSSESSE_JOURS = charger_calendriers()
+
+
+# ============================================================
+# RÉPONSES DU CHATBOT
+# ============================================================
+
+def texte_vaccination(saisie):
+    """Calendrier de vaccination pour une date de naissance saisie (JJ/MM/AAAA)"""
+    naissance = lire_date(saisie)
+    if naissance is None:
+        return MESSAGE_DATE_INVALIDE
+    return vaccination.texte(naissance)
+
+
+def texte_grossesse(saisie, aujourd_hui=None):
+    """
+    Calendrier de grossesse pour une date prévue d'accouchement saisie (JJ/MM/AAAA)
+
+    Args:
+        saisie: Date prévue d'accouchement
+        aujourd_hui: Date de référence (défaut : aujourd'hui)
+    """
+    terme = lire_date(saisie)
+    if terme is None:
+        return MESSAGE_DATE_INVALIDE
+    aujourd_hui = aujourd_hui or date.today()
+
+    # Dépend aussi du jour courant : clé (terme, aujourd'hui)
+    cle = ("grossesse", terme, aujourd_hui)
+    reponse = calendrier_cache.get(cle)
+    if reponse is None:
+        conception = date.fromordinal(terme.toordinal() - DUREE_GROSSESSE_JOURS)
+        semaines = (aujourd_hui - conception).days // 7
+        restantes = (terme - aujourd_hui).days // 7
+        reponse = (
+            f"🤰 **Calendrier de votre grossesse :**\n\n"
+            f"📅 **Date prévue d'accouchement :** {terme.strftime(FORMAT_AFFICHAGE)}\n"
+            f"🌱 **Date probable de conception :** {conception.strftime(FORMAT_AFFICHAGE)}\n"
+            f"👶 **Âge actuel de grossesse :** {semaines} semaines\n"
+            f"⏳ **Semaines restantes :** {restantes} semaines\n\n"
+            f"Souhaitez-vous un calendrier détaillé mois par mois ? 😊"
+        )
+        calendrier_cache.set(cle, reponse)
+    return reponse
+
+
+# ============================================================
+# RAPPELS SMS EN MASSE
+# ============================================================
+
+def _telephones(user_ids):
+    from sqlalchemy import select
+    from app import db
+    from app.models import User
+
+    telephones = {}
+    ids = list(user_ids)
+    for i in range(0, len(ids), TAILLE_LOT):
+        telephones.update(db.session.execute(
+            select(User.id, User.phone_number).where(User.id.in_(ids[i:i + TAILLE_LOT]))
+        ).all())
+    return telephones
+
+
+def _rappels_existants(user_ids):
+    from sqlalchemy import select
+    from app import db
+    from app.models import Rappel
+
+    existants = set()
+    ids = list(user_ids)
+    for i in range(0, len(ids), TAILLE_LOT):
+        existants.update(db.session.execute(
+            select(Rappel.user_id, Rappel.titre, Rappel.date_rappel).where(
+                Rappel.user_id.in_(ids[i:i + TAILLE_LOT]),
+                Rappel.titre.startswith(PREFIXE_TITRE),
+            )
+        ).all())
+    return existants
+
+
+def generer_rappels_vaccination(enfants, calendrier=None, avance_jours=AVANCE_RAPPEL_JOURS,
+                                heure=HEURE_RAPPEL, inclure_passes=False, taille_lot=TAILLE_LOT,
+                                maintenant=None):
+    """
+    Créer les rappels SMS des prochaines doses pour une liste d'enfants
+
+    Les dates de tous les enfants sont calculées en une passe (matrice
+    enfants x doses), puis les rappels insérés par lots (un INSERT multi-
+    lignes et un commit par lot). Les rappels déjà présents (même
+    utilisateur, vaccin et date) ne sont pas recréés : la commande peut être
+    relancée sans doublons. Les doublons à l'intérieur de la liste (même
+    enfant deux fois) ne produisent qu'un rappel.
+
+    Args:
+        enfants: Itérable de (user_id, date de naissance) ; date ou texte JJ/MM/AAAA
+        calendrier: CalendrierVaccinal (défaut : calendrier du fichier de données)
+        avance_jours: Jours entre le rappel et la dose
+        heure: Heure d'envoi du rappel
+        inclure_passes: Créer aussi les rappels dont la date est passée
+        taille_lot: Rappels insérés par commit
+        maintenant: Date de référence (défaut : datetime.utcnow(), comme le scheduler)
+
+    Returns:
+        dict: {'enfants', 'dates_invalides', 'sans_telephone', 'crees', 'deja_presents',
+               'doublons', 'passes', 'lots', 'duree_s'}
+    """
+    from sqlalchemy import insert
+    from app import db
+    from app.models import Rappel
+
+    debut = time.perf_counter()
+    calendrier = calendrier or vaccination
+    maintenant = maintenant or datetime.utcnow()
+    resultat = {'enfants': 0, 'dates_invalides': 0, 'sans_telephone': 0, 'crees': 0,
+                'deja_presents': 0, 'doublons': 0, 'passes': 0, 'lots': 0}
+
+    valides = []
+    for user_id, naissance in enfants:
+        resultat['enfants'] += 1
+        naissance = lire_date(naissance)
+        if naissance is None:
+            resultat['dates_invalides'] += 1
+        else:
+            valides.append((int(user_id), naissance))
+
+    telephones = _telephones({user_id for user_id, _ in valides})
+    retenus = []
+    for user_id, naissance in valides:
+        if telephones.get(user_id):
+            retenus.append((user_id, naissance))
+        else:
+            resultat['sans_telephone'] += 1
+
+    if retenus:
+        # Dates d'envoi de toutes les doses de tous les enfants, en une passe
+        doses = calendrier.dates_lot([naissance for _, naissance in retenus])
+        envois = (doses - np.timedelta64(avance_jours, "D")).astype("datetime64[s]") + np.timedelta64(heure, "h")
+        retenir = envois >= np.datetime64(maintenant, "s")
+        if inclure_passes:
+            retenir[:] = True
+        else:
+            resultat['passes'] = int(retenir.size - retenir.sum())
+        enfants_idx, doses_idx = np.nonzero(retenir)
+
+        existants = _rappels_existants({retenus[i][0] for i in set(enfants_idx.tolist())})
+        lignes = []
+        vus = set()
+        for i, k, envoi, jour in zip(enfants_idx.tolist(), doses_idx.tolist(),
+                                     envois[enfants_idx, doses_idx].astype(object),
+                                     doses[enfants_idx, doses_idx].astype(object)):
+            user_id = retenus[i][0]
+            vaccin = calendrier.vaccins[k]
+            titre = f"{PREFIXE_TITRE}{vaccin}"
+            if (user_id, titre, envoi) in existants:
+                resultat['deja_presents'] += 1
+                continue
+            if (user_id, titre, envoi) in vus:
+                # Même enfant listé deux fois (ou jumeaux) : un seul rappel par envoi
+                resultat['doublons'] += 1
+                continue
+            vus.add((user_id, titre, envoi))
+            lignes.append({
+                'user_id': user_id,
+                'titre': titre,
+                'description': f"Dose prévue le {jour.strftime(FORMAT_SAISIE)} (calendrier vaccinal)",
+                'date_rappel': envoi,
+                'numero_telephone': telephones[user_id],
+                'message_sms': f"💉 Rappel : vaccin {vaccin} de votre enfant prévu le {jour.strftime(FORMAT_SAISIE)}.",
+            })
+
+        for i in range(0, len(lignes), taille_lot):
+            db.session.execute(insert(Rappel), lignes[i:i + taille_lot])
+            db.session.commit()
+            resultat['lots'] += 1
+        resultat['crees'] = len(lignes)
+
+    resultat['duree_s'] = round(time.perf_counter() - debut, 3)
+    return resultat
+
@@ -1,161 +1,427 @@
-import json
+import itertools
 import random
 import os
+import threading
+import time
 import nltk
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime
 from nltk.stem import WordNetLemmatizer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from app import calendrier, metrics
+from app.cache import LRUCache
+from app.micro_batch import MicroBatcher
+from app.intent_index import obtenir_index, lire_corpus
+from app.semantic_matcher import SEUIL_SEMANTIQUE, creer_moteur
+from app.dialogue_state import (
+    MemoryStateStore,
+    ETAT_ATTENTE_DATE_GROSSESSE,
+    ETAT_ATTENTE_DATE_NAISSANCE,
+)
 
-# --- État global pour suivre si le bot attend des dates ---
-awaiting_due_date = False
-calendar_vaccination = False
+# --- État de conversation par utilisateur (store par défaut, un seul processus) ---
+default_state_store = MemoryStateStore()
 
 # Initialisation du lemmatiseur
 lemmatizer = WordNetLemmatizer()
 
-# --- CHARGEMENT DU CORPUS ---
+# --- CACHES (tailles configurables par variables d'environnement) ---
+# lemme par token, texte normalisé par message, décision (tag, score) par message
+lemma_cache = LRUCache(maxsize=int(os.environ.get("CHATBOT_CACHE_LEMMES", 20000)))
+preprocess_cache = LRUCache(maxsize=int(os.environ.get("CHATBOT_CACHE_TEXTES", 10000)))
+decision_cache = LRUCache(maxsize=int(os.environ.get("CHATBOT_CACHE_DECISIONS", 10000)))
+
+def cache_stats():
+    """Statistiques des caches du chatbot (pour dimensionner les tailles)"""
+    return {
+        'lemmes': lemma_cache.stats(),
+        'textes': preprocess_cache.stats(),
+        'decisions': decision_cache.stats(),
+        'micro_batch': micro_batcher.stats() if micro_batcher is not None else None,
+        'calendrier': calendrier.calendrier_cache.stats(),
+    }
+
+# --- FONCTION DE PRETRAITEMENT ---
+def lemmatize(token):
+    lemma = lemma_cache.get(token)
+    if lemma is None:
+        lemma = lemmatizer.lemmatize(token)
+        lemma_cache.set(token, lemma)
+    return lemma
+
+def preprocess_text(text):
+    key = text.lower()
+    processed = preprocess_cache.get(key)
+    if processed is None:
+        tokens = nltk.word_tokenize(key)
+        processed = " ".join(lemmatize(token) for token in tokens)
+        preprocess_cache.set(key, processed)
+    return processed
+
+# --- CHARGEMENT DE L'INDEX PRECOMPILE ---
+# L'index (vocabulaire, IDF, matrice TF-IDF) est compilé une seule fois par
+# version du corpus (`flask build-intent-index`) puis chargé en memory-map.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CORPUS_PATH = os.path.join(BASE_DIR, "corpus.json")
 
-with open(CORPUS_PATH, "r", encoding="utf-8") as file:
-    data = json.load(file)
+INTENT_ENGINE = os.environ.get("INTENT_ENGINE", "tfidf")
 
-# --- PRETRAITEMENT DU CORPUS ---
-patterns = []
-tags = []
-responses_dict = {}
 
-for intent in data.get("intents", []):
-    tag = intent.get("tag")
-    responses = intent.get("responses", [])
-    patterns_list = intent.get("patterns", [])
+class ModeleIntentions:
+    """
+    Version servie du modèle d'intentions : index TF-IDF, vectorizer et
+    moteur sémantique éventuel, remplacés d'un seul bloc
 
-    if not tag or not responses or not isinstance(patterns_list, list):
-        continue
+    Une requête lit `modele` une fois et garde cette référence : un
+    rechargement du corpus pendant son traitement ne la concerne pas.
+    """
 
-    responses_dict[tag] = responses
+    def __init__(self, index, version, moteur_semantique=None):
+        self.version = version
+        self.index = index
+        self.corpus_hash = index.corpus_hash
+        self.tags = index.tags
+        self.responses_dict = index.responses_dict
+        self.vectorizer = index.creer_vectorizer()
+        self.X = index.X
+        self.inverted_index = index.inverted
+        # INTENT_ENGINE=semantic : les messages sont d'abord classés par un
+        # encodeur de phrases ; sous SEUIL_SEMANTIQUE on garde le TF-IDF
+        self.moteur_semantique = moteur_semantique
+        self.installe_le = datetime.utcnow()
 
-    for pattern in patterns_list:
-        if isinstance(pattern, str) and pattern.strip():
-            patterns.append(pattern)
-            tags.append(tag)
+    def infos(self):
+        return {
+            'version': self.version,
+            'corpus_hash': self.corpus_hash,
+            'patterns': self.X.shape[0],
+            'termes': self.X.shape[1],
+            'intents': len(self.responses_dict),
+            'semantique': self.moteur_semantique is not None,
+            'installe_le': self.installe_le.isoformat(timespec='seconds'),
+        }
+
+
+modele = None
+_versions = itertools.count(1)
+_rechargement_lock = threading.Lock()
+
+
+def installer_index(index, moteur_semantique=None):
+    """
+    Servir un nouvel index (rechargement du corpus, benchmarks)
+
+    Le remplacement est une seule affectation : les requêtes en cours
+    finissent sur l'ancienne version. Les décisions en cache portent sur
+    l'ancien index : elles sont vidées.
+    """
+    global modele
+    modele = ModeleIntentions(index, next(_versions), moteur_semantique)
+    decision_cache.clear()
+    return modele
+
+
+def installer_moteur_semantique(moteur):
+    """Activer (ou désactiver avec None) le moteur sémantique sur l'index courant"""
+    return installer_index(modele.index, moteur)
+
+
+def construire_modele(corpus_path=CORPUS_PATH, precedent=None):
+    """
+    Index (chargé depuis le disque ou compilé) et moteur sémantique du corpus
+
+    Args:
+        precedent: Moteur sémantique servi ; son encodeur est réutilisé et
+            seuls les patterns nouveaux sont encodés
+
+    Returns:
+        tuple: (IntentIndex, moteur sémantique ou None)
+    """
+    index = obtenir_index(preprocess_text, corpus_path)
+    moteur = creer_moteur(*lire_corpus(corpus_path), precedent=precedent) if INTENT_ENGINE == "semantic" else None
+    return index, moteur
 
-# --- FONCTION DE PRETRAITEMENT ---
-def preprocess_text(text):
-    tokens = nltk.word_tokenize(text.lower())
-    lemmas = [lemmatizer.lemmatize(token) for token in tokens]
-    return " ".join(lemmas)
 
-# --- VECTORIZATION TF-IDF ---
-processed_patterns = [preprocess_text(p) for p in patterns]
+def recharger_corpus(corpus_path=CORPUS_PATH, force=False):
+    """
+    Recompiler le corpus s'il a changé et basculer sur la nouvelle version
 
-vectorizer = TfidfVectorizer()
-X = vectorizer.fit_transform(processed_patterns)
+    La compilation est incrémentale : les patterns inchangés sont relus
+    depuis le cache des textes (seuls les nouveaux passent par NLTK), et le
+    moteur sémantique garde son modèle chargé et les embeddings des
+    patterns inchangés (seuls les nouveaux sont encodés). Un corpus invalide lève une exception et la version
+    servie reste en place.
+
+    Returns:
+        dict: Infos du modèle servi, avec 'recharge' (bool)
+    """
+    with _rechargement_lock:
+        _, corpus_hash = lire_corpus(corpus_path)
+        if not force and modele is not None and modele.corpus_hash == corpus_hash:
+            return dict(modele.infos(), recharge=False)
+        precedent = modele.moteur_semantique if modele is not None else None
+        return dict(installer_index(*construire_modele(corpus_path, precedent)).infos(), recharge=True)
+
+
+installer_index(*construire_modele(CORPUS_PATH))
+
+# Score minimum pour considérer qu'un intent est reconnu
+SEUIL_CONFIANCE = 0.20
+# Intents qui demandent une date à l'utilisateur au tour suivant
+TAG_APPROXIMATION_GROSSESSE = "Savoir_approximation_grossesse"
+TAG_CALENDRIER_VACCINATION = "Approximation_calendrier_vaccination_jeune_enfant"
+
+DEFAULT_REPLY = "Je peux vous aider sur la grossesse 🤰, le bébé 👶, les visites prénatales, l’alimentation 🍎 ou la vaccination 💉. Que souhaitez-vous savoir ?"
 
 # ==================================================
-# 🔵 FONCTION: Génération du calendrier de grossesse
+# 🔵 FONCTIONS: Calendriers de grossesse et de vaccination
 # ==================================================
+# Calcul et mise en forme dans app/calendrier.py (calendrier chargé une
+# fois depuis app/data, réponses mémorisées par date)
 def generate_pregnancy_calendar(due_date_str):
-    try:
-        due = datetime.strptime(due_date_str, "%d/%m/%Y")
-    except ValueError:
-        return "La date n'est pas valide ❗ Utilise le format JJ/MM/AAAA."
-
-    today = datetime.today()
-    conception = due - timedelta(days=280)
-    weeks_pregnant = (today - conception).days // 7
-    weeks_remaining = (due - today).days // 7
-
-    return (
-        f"🤰 **Calendrier de votre grossesse :**\n\n"
-        f"📅 **Date prévue d'accouchement :** {due.strftime('%d %B %Y')}\n"
-        f"🌱 **Date probable de conception :** {conception.strftime('%d %B %Y')}\n"
-        f"👶 **Âge actuel de grossesse :** {weeks_pregnant} semaines\n"
-        f"⏳ **Semaines restantes :** {weeks_remaining} semaines\n\n"
-        f"Souhaitez-vous un calendrier détaillé mois par mois ? 😊"
-    )
+    return calendrier.texte_grossesse(due_date_str)
 
 def generate_vaccination_calendar(birth_date_str):
-    try:
-        birth_date = datetime.strptime(birth_date_str, "%d/%m/%Y")
-    except ValueError:
-        return "La date n'est pas valide ❗ Utilise le format JJ/MM/AAAA."
-    #source: https://fr.scribd.com/document/826040237/CALENDRIER-VACCINAL-0001  du Ministère de la Santé Burkinabé du 30 janvier 2025
-    vaccination_schedule = [
-        ("BCG", 0),
-        ("Hépatite B", 0),
-        ("VPO",0),
-        ("DTC-Hepatite-B Hib2", 2),
-        ("VPO 1",2),
-        ("Pneumo 1 PCV13",2),
-        ("Rota 1",2),
-        ("DTC-HepB-Hib 2",3),
-        ("VPO 2",3),
-        ("Rota 2",3),
-        ("DTC-HepB-Hib 3",4),
-        ("VPO 3",4),
-        ("Pneumo 2",4),
-        ("Rota 3",4),
-        ("VPI",4),
-        ("Vaccin anti paludique 1",5),
-        ("Vaccin anti paludique 2",6),
-        ("Vaccin anti paludique 3",7),
-        ("RR 1",9),
-        ("VAA",9),
-        ("VTC fievre typhoide",9),
-        ("VPI 2",9),
-        ("RR 2",15),
-        ("Men A MenAfricVac",15,),
-        ("Pneumo 3 PCV 13",23),
-        ("Vaccin anti-paludique 4",23),
-    ]
-
-    response = "💉 **Calendrier de vaccination pour votre enfant :**\n\n"
-    for vaccine, months in vaccination_schedule:
-        vaccination_date = birth_date + timedelta(days=months * 30)
-        response += f"• {vaccine} : {vaccination_date.strftime('%d %B %Y')}\n"
-
-    return response
+    return calendrier.texte_vaccination(birth_date_str)
 
 # ==================================================
 # 🔵 FONCTION PRINCIPALE
 # ==================================================
-def get_bot_response(user_input):
-    global calendar_vaccination
-    if calendar_vaccination:
-        calendar_vaccination = False
-        return generate_vaccination_calendar(user_input)
-    global awaiting_due_date
+def _resultat(reply, tag, score, debut):
+    if metrics.actif():
+        metrics.CHATBOT_ETAPE.observe(time.perf_counter() - debut, stage="total")
+    return {
+        'response': reply,
+        'tag': tag,
+        'score': score,
+        'latency_ms': round((time.perf_counter() - debut) * 1000, 3),
+    }
 
-    # Si le bot attend une date
-    if awaiting_due_date:
-        awaiting_due_date = False
-        return generate_pregnancy_calendar(user_input)
 
-    # Traitement normal TF-IDF
-    processed_input = preprocess_text(user_input)
-    input_vec = vectorizer.transform([processed_input])
+def get_bot_response(user_input, user_id=None, state_store=None):
+    """
+    Réponse du chatbot à un message
 
-    similarities = cosine_similarity(input_vec, X)
-    best_idx = similarities.argmax()
-    best_score = similarities[0, best_idx]
+    Args:
+        user_input: Message de l'utilisateur
+        user_id: ID de l'utilisateur (clé de l'état de conversation)
+        state_store: Store d'état de dialogue (par défaut : store en mémoire du module)
 
-    if best_score > 0.20:
-        tag = tags[best_idx]
+    Returns:
+        dict: {'response', 'tag', 'score', 'latency_ms'}
+              tag vaut None si aucun intent ne dépasse le seuil ; pour une
+              réponse de calendrier, tag est l'intent qui a demandé la date
+              et score vaut None (pas de classification)
+    """
+    debut = time.perf_counter()
+    m = modele
+    if state_store is None:
+        state_store = default_state_store
+
+    # Si le bot attend une date pour cet utilisateur
+    etat = state_store.pop(user_id)
+    if etat == ETAT_ATTENTE_DATE_NAISSANCE:
+        with metrics.span(metrics.CHATBOT_ETAPE, stage="calendrier"):
+            reply = generate_vaccination_calendar(user_input)
+        return _resultat(reply, TAG_CALENDRIER_VACCINATION, None, debut)
+    if etat == ETAT_ATTENTE_DATE_GROSSESSE:
+        with metrics.span(metrics.CHATBOT_ETAPE, stage="calendrier"):
+            reply = generate_pregnancy_calendar(user_input)
+        return _resultat(reply, TAG_APPROXIMATION_GROSSESSE, None, debut)
+
+    # Traitement normal : classification (regroupée en lot si activé)
+    tag, best_score = classer_message(user_input, m)
+
+    if tag is not None:
 
         # Si l'intent détecté est celui qui nécessite une date
-        if tag == "Savoir_approximation_grossesse":
-            awaiting_due_date = True
-            return random.choice(responses_dict[tag])
-        
-        if tag == "Approximation_calendrier_vaccination_jeune_enfant":
-            calendar_vaccination = True
-            return random.choice(responses_dict[tag])
+        if tag == TAG_APPROXIMATION_GROSSESSE:
+            state_store.set(user_id, ETAT_ATTENTE_DATE_GROSSESSE)
+        elif tag == TAG_CALENDRIER_VACCINATION:
+            state_store.set(user_id, ETAT_ATTENTE_DATE_NAISSANCE)
+
+        return _resultat(random.choice(m.responses_dict[tag]), tag, best_score, debut)
+
+    return _resultat(DEFAULT_REPLY, None, best_score, debut)
+
+
+# ==================================================
+# 🔵 FONCTION: Classification en lot
+# ==================================================
+def _classer_textes(processed, m):
+    """
+    Classer des textes déjà prétraités avec le modèle m
+
+    Un texte seul passe par l'index inversé : seuls les patterns partageant
+    un terme avec la requête sont scorés. Un lot est vectorisé en un seul
+    appel à `vectorizer.transform` puis multiplié par la matrice de postings
+    (termes x patterns) ; les lignes TF-IDF étant normalisées L2, le produit
+    scalaire est la similarité cosinus.
+
+    Returns:
+        list: [(tag ou None, score), ...]
+    """
+    input_vecs = m.vectorizer.transform(processed)
+
+    if input_vecs.shape[0] == 1:
+        top = m.inverted_index.top_k(input_vecs.indices, input_vecs.data, k=1)
+        if top and top[0][1] > SEUIL_CONFIANCE:
+            return [(top[0][0], top[0][1])]
+        return [(None, top[0][1] if top else 0.0)]
+
+    similarities = (input_vecs @ m.inverted_index.postings).tocsr()
+    best_idx = np.asarray(similarities.argmax(axis=1)).ravel()
+    best_scores = similarities.max(axis=1).toarray().ravel()
+
+    return [
+        (m.tags[idx] if score > SEUIL_CONFIANCE else None, float(score))
+        for idx, score in zip(best_idx, best_scores)
+    ]
+
+
+def top_intents(user_input, k=3):
+    """
+    Les k intents les plus proches d'un message, avec leur score
+
+    Returns:
+        list: [(tag, score), ...] triés par score décroissant
+    """
+    m = modele
+    input_vec = m.vectorizer.transform([preprocess_text(user_input)])
+    return [
+        (tag, score)
+        for tag, score, _ in m.inverted_index.top_k(input_vec.indices, input_vec.data, k=k)
+    ]
+
+
+def _cle_decision(m, message):
+    # La version du modèle fait partie de la clé : une décision calculée
+    # par une requête encore sur l'ancienne version ne sert pas à la nouvelle
+    return (m.version, message.strip().lower())
+
+
+def classer_messages(messages, m=None):
+    """
+    Décision (tag, score) pour chaque message, avec cache des décisions
+
+    Les messages identiques (à la casse et aux espaces près) ne sont
+    classés qu'une fois ; seuls les messages absents du cache passent
+    par le moteur sémantique (s'il est actif) puis, sous son seuil de
+    confiance, par le prétraitement et la vectorisation TF-IDF.
+
+    Args:
+        messages: Messages bruts
+        m: Modèle à utiliser (par défaut : le modèle servi)
+
+    Returns:
+        list: [(tag ou None, score), ...] dans l'ordre d'entrée
+    """
+    if m is None:
+        m = modele
+    decisions = [None] * len(messages)
+    a_classer = {}
+
+    for i, message in enumerate(messages):
+        key = _cle_decision(m, message)
+        decision = decision_cache.get(key)
+        if decision is None:
+            a_classer.setdefault(key, []).append(i)
+        else:
+            decisions[i] = decision
+
+    if a_classer:
+        nouvelles = {}
+        restantes = list(a_classer)
+
+        if m.moteur_semantique is not None:
+            with metrics.span(metrics.CHATBOT_ETAPE, stage="semantique"):
+                semantiques = m.moteur_semantique.classer([key[1] for key in restantes])
+            restantes = []
+            for key, (tag, score) in zip(a_classer, semantiques):
+                if score >= SEUIL_SEMANTIQUE:
+                    nouvelles[key] = (tag, score)
+                else:
+                    restantes.append(key)
+
+        if restantes:
+            with metrics.span(metrics.CHATBOT_ETAPE, stage="pretraitement"):
+                processed = [preprocess_text(key[1]) for key in restantes]
+            with metrics.span(metrics.CHATBOT_ETAPE, stage="classement"):
+                nouvelles.update(zip(restantes, _classer_textes(processed, m)))
+
+        for key, decision in nouvelles.items():
+            decision_cache.set(key, decision)
+            for i in a_classer[key]:
+                decisions[i] = decision
+
+    return decisions
+
+
+# --- MICRO-BATCHING (CHAT_MICRO_BATCH=1) ---
+# Les requêtes concurrentes d'un même processus (workers gthread) sont
+# classées ensemble : un seul transform + produit matriciel par lot.
+def _classer_lot(elements):
+    """Fonction de lot du micro-batching : [(modèle, message), ...]"""
+    par_modele = {}
+    for i, (m, message) in enumerate(elements):
+        par_modele.setdefault(m, []).append(i)
+
+    decisions = [None] * len(elements)
+    for m, indices in par_modele.items():
+        for i, decision in zip(indices, classer_messages([elements[i][1] for i in indices], m)):
+            decisions[i] = decision
+    return decisions
+
+
+micro_batcher = None
+if os.environ.get("CHAT_MICRO_BATCH") == "1":
+    micro_batcher = MicroBatcher(
+        _classer_lot,
+        max_attente_ms=float(os.environ.get("CHAT_MICRO_BATCH_MS", 5)),
+        max_lot=int(os.environ.get("CHAT_MICRO_BATCH_MAX", 64)),
+        nom="chatbot-micro-batch"
+    )
+
+
+def classer_message(message, m=None):
+    """
+    Décision (tag, score) pour un message
+
+    Avec le micro-batching, un message absent du cache attend (au plus
+    CHAT_MICRO_BATCH_MS) d'être classé avec les autres requêtes en cours.
+    """
+    if m is None:
+        m = modele
+    if micro_batcher is None:
+        return classer_messages([message], m)[0]
+
+    decision = decision_cache.get(_cle_decision(m, message))
+    if decision is not None:
+        return decision
+    return micro_batcher.executer((m, message))
+
+
+def get_bot_responses(messages):
+    """
+    Classer une liste de messages en une seule passe
+
+    L'état de conversation n'est ni lu ni modifié : ce chemin sert au
+    rejeu et à l'analyse.
 
+    Returns:
+        list: [{'message', 'tag', 'score', 'response'}, ...] dans l'ordre d'entrée
+    """
+    if not messages:
+        return []
 
-        # Sinon réponse normale
-        return random.choice(responses_dict[tag])
-        
+    m = modele
+    results = []
+    for message, (tag, score) in zip(messages, classer_messages(messages, m)):
+        reply = random.choice(m.responses_dict[tag]) if tag is not None else DEFAULT_REPLY
+        results.append({
+            'message': message,
+            'tag': tag,
+            'score': score,
+            'response': reply
+        })
 
-    return "Je peux vous aider sur la grossesse 🤰, le bébé 👶, les visites prénatales, l’alimentation 🍎 ou la vaccination 💉. Que souhaitez-vous savoir ?"
+    return results
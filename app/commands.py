@@ -0,0 +1,262 @@
+"""
+Commandes CLI Flask (`flask --app cours <commande>`)
+"""
+
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command("build-intent-index")
+@click.option("--force", is_flag=True, help="Recompiler même si l'index existe déjà.")
+@click.option("--clean", is_flag=True, help="Supprimer les index des anciennes versions du corpus.")
+def build_intent_index(force, clean):
+    """Compiler corpus.json en index d'intentions versionné"""
+    from app.chatbot import preprocess_text
+    from app.intent_index import construire_index, nettoyer_index
+
+    debut = time.perf_counter()
+    index, dossier = construire_index(preprocess_text, force=force)
+    duree = time.perf_counter() - debut
+
+    click.echo(f"✅ {index} -> {dossier} ({duree:.2f}s)")
+
+    if clean:
+        for nom in nettoyer_index(index.corpus_hash):
+            click.echo(f"🗑️  Ancien index supprimé : {nom}")
+
+
+@click.command("build-semantic-index")
+@click.option("--model-dir", default=None, help="Dossier local du modèle (par défaut SEMANTIC_MODEL_DIR).")
+def build_semantic_index(model_dir):
+    """Calculer et mettre en cache les embeddings des patterns (INTENT_ENGINE=semantic)"""
+    from app.intent_index import lire_corpus, extraire_patterns
+    from app.semantic_matcher import MODEL_DIR, SemanticMatcher
+
+    data, corpus_hash = lire_corpus()
+    patterns, tags, _ = extraire_patterns(data)
+    moteur = SemanticMatcher(model_dir or MODEL_DIR)
+    try:
+        moteur.charger()
+    except (ImportError, OSError) as e:
+        raise click.ClickException(str(e))
+
+    debut = time.perf_counter()
+    depuis_cache = moteur.indexer(patterns, tags, corpus_hash)
+    duree = time.perf_counter() - debut
+    origine = "cache" if depuis_cache else "calculés"
+    click.echo(f"✅ {len(patterns)} embeddings {origine} ({duree:.2f}s)")
+
+
+@click.command("nltk-prefetch")
+def nltk_prefetch():
+    """Télécharger les ressources NLTK dans le bundle local (avec manifeste)"""
+    from app.nltk_resources import NLTK_PATH, prefetch, rechauffer
+
+    manifest = prefetch()
+    click.echo(f"✅ {len(manifest['ressources'])} ressources NLTK dans {NLTK_PATH}")
+    click.echo(f"⏱️  Warm-up : {rechauffer()}")
+
+
+@click.command("sms-worker")
+@click.option("--workers", default=2, show_default=True, help="Nombre de threads d'envoi.")
+@with_appcontext
+def sms_worker(workers):
+    """Vider la file d'envoi SMS en continu (Ctrl+C pour arrêter)"""
+    from app.twilio_service import twilio_service
+
+    if twilio_service.provider is None:
+        raise click.ClickException("Aucun provider SMS configuré (Twilio ou SMS_PROVIDER=fake)")
+
+    pool = twilio_service.demarrer_workers(current_app._get_current_object(), workers)
+    click.echo(f"📨 {workers} workers SMS démarrés")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+@click.command("rappel-scheduler")
+@click.option("--once", is_flag=True, help="Envoyer les rappels dus puis quitter.")
+@click.option("--batch", default=200, show_default=True, help="Rappels réservés par lot.")
+@click.option("--intervalle", default=30.0, show_default=True, help="Secondes entre deux passages.")
+@with_appcontext
+def rappel_scheduler(once, batch, intervalle):
+    """Envoyer les rappels arrivés à échéance"""
+    from app.scheduler import RappelScheduler
+    from app.twilio_service import twilio_service
+
+    scheduler = RappelScheduler(current_app._get_current_object(), twilio_service, batch=batch, intervalle=intervalle)
+    if once:
+        traites = scheduler.executer()
+        click.echo(f"⏰ {traites} rappels traités {scheduler.stats()}")
+        return
+
+    scheduler.start()
+    click.echo(f"⏰ Scheduler des rappels démarré (toutes les {intervalle}s)")
+    try:
+        while True:
+            time.sleep(60)
+            click.echo(f"⏰ {scheduler.stats()}")
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+
+@click.command("purge-otp")
+@click.option("--batch", default=1000, show_default=True, help="OTP supprimés par commit.")
+@with_appcontext
+def purge_otp(batch):
+    """Supprimer les OTP expirés depuis plus de OTP_RETENTION_H heures"""
+    from app.twilio_service import twilio_service
+
+    debut = time.perf_counter()
+    supprimes = twilio_service.purger_otp(taille_lot=batch)
+    if supprimes is None:
+        raise click.ClickException("Rétention déjà en cours dans un autre processus (table verrou_tache)")
+    click.echo(f"🗑️  {supprimes} OTP supprimés ({time.perf_counter() - debut:.2f}s)")
+
+
+@click.command("retention")
+@click.option("--dry-run", is_flag=True, help="Afficher ce qui serait supprimé ou archivé, sans rien modifier.")
+@click.option("--table", "tables", multiple=True, help="Limiter à une politique (otp, notification, message, historique).")
+@click.option("--batch", default=500, show_default=True, help="Lignes par transaction.")
+@click.option("--no-vacuum", is_flag=True, help="Ne pas lancer PRAGMA incremental_vacuum.")
+@click.option("--activer-auto-vacuum", is_flag=True, help="Passer la base en auto_vacuum=INCREMENTAL (VACUUM complet).")
+@with_appcontext
+def retention_command(dry_run, tables, batch, no_vacuum, activer_auto_vacuum):
+    """Purger et archiver les lignes anciennes selon les politiques de rétention"""
+    from app import retention
+
+    inconnues = set(tables) - set(retention.politiques())
+    if inconnues:
+        raise click.BadParameter(f"Politique inconnue : {', '.join(sorted(inconnues))}", param_hint="--table")
+
+    if activer_auto_vacuum:
+        if not retention.activer_auto_vacuum():
+            raise click.ClickException("auto_vacuum non modifié (base non SQLite ?)")
+        click.echo("✅ auto_vacuum=INCREMENTAL")
+
+    if dry_run:
+        rapport = retention.rapport_dry_run(tables or None)
+        for table in rapport['tables']:
+            click.echo(
+                f"🔎 {table['table']:<13} {table['action']:<10} {table['lignes']:>8} / {table['total']} lignes "
+                f"avant {table['limite']} (plus ancienne : {table['plus_ancienne'] or '-'})"
+            )
+        if 'base' in rapport:
+            base = rapport['base']
+            click.echo(
+                f"💾 {base['pages']} pages de {base['page_size']} o, {base['pages_libres']} libres, "
+                f"auto_vacuum={base['auto_vacuum']}"
+            )
+        return
+
+    rapport = retention.executer(tables or None, taille_lot=batch, vacuum=not no_vacuum)
+    if not rapport['verrou']:
+        raise click.ClickException("Rétention déjà en cours dans un autre processus (table verrou_tache)")
+    for table in rapport['tables']:
+        archives = f", archives : {', '.join(table['fichiers'])}" if table['fichiers'] else ""
+        click.echo(f"🗑️  {table['table']:<13} {table['supprimees']} lignes en {table['lots']} lots ({table['duree_s']}s){archives}")
+    if 'vacuum' in rapport:
+        vacuum = rapport['vacuum']
+        click.echo(f"💾 incremental_vacuum ({vacuum['mode']}) : {vacuum['pages_liberees']} pages rendues")
+
+
+@click.command("vaccination-rappels")
+@click.argument("fichier", type=click.File(encoding="utf-8"))
+@click.option("--avance", default=None, type=int, help="Jours entre le rappel et la dose (défaut VACCINATION_RAPPEL_AVANCE_J).")
+@click.option("--inclure-passes", is_flag=True, help="Créer aussi les rappels des doses déjà passées.")
+@click.option("--batch", default=500, show_default=True, help="Rappels insérés par commit.")
+@with_appcontext
+def vaccination_rappels(fichier, avance, inclure_passes, batch):
+    """Créer les rappels SMS de vaccination des enfants d'un CSV (user_id,date_naissance JJ/MM/AAAA)"""
+    import csv
+
+    from app import calendrier
+
+    enfants = [
+        (ligne[0], ligne[1]) for ligne in csv.reader(fichier)
+        if len(ligne) >= 2 and ligne[0].strip().isdigit()
+    ]
+    resultat = calendrier.generer_rappels_vaccination(
+        enfants,
+        avance_jours=calendrier.AVANCE_RAPPEL_JOURS if avance is None else avance,
+        inclure_passes=inclure_passes,
+        taille_lot=batch,
+    )
+    click.echo(
+        f"💉 {resultat['crees']} rappels créés pour {resultat['enfants']} enfants en {resultat['lots']} lots "
+        f"({resultat['duree_s']}s) — déjà présents : {resultat['deja_presents']}, doublons : {resultat['doublons']}, "
+        f"doses passées : {resultat['passes']}, "
+        f"sans téléphone : {resultat['sans_telephone']}, dates invalides : {resultat['dates_invalides']}"
+    )
+
+
+@click.command("db-upgrade")
+@with_appcontext
+def db_upgrade():
+    """Créer les tables, colonnes et index manquants dans la base existante"""
+    from app import db
+    from app.migrations import creer_colonnes_manquantes, creer_index_manquants
+
+    db.create_all()
+    colonnes = creer_colonnes_manquantes(db)
+    for nom in colonnes:
+        click.echo(f"🧱 Colonne ajoutée : {nom}")
+    crees = creer_index_manquants(db)
+    for nom in crees:
+        click.echo(f"🧱 Index créé : {nom}")
+    click.echo(f"✅ Schéma à jour ({len(colonnes)} colonnes ajoutées, {len(crees)} index créés)")
+
+
+@click.command("db-audit")
+@with_appcontext
+def db_audit():
+    """Vérifier via EXPLAIN QUERY PLAN que chaque requête chaude utilise un index"""
+    from app import db
+    from app.migrations import auditer_plans
+
+    echecs = 0
+    for resultat in auditer_plans(db):
+        marque = "✅" if resultat['utilise_index'] else "❌"
+        click.echo(f"{marque} {resultat['requete']} : {' | '.join(resultat['plan'])}")
+        if not resultat['utilise_index']:
+            echecs += 1
+
+    if echecs:
+        raise click.ClickException(f"{echecs} requête(s) sans index")
+
+
+@click.command("memory-report")
+@click.argument("pid", type=int)
+def memory_report(pid):
+    """Mémoire (RSS / PSS / USS) d'un master gunicorn et de ses workers"""
+    from app.memoire import rapport
+
+    resultat = rapport(pid)
+    if resultat['master'] is None:
+        raise click.ClickException(f"Processus {pid} introuvable")
+
+    click.echo(f"{'pid':>8} {'RSS MB':>9} {'PSS MB':>9} {'USS MB':>9}")
+    for nom, p in [("master", resultat['master'])] + [("worker", w) for w in resultat['workers']]:
+        click.echo(f"{p['pid']:>8} {p['rss_kb'] / 1024:>9.1f} {p['pss_kb'] / 1024:>9.1f} {p['uss_kb'] / 1024:>9.1f}  {nom}")
+    total = resultat['total']
+    click.echo(f"{'total':>8} {total['rss_kb'] / 1024:>9.1f} {total['pss_kb'] / 1024:>9.1f} {total['uss_kb'] / 1024:>9.1f}")
+
+
+def register_commands(app):
+    """Enregistrer les commandes CLI sur l'application"""
+    app.cli.add_command(build_intent_index)
+    app.cli.add_command(build_semantic_index)
+    app.cli.add_command(nltk_prefetch)
+    app.cli.add_command(sms_worker)
+    app.cli.add_command(rappel_scheduler)
+    app.cli.add_command(purge_otp)
+    app.cli.add_command(retention_command)
+    app.cli.add_command(vaccination_rappels)
+    app.cli.add_command(db_upgrade)
+    app.cli.add_command(db_audit)
+    app.cli.add_command(memory_report)
@@ -0,0 +1,150 @@
+"""
+Rechargement à chaud de corpus.json
+
+Un thread par processus surveille la date de modification du corpus
+(CORPUS_WATCH=1) et reconstruit le modèle d'intentions en arrière-plan
+quand il change ; les requêtes continuent d'être servies par l'ancienne
+version jusqu'à la bascule. Chaque worker gunicorn a son propre thread :
+écrire le fichier suffit à recharger tous les workers, l'index compilé
+par le premier est relu depuis le disque par les autres.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+class CorpusWatcher:
+    """Surveillance du corpus et rechargement en arrière-plan"""
+
+    def __init__(self, chemin, recharger, intervalle=5.0, surveiller=True):
+        """
+        Args:
+            chemin: Fichier corpus.json
+            recharger: Fonction (chemin, force) -> infos du modèle servi
+            intervalle: Délai entre deux vérifications (secondes)
+            surveiller: False : ne recharger que sur demande (demander_rechargement)
+        """
+        self.chemin = chemin
+        self.recharger = recharger
+        self.intervalle = intervalle
+        self.surveiller = surveiller
+        self._signature = self._lire_signature()
+        self._demande = threading.Event()
+        self._force = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.rechargements = 0
+        self.erreurs = 0
+        self.derniere_erreur = None
+        self.dernier_rechargement = None
+        self.derniere_duree_s = None
+        os.register_at_fork(after_in_child=self._apres_fork)
+
+    def _apres_fork(self):
+        # gunicorn --preload : le thread du master n'existe pas dans le worker
+        self._lock = threading.Lock()
+        if self._thread is not None and self.surveiller:
+            self._thread = None
+            self.start()
+
+    def _lire_signature(self):
+        try:
+            stat = os.stat(self.chemin)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def start(self):
+        """Démarrer le thread (relancé automatiquement après un fork)"""
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._boucle, name="corpus-watcher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._demande.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(5)
+
+    def demander_rechargement(self, force=False):
+        """Recharger en arrière-plan dès que possible (sans attendre la fin)"""
+        self._force = self._force or force
+        self.start()
+        self._demande.set()
+
+    def _boucle(self):
+        while not self._stop.is_set():
+            self._demande.wait(self.intervalle if self.surveiller else None)
+            if self._stop.is_set():
+                break
+            demande = self._demande.is_set()
+            self._demande.clear()
+
+            signature = self._lire_signature()
+            if not demande and signature == self._signature:
+                continue
+
+            force, self._force = self._force, False
+            self._signature = signature
+            self._executer(force)
+
+    def _executer(self, force):
+        debut = time.perf_counter()
+        try:
+            infos = self.recharger(self.chemin, force)
+        except Exception as e:
+            # Corpus invalide : la version servie reste en place
+            self.erreurs += 1
+            self.derniere_erreur = f"{datetime.utcnow().isoformat(timespec='seconds')} {e}"
+            print("Erreur rechargement du corpus :", e)
+            return
+        self.derniere_duree_s = round(time.perf_counter() - debut, 3)
+        if infos.get('recharge'):
+            self.rechargements += 1
+            self.dernier_rechargement = datetime.utcnow().isoformat(timespec='seconds')
+            print(f"🔄 Corpus rechargé : version {infos['version']} ({self.derniere_duree_s}s)")
+
+    def stats(self):
+        return {
+            'surveillance': self.surveiller,
+            'intervalle_s': self.intervalle,
+            'actif': self._thread is not None and self._thread.is_alive() and self._pid == os.getpid(),
+            'rechargements': self.rechargements,
+            'dernier_rechargement': self.dernier_rechargement,
+            'derniere_duree_s': self.derniere_duree_s,
+            'erreurs': self.erreurs,
+            'derniere_erreur': self.derniere_erreur,
+        }
+
+
+def ecrire_corpus(data, chemin):
+    """
+    Remplacer le corpus de façon atomique après validation
+
+    Raises:
+        ValueError: Corpus sans aucun pattern exploitable
+    """
+    from app.intent_index import extraire_patterns
+
+    if not isinstance(data, dict):
+        raise ValueError("Le corpus doit être un objet JSON {'intents': [...]}")
+    patterns, _, _ = extraire_patterns(data)
+    if not patterns:
+        raise ValueError("Le corpus ne contient aucun pattern")
+
+    fd, temporaire = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=4)
+    if os.path.exists(chemin):
+        os.chmod(temporaire, os.stat(chemin).st_mode & 0o777)
+    os.replace(temporaire, chemin)
@@ -0,0 +1,92 @@
+"""
+Profil de base de données :
+- SQLite (par défaut) : WAL, synchronous=NORMAL, busy timeout, mmap et
+  cache appliqués à chaque connexion du pool
+- Postgres (ou autre) via la variable DATABASE_URL
+"""
+
+import os
+
+from sqlalchemy import event
+
+
+# Profils SQLite : pragmas appliqués à chaque nouvelle connexion
+PROFILS_SQLITE = {
+    # Comportement SQLite par défaut (journal rollback, fsync à chaque commit)
+    'default': {},
+    # Lecteurs et écrivain en parallèle, un fsync par checkpoint au lieu d'un par commit
+    'production': {
+        # Sans effet sur une base existante (voir retention.activer_auto_vacuum)
+        'auto_vacuum': 'INCREMENTAL',
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 20000)),  # négatif = en KiB
+    },
+}
+
+
+def configurer_base(app):
+    """
+    Renseigner SQLALCHEMY_DATABASE_URI et les options du moteur
+
+    DATABASE_URL (ex. postgresql://...) remplace la base SQLite de /instance.
+    DB_PROFILE choisit le profil SQLite ('production' par défaut).
+    """
+    url = os.environ.get('DATABASE_URL')
+    if url and url.startswith('postgres://'):
+        # Heroku/Render fournissent encore l'ancien schéma d'URL
+        url = 'postgresql://' + url[len('postgres://'):]
+
+    if not url:
+        # Base de données SQLite dans /instance/site.db
+        db_path = os.path.join(app.instance_path, 'site.db')
+        url = f"sqlite:///{db_path}"
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_POOL_OVERFLOW', 10)),
+    }
+    if url.startswith('sqlite'):
+        profil = os.environ.get('DB_PROFILE', 'production')
+        if profil not in PROFILS_SQLITE:
+            raise ValueError(f"Profil de base inconnu : {profil}")
+        app.config['SQLITE_PRAGMAS'] = PROFILS_SQLITE[profil]
+        busy_timeout = app.config['SQLITE_PRAGMAS'].get('busy_timeout', 5000)
+        options['connect_args'] = {'timeout': busy_timeout / 1000, 'check_same_thread': False}
+    else:
+        options['pool_pre_ping'] = True
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def activer_pragmas(app, db):
+    """Appliquer les pragmas du profil SQLite à chaque connexion (après db.init_app)"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    def appliquer(dbapi_connection, connection_record):
+        curseur = dbapi_connection.cursor()
+        for nom, valeur in pragmas.items():
+            curseur.execute(f"PRAGMA {nom}={valeur}")
+        curseur.close()
+
+    with app.app_context():
+        event.listen(db.engine, 'connect', appliquer)
+
+
+def proteger_fork(app, db):
+    """
+    Ne pas réutiliser dans un processus enfant les connexions ouvertes par le parent
+
+    Avec gunicorn --preload, create_app s'exécute dans le master : le pool
+    contient déjà des connexions (create_all) au moment du fork. L'enfant
+    les oublie sans les fermer (elles appartiennent au parent) et ouvre les
+    siennes à la demande.
+    """
+    with app.app_context():
+        engine = db.engine
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
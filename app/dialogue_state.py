@@ -0,0 +1,132 @@
+"""
+État de conversation du chatbot, par utilisateur :
+- MemoryStateStore : LRU en mémoire avec expiration (un seul processus)
+- SQLiteStateStore : table `etat_dialogue` dans la base de l'application
+  (partagé entre tous les workers gunicorn)
+"""
+
+import os
+from datetime import datetime, timedelta
+
+from app.cache import LRUCache
+
+
+# États possibles d'une conversation
+ETAT_ATTENTE_DATE_GROSSESSE = "attente_date_grossesse"
+ETAT_ATTENTE_DATE_NAISSANCE = "attente_date_naissance"
+
+DEFAULT_TTL = 30 * 60  # secondes
+DEFAULT_MAX_USERS = 10000
+
+
+class MemoryStateStore:
+    """État de dialogue en mémoire (LRU + TTL)"""
+
+    def __init__(self, maxsize=DEFAULT_MAX_USERS, ttl=DEFAULT_TTL):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, user_id):
+        """Lire l'état courant de l'utilisateur (None si aucun)"""
+        return self._cache.get(user_id)
+
+    def set(self, user_id, etat):
+        """Définir l'état de l'utilisateur"""
+        self._cache.set(user_id, etat)
+
+    def pop(self, user_id):
+        """Lire et effacer l'état de l'utilisateur"""
+        return self._cache.pop(user_id)
+
+    def clear(self, user_id):
+        """Effacer l'état de l'utilisateur"""
+        self._cache.pop(user_id)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class SQLiteStateStore:
+    """
+    État de dialogue persistant dans la base (via `db`)
+
+    Les écritures passent par une connexion et une transaction propres
+    (`db.engine.begin()`) : elles ne valident pas la session de la requête
+    en cours (/api/chat), et `pop` lit et efface l'état en une seule
+    instruction (DELETE ... RETURNING, SQLite >= 3.35 ou Postgres) :
+    deux requêtes concurrentes ne peuvent pas consommer le même état.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+
+    def _expire(self, updated_at):
+        return bool(self.ttl) and updated_at < datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def get(self, user_id):
+        """Lire l'état courant de l'utilisateur (None si aucun)"""
+        from app import db
+        from app.models import EtatDialogue
+
+        table = EtatDialogue.__table__
+        with db.engine.connect() as connexion:
+            ligne = connexion.execute(
+                db.select(table.c.etat, table.c.updated_at).where(table.c.user_id == user_id)
+            ).first()
+        if ligne is None or self._expire(ligne.updated_at):
+            return None
+        return ligne.etat
+
+    def set(self, user_id, etat):
+        """Définir l'état de l'utilisateur"""
+        from app import db
+        from app.models import EtatDialogue
+
+        table = EtatDialogue.__table__
+        requete = db.text(
+            "INSERT INTO etat_dialogue (user_id, etat, updated_at) VALUES (:user_id, :etat, :updated_at) "
+            "ON CONFLICT (user_id) DO UPDATE SET etat = :etat, updated_at = :updated_at"
+        ).bindparams(db.bindparam('updated_at', type_=table.c.updated_at.type))
+        with db.engine.begin() as connexion:
+            connexion.execute(requete, {'user_id': user_id, 'etat': etat, 'updated_at': datetime.utcnow()})
+
+    def pop(self, user_id):
+        """Lire et effacer l'état de l'utilisateur"""
+        from app import db
+        from app.models import EtatDialogue
+
+        table = EtatDialogue.__table__
+        with db.engine.begin() as connexion:
+            ligne = connexion.execute(
+                db.delete(table).where(table.c.user_id == user_id).returning(table.c.etat, table.c.updated_at)
+            ).first()
+        if ligne is None or self._expire(ligne.updated_at):
+            return None
+        return ligne.etat
+
+    def clear(self, user_id):
+        """Effacer l'état de l'utilisateur"""
+        self.pop(user_id)
+
+    def stats(self):
+        from app.models import EtatDialogue
+
+        return {'size': EtatDialogue.query.count(), 'ttl': self.ttl}
+
+
+def creer_state_store(backend=None):
+    """
+    Créer le store d'état de dialogue configuré
+
+    Args:
+        backend: 'memory' ou 'sqlite' (par défaut : variable DIALOGUE_STATE_BACKEND)
+    """
+    backend = backend or os.environ.get('DIALOGUE_STATE_BACKEND', 'sqlite')
+    ttl = int(os.environ.get('DIALOGUE_STATE_TTL', DEFAULT_TTL))
+
+    if backend == 'memory':
+        maxsize = int(os.environ.get('DIALOGUE_STATE_MAX_USERS', DEFAULT_MAX_USERS))
+        return MemoryStateStore(maxsize=maxsize, ttl=ttl)
+    if backend == 'sqlite':
+        return SQLiteStateStore(ttl=ttl)
+
+    raise ValueError(f"Backend d'état de dialogue inconnu : {backend}")
@@ -0,0 +1,209 @@
+"""
+Hachage des mots de passe (bcrypt) hors des workers web
+
+- Coût (log rounds) par environnement : APP_ENV=production|development|test,
+  ou directement BCRYPT_LOG_ROUNDS
+- Hachage et vérification dans un pool de processus dédié et borné
+  (BCRYPT_PROCESSUS par worker web, BCRYPT_MAX_EN_COURS demandes au plus) :
+  une rafale de connexions n'occupe pas tous les cœurs au détriment du chat
+- Pool activé par défaut sous gunicorn seulement (gunicorn.conf.py fixe
+  BCRYPT_PROCESSUS=1) : les processus du pool sont lancés en mode spawn,
+  qui réimporte le script principal. Avec `python cours.py`, chaque
+  processus du pool recréerait toute l'application ; hors gunicorn le
+  hachage reste donc dans le processus web (BCRYPT_PROCESSUS=0)
+- Rehachage transparent à la connexion quand le coût a changé
+
+Compatible avec les hash existants de Flask-Bcrypt (même format $2b$).
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+ROUNDS_PAR_ENVIRONNEMENT = {
+    'production': 12,
+    'development': 4,
+    'test': 4,
+}
+
+# bcrypt n'utilise que les 72 premiers octets ; bcrypt >= 5 refuse les
+# mots de passe plus longs au lieu de les tronquer
+LONGUEUR_MAX = 72
+
+
+class SurchargeHachage(RuntimeError):
+    """Trop de hachages en attente : la demande est refusée plutôt que mise en file"""
+
+
+def rounds_configures():
+    """Coût bcrypt : BCRYPT_LOG_ROUNDS, sinon celui de APP_ENV (production par défaut)"""
+    if os.environ.get("BCRYPT_LOG_ROUNDS"):
+        return int(os.environ["BCRYPT_LOG_ROUNDS"])
+    environnement = os.environ.get("APP_ENV", "production")
+    if environnement not in ROUNDS_PAR_ENVIRONNEMENT:
+        raise ValueError(f"APP_ENV inconnu : {environnement} (attendu : {', '.join(ROUNDS_PAR_ENVIRONNEMENT)})")
+    return ROUNDS_PAR_ENVIRONNEMENT[environnement]
+
+
+def _octets(password):
+    if isinstance(password, str):
+        password = password.encode("utf-8")
+    return password[:LONGUEUR_MAX]
+
+
+def cout_du_hash(pw_hash):
+    """Log rounds d'un hash bcrypt ($2b$12$...), None s'il n'est pas lisible"""
+    try:
+        return int(pw_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class HachageMotsDePasse:
+    """Hachage / vérification bcrypt, déporté dans un pool de processus"""
+
+    def __init__(self, app=None):
+        self.rounds = ROUNDS_PAR_ENVIRONNEMENT['production']
+        self.processus = 0
+        self.attente_max = 10.0
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._places = threading.BoundedSemaphore(4)
+        self.hachages = 0
+        self.verifications = 0
+        self.rehachages = 0
+        self.refus = 0
+        self.duree_totale = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """
+        Lire la configuration :
+            BCRYPT_LOG_ROUNDS: Coût (défaut selon APP_ENV)
+            BCRYPT_PROCESSUS: Processus du pool (défaut 0 = hachage dans le
+                processus web ; 1 sous gunicorn, voir gunicorn.conf.py)
+            BCRYPT_MAX_EN_COURS: Hachages en cours ou en attente par worker web
+            BCRYPT_ATTENTE_S: Attente maximale d'une place avant SurchargeHachage
+        """
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', rounds_configures())
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.processus = int(os.environ.get("BCRYPT_PROCESSUS", 0))
+        max_en_cours = int(os.environ.get("BCRYPT_MAX_EN_COURS", max(self.processus, 1) * 4))
+        self._places = threading.BoundedSemaphore(max_en_cours)
+        self.attente_max = float(os.environ.get("BCRYPT_ATTENTE_S", 10))
+        app.extensions["hachage"] = self
+
+    def _obtenir_pool(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Pool créé dans le processus qui l'utilise (après le fork
+                # des workers gunicorn), en mode spawn : les processus du
+                # pool n'héritent ni des threads ni des hooks de l'application.
+                # Seules des fonctions du module bcrypt leur sont envoyées :
+                # ils n'importent jamais le paquet app
+                import multiprocessing
+
+                self._pid = os.getpid()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processus, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def demarrer(self):
+        """Lancer les processus du pool sans attendre (évite l'attente à la première connexion)"""
+        if self.processus > 0:
+            pool = self._obtenir_pool()
+            for _ in range(self.processus):
+                pool.submit(os.getpid)
+
+    def arreter(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pid = None
+
+    def _executer(self, fonction, *args):
+        if not self._places.acquire(timeout=self.attente_max):
+            with self._lock:
+                self.refus += 1
+            raise SurchargeHachage("Trop de connexions simultanées, réessayez dans un instant")
+        debut = time.perf_counter()
+        try:
+            if self.processus <= 0:
+                return fonction(*args)
+            return self._obtenir_pool().submit(fonction, *args).result()
+        finally:
+            self._places.release()
+            with self._lock:
+                self.duree_totale += time.perf_counter() - debut
+
+    def hacher(self, password):
+        """
+        Hash bcrypt du mot de passe au coût configuré
+
+        Raises:
+            SurchargeHachage: Aucune place libre avant BCRYPT_ATTENTE_S
+        """
+        # Sel tiré ici (rapide) : le pool n'exécute que bcrypt.hashpw
+        resultat = self._executer(bcrypt.hashpw, _octets(password), bcrypt.gensalt(self.rounds)).decode("utf-8")
+        with self._lock:
+            self.hachages += 1
+        return resultat
+
+    def verifier(self, pw_hash, password):
+        """
+        Le mot de passe correspond-il au hash ?
+
+        Raises:
+            SurchargeHachage: Aucune place libre avant BCRYPT_ATTENTE_S
+        """
+        if isinstance(pw_hash, str):
+            pw_hash = pw_hash.encode("utf-8")
+        try:
+            resultat = self._executer(bcrypt.checkpw, _octets(password), pw_hash)
+        except ValueError:
+            # Hash invalide ou tronqué en base
+            resultat = False
+        with self._lock:
+            self.verifications += 1
+        return resultat
+
+    def doit_rehacher(self, pw_hash):
+        """Le hash a-t-il été calculé avec un autre coût que celui configuré ?"""
+        return cout_du_hash(pw_hash) != self.rounds
+
+    def verifier_et_rehacher(self, user, password):
+        """
+        Vérifier le mot de passe d'un utilisateur et mettre son hash au coût
+        courant si besoin (l'appelant fait le commit)
+
+        Returns:
+            bool: Mot de passe correct
+        """
+        if not self.verifier(user.password_hash, password):
+            return False
+        if self.doit_rehacher(user.password_hash):
+            user.password_hash = self.hacher(password)
+            with self._lock:
+                self.rehachages += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            operations = self.hachages + self.verifications
+            return {
+                'rounds': self.rounds,
+                'processus': self.processus,
+                'hachages': self.hachages,
+                'verifications': self.verifications,
+                'rehachages': self.rehachages,
+                'refus': self.refus,
+                'duree_moyenne_ms': round(self.duree_totale / operations * 1000, 1) if operations else 0.0,
+            }
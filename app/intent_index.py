@@ -0,0 +1,376 @@
+"""
+Index d'intentions précompilé :
+- Compilation du corpus (vocabulaire, poids IDF, matrice TF-IDF normalisée)
+- Sauvegarde versionnée sur disque, identifiée par le hash du corpus
+- Chargement en memory-map pour partager les pages entre workers
+- Index inversé (terme -> patterns) pour ne scorer que les candidats
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from importlib import metadata
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+# Incrémenter à chaque changement du format des fichiers de l'index
+INDEX_FORMAT_VERSION = 2
+
+# Incrémenter à chaque changement du prétraitement des patterns
+# (chatbot.preprocess_text : tokenisation, lemmatisation, stopwords...) :
+# sinon l'index compilé avec l'ancien prétraitement reste servi, son hash
+# de corpus n'ayant pas changé. La version de NLTK est ajoutée d'office.
+PREPROCESS_VERSION = 1
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(BASE_DIR, "corpus.json")
+INDEX_DIR = os.environ.get(
+    "INTENT_INDEX_DIR",
+    os.path.join(os.path.dirname(BASE_DIR), "instance", "intent_index"),
+)
+
+META_FILE = "meta.json"
+ARRAY_FILES = (
+    "idf", "data", "indices", "indptr",
+    "postings_indptr", "postings_ids", "postings_weights", "tag_ids",
+)
+
+
+# ============================================================
+# CORPUS
+# ============================================================
+
+@functools.lru_cache(maxsize=1)
+def empreinte_pretraitement():
+    """Version du prétraitement et de NLTK, mêlée au hash du corpus (lue une fois)"""
+    try:
+        nltk_version = metadata.version("nltk")
+    except metadata.PackageNotFoundError:
+        nltk_version = "absent"
+    return f"preprocess-v{PREPROCESS_VERSION}|nltk-{nltk_version}"
+
+
+def hash_corpus(corpus_bytes):
+    """Hash du contenu du corpus (inclut la version du format de l'index et du prétraitement)"""
+    h = hashlib.sha256()
+    h.update(f"intent-index-v{INDEX_FORMAT_VERSION}|{empreinte_pretraitement()}\n".encode("utf-8"))
+    h.update(corpus_bytes)
+    return h.hexdigest()
+
+
+def lire_corpus(corpus_path=CORPUS_PATH):
+    """
+    Lire le corpus brut
+
+    Returns:
+        tuple: (data, corpus_hash)
+    """
+    with open(corpus_path, "rb") as file:
+        corpus_bytes = file.read()
+    return json.loads(corpus_bytes.decode("utf-8")), hash_corpus(corpus_bytes)
+
+
+def extraire_patterns(data):
+    """
+    Extraire les patterns valides du corpus
+
+    Returns:
+        tuple: (patterns, tags, responses_dict)
+    """
+    patterns = []
+    tags = []
+    responses_dict = {}
+
+    for intent in data.get("intents", []):
+        tag = intent.get("tag")
+        responses = intent.get("responses", [])
+        patterns_list = intent.get("patterns", [])
+
+        if not tag or not responses or not isinstance(patterns_list, list):
+            continue
+
+        responses_dict[tag] = responses
+
+        for pattern in patterns_list:
+            if isinstance(pattern, str) and pattern.strip():
+                patterns.append(pattern)
+                tags.append(tag)
+
+    return patterns, tags, responses_dict
+
+
+# ============================================================
+# INDEX
+# ============================================================
+
+class InvertedIndex:
+    """
+    Index inversé terme -> patterns
+
+    Les listes de postings sont la transposée CSR de la matrice TF-IDF :
+    pour le terme t, `ids[indptr[t]:indptr[t+1]]` sont les patterns qui
+    le contiennent et `weights[...]` leurs poids TF-IDF normalisés.
+    """
+
+    def __init__(self, postings, tag_ids, tag_names):
+        self.postings = postings
+        self.tag_ids = tag_ids
+        self.tag_names = tag_names
+
+    @classmethod
+    def depuis_matrice(cls, X, tags):
+        """Construire l'index inversé depuis la matrice patterns x termes"""
+        postings = X.T.tocsr()
+        postings.sort_indices()
+
+        tag_names = list(dict.fromkeys(tags))
+        position = {tag: i for i, tag in enumerate(tag_names)}
+        tag_ids = np.fromiter((position[tag] for tag in tags), dtype=np.int32, count=len(tags))
+        return cls(postings, tag_ids, tag_names)
+
+    def top_k(self, term_ids, weights, k=3):
+        """
+        Meilleurs intents pour une requête TF-IDF (indices et poids des termes)
+
+        Seuls les patterns partageant au moins un terme avec la requête sont
+        scorés ; le score d'un intent est celui de son meilleur pattern.
+
+        Returns:
+            list: [(tag, score, pattern_idx), ...] triés par score décroissant
+        """
+        if len(term_ids) == 0:
+            return []
+
+        indptr = self.postings.indptr
+        starts = indptr[term_ids]
+        ends = indptr[np.asarray(term_ids) + 1]
+        longueurs = ends - starts
+        if not longueurs.any():
+            return []
+
+        ids = np.concatenate([self.postings.indices[a:b] for a, b in zip(starts, ends)])
+        poids = np.concatenate([self.postings.data[a:b] for a, b in zip(starts, ends)])
+        poids = poids * np.repeat(np.asarray(weights, dtype=np.float64), longueurs)
+
+        # Somme des contributions par pattern candidat
+        candidats, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=poids)
+
+        # Meilleur pattern de chaque intent (à score égal : le premier pattern)
+        ordre = np.argsort(-scores, kind="stable")
+        _, premiers = np.unique(self.tag_ids[candidats[ordre]], return_index=True)
+        meilleurs = ordre[np.sort(premiers)][:k]
+
+        return [
+            (self.tag_names[self.tag_ids[candidats[i]]], float(scores[i]), int(candidats[i]))
+            for i in meilleurs
+        ]
+
+
+class IntentIndex:
+    """Index TF-IDF compilé d'un corpus d'intentions"""
+
+    def __init__(self, corpus_hash, vocabulary, idf, X, tags, responses_dict, inverted=None):
+        self.corpus_hash = corpus_hash
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.X = X
+        self.tags = tags
+        self.responses_dict = responses_dict
+        self.inverted = inverted or InvertedIndex.depuis_matrice(X, tags)
+
+    def __repr__(self):
+        return f"IntentIndex(hash={self.corpus_hash[:12]}, patterns={self.X.shape[0]}, termes={self.X.shape[1]})"
+
+    def creer_vectorizer(self):
+        """Reconstruire un TfidfVectorizer prêt pour transform() sans refaire le fit"""
+        vectorizer = TfidfVectorizer(vocabulary=self.vocabulary)
+        vectorizer.idf_ = self.idf
+        return vectorizer
+
+
+def compiler_index(data, corpus_hash, preprocess):
+    """
+    Compiler le corpus en index TF-IDF
+
+    Args:
+        data: Corpus JSON déjà chargé
+        corpus_hash: Hash du contenu du corpus
+        preprocess: Fonction de prétraitement appliquée à chaque pattern
+
+    Returns:
+        IntentIndex
+    """
+    patterns, tags, responses_dict = extraire_patterns(data)
+    processed_patterns = [preprocess(p) for p in patterns]
+
+    vectorizer = TfidfVectorizer()
+    X = vectorizer.fit_transform(processed_patterns).tocsr()
+    X.sort_indices()
+
+    vocabulary = {term: int(idx) for term, idx in vectorizer.vocabulary_.items()}
+    return IntentIndex(corpus_hash, vocabulary, vectorizer.idf_, X, tags, responses_dict)
+
+
+def chemin_index(corpus_hash, index_dir=INDEX_DIR):
+    """Dossier de l'index correspondant à un hash de corpus"""
+    return os.path.join(index_dir, corpus_hash)
+
+
+def sauvegarder_index(index, index_dir=INDEX_DIR):
+    """
+    Écrire l'index sur disque de façon atomique
+
+    L'index est écrit dans un dossier temporaire puis renommé, pour que
+    plusieurs workers qui construisent en même temps ne lisent jamais
+    un index incomplet.
+
+    Returns:
+        str: Chemin du dossier de l'index
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    destination = chemin_index(index.corpus_hash, index_dir)
+    if os.path.isdir(destination):
+        return destination
+
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=index_dir)
+    try:
+        termes = [None] * len(index.vocabulary)
+        for term, idx in index.vocabulary.items():
+            termes[idx] = term
+
+        meta = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "corpus_hash": index.corpus_hash,
+            "shape": list(index.X.shape),
+            "termes": termes,
+            "tags": index.tags,
+            "tag_names": index.inverted.tag_names,
+            "responses": index.responses_dict,
+        }
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as file:
+            json.dump(meta, file, ensure_ascii=False)
+
+        arrays = {
+            "idf": np.asarray(index.idf, dtype=np.float64),
+            "data": index.X.data.astype(np.float64, copy=False),
+            "indices": index.X.indices.astype(np.int32, copy=False),
+            "indptr": index.X.indptr.astype(np.int32, copy=False),
+            "postings_indptr": index.inverted.postings.indptr.astype(np.int32, copy=False),
+            "postings_ids": index.inverted.postings.indices.astype(np.int32, copy=False),
+            "postings_weights": index.inverted.postings.data.astype(np.float64, copy=False),
+            "tag_ids": index.inverted.tag_ids,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+
+        os.replace(tmp_dir, destination)
+    except OSError:
+        # Un autre worker a publié le même index entre-temps
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(destination):
+            raise
+
+    return destination
+
+
+def charger_index(corpus_hash, index_dir=INDEX_DIR):
+    """
+    Charger un index compilé en memory-map
+
+    Returns:
+        IntentIndex ou None si l'index est absent ou d'une autre version
+    """
+    dossier = chemin_index(corpus_hash, index_dir)
+    try:
+        with open(os.path.join(dossier, META_FILE), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get("format_version") != INDEX_FORMAT_VERSION or meta.get("corpus_hash") != corpus_hash:
+        return None
+
+    try:
+        arrays = {
+            name: np.load(os.path.join(dossier, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAY_FILES
+        }
+    except (OSError, ValueError):
+        return None
+
+    X = sparse.csr_matrix(
+        (arrays["data"], arrays["indices"], arrays["indptr"]),
+        shape=tuple(meta["shape"]),
+        copy=False,
+    )
+    postings = sparse.csr_matrix(
+        (arrays["postings_weights"], arrays["postings_ids"], arrays["postings_indptr"]),
+        shape=(X.shape[1], X.shape[0]),
+        copy=False,
+    )
+    inverted = InvertedIndex(postings, arrays["tag_ids"], meta["tag_names"])
+
+    vocabulary = {term: idx for idx, term in enumerate(meta["termes"])}
+    return IntentIndex(corpus_hash, vocabulary, arrays["idf"], X, meta["tags"], meta["responses"], inverted)
+
+
+def obtenir_index(preprocess, corpus_path=CORPUS_PATH, index_dir=INDEX_DIR):
+    """
+    Charger l'index du corpus courant, ou le compiler s'il n'existe pas
+
+    Returns:
+        IntentIndex
+    """
+    data, corpus_hash = lire_corpus(corpus_path)
+
+    index = charger_index(corpus_hash, index_dir)
+    if index is not None:
+        return index
+
+    index = compiler_index(data, corpus_hash, preprocess)
+    try:
+        sauvegarder_index(index, index_dir)
+    except OSError as e:
+        # Dossier en lecture seule : on garde l'index en mémoire
+        print("⚠️  Index d'intentions non sauvegardé :", e)
+        return index
+    # Relu depuis le disque : les tableaux deviennent des projections mmap
+    # en lecture seule, partagées par les workers via le cache de pages
+    return charger_index(corpus_hash, index_dir) or index
+
+
+def construire_index(preprocess, corpus_path=CORPUS_PATH, index_dir=INDEX_DIR, force=False):
+    """
+    Compiler et publier l'index du corpus (étape de build)
+
+    Returns:
+        tuple: (IntentIndex, chemin du dossier)
+    """
+    data, corpus_hash = lire_corpus(corpus_path)
+    destination = chemin_index(corpus_hash, index_dir)
+    if force and os.path.isdir(destination):
+        shutil.rmtree(destination)
+
+    index = compiler_index(data, corpus_hash, preprocess)
+    return index, sauvegarder_index(index, index_dir)
+
+
+def nettoyer_index(corpus_hash, index_dir=INDEX_DIR):
+    """Supprimer les index compilés pour d'anciennes versions du corpus"""
+    if not os.path.isdir(index_dir):
+        return []
+
+    supprimes = []
+    for nom in os.listdir(index_dir):
+        if nom == corpus_hash or nom.startswith(".tmp-"):
+            continue
+        shutil.rmtree(os.path.join(index_dir, nom), ignore_errors=True)
+        supprimes.append(nom)
+    return supprimes
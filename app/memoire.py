@@ -0,0 +1,91 @@
+"""
+Mémoire des processus gunicorn (Linux, /proc)
+
+Pour chaque processus :
+- RSS : pages résidentes, partagées comprises (compte plusieurs fois les
+  pages communes au master et aux workers)
+- PSS : pages partagées divisées par le nombre de processus qui les utilisent
+- USS : pages privées (Private_Clean + Private_Dirty), libérées si le
+  processus s'arrête ; c'est le coût réel d'un worker supplémentaire
+
+Avec gunicorn --preload, le modèle chargé dans le master reste partagé
+(copy-on-write) : l'USS des workers baisse, leur RSS non.
+"""
+
+import os
+
+
+CHAMPS_SMAPS = {
+    'Rss': 'rss_kb',
+    'Pss': 'pss_kb',
+    'Shared_Clean': 'shared_clean_kb',
+    'Shared_Dirty': 'shared_dirty_kb',
+    'Private_Clean': 'private_clean_kb',
+    'Private_Dirty': 'private_dirty_kb',
+}
+
+
+def lire_smaps_rollup(pid):
+    """
+    Totaux mémoire d'un processus (en kB)
+
+    Returns:
+        dict: rss_kb, pss_kb, uss_kb, shared_kb, ... ou None si le processus
+        n'existe plus ou n'est pas lisible
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as file:
+            lignes = file.readlines()
+    except OSError:
+        return None
+
+    valeurs = {cle: 0 for cle in CHAMPS_SMAPS.values()}
+    for ligne in lignes:
+        nom, _, reste = ligne.partition(":")
+        if nom in CHAMPS_SMAPS:
+            valeurs[CHAMPS_SMAPS[nom]] = int(reste.split()[0])
+
+    valeurs['uss_kb'] = valeurs['private_clean_kb'] + valeurs['private_dirty_kb']
+    valeurs['shared_kb'] = valeurs['shared_clean_kb'] + valeurs['shared_dirty_kb']
+    return valeurs
+
+
+def processus_enfants(pid):
+    """PIDs des processus dont le parent est `pid` (les workers d'un master gunicorn)"""
+    enfants = []
+    for nom in os.listdir("/proc"):
+        if not nom.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nom}/stat", encoding="ascii", errors="replace") as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # Le nom de commande (entre parenthèses) peut contenir des espaces
+        champs = stat.rsplit(")", 1)[-1].split()
+        if len(champs) > 1 and int(champs[1]) == pid:
+            enfants.append(int(nom))
+    return sorted(enfants)
+
+
+def rapport(pid_master):
+    """
+    Mémoire du master et de chacun de ses workers
+
+    Returns:
+        dict: {'master': {...}, 'workers': [{pid, rss_kb, pss_kb, uss_kb, ...}],
+               'total': {rss_kb, pss_kb, uss_kb}}
+    """
+    workers = []
+    for pid in processus_enfants(pid_master):
+        mesures = lire_smaps_rollup(pid)
+        if mesures is not None:
+            workers.append(dict(mesures, pid=pid))
+
+    master = lire_smaps_rollup(pid_master)
+    processus = workers + ([master] if master else [])
+    total = {
+        cle: sum(p[cle] for p in processus)
+        for cle in ('rss_kb', 'pss_kb', 'uss_kb')
+    }
+    return {'master': master and dict(master, pid=pid_master), 'workers': workers, 'total': total}
@@ -0,0 +1,437 @@
+"""
+Métriques de l'application au format texte Prometheus :
+- Compteurs et histogrammes en mémoire (thread-safe)
+- Durée des requêtes HTTP (hooks Flask), des étapes du chatbot,
+  des requêtes SQL (événements SQLAlchemy) et des envois SMS
+- Agrégation entre workers gunicorn : chaque processus écrit un
+  instantané JSON dans METRICS_DIR, /metrics fusionne tous les fichiers
+"""
+
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_DIR = os.environ.get(
+    "METRICS_DIR",
+    os.path.join(os.path.dirname(BASE_DIR), "instance", "metrics"),
+)
+# Délai minimum entre deux écritures de l'instantané d'un processus
+INTERVALLE_ECRITURE = float(os.environ.get("METRICS_FLUSH_S", 1.0))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bornes des histogrammes (secondes) : de 100 µs à 10 s
+BUCKETS_DEFAUT = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ARCHIVE_FILE = "archive.json"
+
+
+# ============================================================
+# TYPES DE MÉTRIQUES
+# ============================================================
+
+class Compteur:
+    """Compteur monotone, une série par combinaison de labels"""
+
+    type = "counter"
+
+    def __init__(self, nom, aide, labels=()):
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valeur=1, **labels):
+        cle = tuple(str(labels.get(l, "")) for l in self.labels)
+        with self._lock:
+            self._series[cle] = self._series.get(cle, 0) + valeur
+
+    def reinitialiser(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def snapshot(self):
+        with self._lock:
+            series = [[list(cle), valeur] for cle, valeur in self._series.items()]
+        return {'type': self.type, 'aide': self.aide, 'labels': list(self.labels), 'series': series}
+
+
+class Histogramme:
+    """
+    Histogramme à bornes fixes
+
+    Chaque série garde le nombre d'observations par intervalle (non
+    cumulé), la somme et le total ; le cumul est fait à l'export.
+    """
+
+    type = "histogram"
+
+    def __init__(self, nom, aide, labels=(), buckets=BUCKETS_DEFAUT):
+        self.nom = nom
+        self.aide = aide
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, valeur, **labels):
+        cle = tuple(str(labels.get(l, "")) for l in self.labels)
+        i = bisect.bisect_left(self.buckets, valeur)
+        with self._lock:
+            serie = self._series.get(cle)
+            if serie is None:
+                serie = self._series[cle] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][i] += 1
+            serie[1] += valeur
+            serie[2] += 1
+
+    def reinitialiser(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def snapshot(self):
+        with self._lock:
+            series = [[list(cle), [list(s[0]), s[1], s[2]]] for cle, s in self._series.items()]
+        return {
+            'type': self.type, 'aide': self.aide, 'labels': list(self.labels),
+            'buckets': list(self.buckets), 'series': series,
+        }
+
+
+class Registre:
+    """Ensemble des métriques d'un processus"""
+
+    def __init__(self):
+        self._metriques = {}
+        self._lock = threading.Lock()
+
+    def _obtenir(self, classe, nom, *args, **kwargs):
+        with self._lock:
+            if nom not in self._metriques:
+                self._metriques[nom] = classe(nom, *args, **kwargs)
+            return self._metriques[nom]
+
+    def compteur(self, nom, aide, labels=()):
+        return self._obtenir(Compteur, nom, aide, labels)
+
+    def histogramme(self, nom, aide, labels=(), buckets=BUCKETS_DEFAUT):
+        return self._obtenir(Histogramme, nom, aide, labels, buckets)
+
+    def reinitialiser(self):
+        """Vider toutes les séries (les métriques déclarées restent)"""
+        self._lock = threading.Lock()
+        for metrique in self._metriques.values():
+            metrique.reinitialiser()
+
+    def snapshot(self):
+        with self._lock:
+            metriques = list(self._metriques.values())
+        return {m.nom: m.snapshot() for m in metriques}
+
+
+# ============================================================
+# FUSION ET EXPORT
+# ============================================================
+
+def fusionner(snapshots):
+    """
+    Additionner les instantanés de plusieurs processus
+
+    Returns:
+        dict: Même format qu'un instantané
+    """
+    resultat = {}
+    for snapshot in snapshots:
+        for nom, metrique in snapshot.items():
+            cible = resultat.get(nom)
+            if cible is None:
+                cible = resultat[nom] = dict(metrique, series={})
+            for labels, valeur in metrique['series']:
+                cle = tuple(labels)
+                existant = cible['series'].get(cle)
+                if existant is None:
+                    cible['series'][cle] = json.loads(json.dumps(valeur))
+                elif metrique['type'] == "counter":
+                    cible['series'][cle] = existant + valeur
+                else:
+                    existant[0] = [a + b for a, b in zip(existant[0], valeur[0])]
+                    existant[1] += valeur[1]
+                    existant[2] += valeur[2]
+
+    for metrique in resultat.values():
+        metrique['series'] = [[list(cle), valeur] for cle, valeur in metrique['series'].items()]
+    return resultat
+
+
+def _echapper(valeur):
+    return valeur.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(noms, valeurs, extra=None):
+    paires = [f'{n}="{_echapper(v)}"' for n, v in zip(noms, valeurs)]
+    if extra:
+        paires.append(extra)
+    return "{" + ",".join(paires) + "}" if paires else ""
+
+
+def _nombre(valeur):
+    if valeur == float("inf"):
+        return "+Inf"
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+def format_prometheus(snapshot):
+    """Rendu texte (format d'exposition Prometheus 0.0.4)"""
+    lignes = []
+    for nom in sorted(snapshot):
+        metrique = snapshot[nom]
+        lignes.append(f"# HELP {nom} {metrique['aide']}")
+        lignes.append(f"# TYPE {nom} {metrique['type']}")
+        noms = metrique['labels']
+        for labels, valeur in sorted(metrique['series'], key=lambda serie: serie[0]):
+            if metrique['type'] == "counter":
+                lignes.append(f"{nom}{_labels(noms, labels)} {_nombre(valeur)}")
+                continue
+            comptes, somme, total = valeur
+            cumul = 0
+            for borne, compte in zip(list(metrique['buckets']) + [float("inf")], comptes):
+                cumul += compte
+                le = 'le="%s"' % _nombre(borne)
+                lignes.append(f"{nom}_bucket{_labels(noms, labels, le)} {cumul}")
+            lignes.append(f"{nom}_sum{_labels(noms, labels)} {_nombre(somme)}")
+            lignes.append(f"{nom}_count{_labels(noms, labels)} {total}")
+    return "\n".join(lignes) + "\n"
+
+
+# ============================================================
+# INSTANTANÉS PAR PROCESSUS (multi-workers)
+# ============================================================
+
+def _ecrire_json(chemin, contenu):
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    with open(temporaire, "w", encoding="utf-8") as file:
+        json.dump(contenu, file)
+    os.replace(temporaire, chemin)
+
+
+def _lire_json(chemin):
+    try:
+        with open(chemin, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def ecrire_snapshot(dossier=None):
+    """Écrire l'instantané du processus courant dans `<dossier>/<pid>.json`"""
+    dossier = dossier or METRICS_DIR
+    os.makedirs(dossier, exist_ok=True)
+    _ecrire_json(os.path.join(dossier, f"{os.getpid()}.json"), registre.snapshot())
+
+
+def _verrou(dossier, mode):
+    fichier = open(os.path.join(dossier, ".lock"), "a")
+    fcntl.flock(fichier, mode)
+    return fichier
+
+
+def lire_snapshots(dossier=None):
+    """Instantanés de tous les processus (vivants et archivés)"""
+    dossier = dossier or METRICS_DIR
+    if not os.path.isdir(dossier):
+        return []
+    snapshots = []
+    # Verrou partagé : un archivage en cours ne doit pas être lu à moitié
+    with _verrou(dossier, fcntl.LOCK_SH):
+        for nom in os.listdir(dossier):
+            if nom.endswith(".json"):
+                contenu = _lire_json(os.path.join(dossier, nom))
+                if contenu:
+                    snapshots.append(contenu)
+    return snapshots
+
+
+def archiver_processus(pid, dossier=None):
+    """
+    Fusionner l'instantané d'un worker arrêté dans l'archive
+
+    Appelé par le master gunicorn (`child_exit`) : les compteurs restent
+    monotones et le pid peut être réutilisé sans écraser ses valeurs.
+    """
+    dossier = dossier or METRICS_DIR
+    chemin = os.path.join(dossier, f"{pid}.json")
+    if not os.path.exists(chemin):
+        return
+    with _verrou(dossier, fcntl.LOCK_EX):
+        snapshots = [s for s in (_lire_json(os.path.join(dossier, ARCHIVE_FILE)), _lire_json(chemin)) if s]
+        _ecrire_json(os.path.join(dossier, ARCHIVE_FILE), fusionner(snapshots))
+        os.remove(chemin)
+
+
+def reinitialiser_dossier(dossier=None):
+    """Vider le dossier des instantanés (démarrage du master gunicorn)"""
+    dossier = dossier or METRICS_DIR
+    if os.path.isdir(dossier):
+        for nom in os.listdir(dossier):
+            if nom.endswith(".json"):
+                os.remove(os.path.join(dossier, nom))
+
+
+def exporter(dossier=None):
+    """
+    Texte Prometheus agrégé sur tous les processus
+
+    Sans dossier d'instantanés (métriques non installées), seules les
+    valeurs du processus courant sont exportées.
+    """
+    if not _etat['multi_processus']:
+        return format_prometheus(registre.snapshot())
+    ecrire_snapshot(dossier)
+    return format_prometheus(fusionner(lire_snapshots(dossier)))
+
+
+# ============================================================
+# REGISTRE ET MÉTRIQUES DE L'APPLICATION
+# ============================================================
+
+registre = Registre()
+
+_etat = {
+    'actif': os.environ.get("METRICS_ENABLED", "1") == "1",
+    'multi_processus': False,
+    'derniere_ecriture': 0.0,
+}
+
+HTTP_REQUETES = registre.compteur(
+    "http_requests_total", "Requêtes HTTP traitées", ("method", "endpoint", "status"))
+HTTP_DUREE = registre.histogramme(
+    "http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "endpoint"))
+CHATBOT_ETAPE = registre.histogramme(
+    "chatbot_stage_duration_seconds", "Durée des étapes du chatbot", ("stage",))
+SQL_DUREE = registre.histogramme(
+    "db_query_duration_seconds", "Durée des requêtes SQL", ("operation",))
+SMS_DUREE = registre.histogramme(
+    "sms_send_duration_seconds", "Durée des envois SMS au provider", ("path", "result"))
+MICRO_LOT_TAILLE = registre.histogramme(
+    "chatbot_micro_batch_size", "Messages classés par lot (micro-batching)",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+def actif():
+    return _etat['actif']
+
+
+class span:
+    """
+    Chronométrer un bloc dans un histogramme
+
+        with span(CHATBOT_ETAPE, stage="classement"):
+            ...
+
+    Si l'histogramme a un label `result`, il vaut "ok" ou "error" selon
+    que le bloc a levé une exception.
+    """
+
+    __slots__ = ("histogramme", "labels", "debut")
+
+    def __init__(self, histogramme, **labels):
+        self.histogramme = histogramme
+        self.labels = labels
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if _etat['actif']:
+            if "result" in self.histogramme.labels:
+                self.labels["result"] = "ok" if exc_type is None else "error"
+            self.histogramme.observe(time.perf_counter() - self.debut, **self.labels)
+        return False
+
+
+# ============================================================
+# INSTALLATION DANS L'APPLICATION
+# ============================================================
+
+def _ecrire_si_besoin():
+    maintenant = time.monotonic()
+    if maintenant - _etat['derniere_ecriture'] >= INTERVALLE_ECRITURE:
+        _etat['derniere_ecriture'] = maintenant
+        try:
+            ecrire_snapshot()
+        except OSError as e:
+            print("Erreur écriture des métriques :", e)
+
+
+def _fermer():
+    # Arrêt propre du processus : ses valeurs passent dans l'archive
+    try:
+        ecrire_snapshot()
+        archiver_processus(os.getpid())
+    except OSError as e:
+        print("Erreur archivage des métriques :", e)
+
+
+def _apres_fork():
+    # gunicorn --preload : les valeurs mesurées dans le master (create_all,
+    # warm-up) ne doivent pas être comptées une fois par worker
+    registre.reinitialiser()
+    _etat['derniere_ecriture'] = 0.0
+
+
+def installer(app, db):
+    """
+    Brancher les hooks Flask et les événements SQLAlchemy (après db.init_app)
+
+    METRICS_ENABLED=0 désactive toute mesure ; /metrics reste disponible
+    mais vide.
+    """
+    from flask import g, request
+    from sqlalchemy import event
+
+    _etat['actif'] = os.environ.get("METRICS_ENABLED", "1") == "1"
+    if not _etat['actif']:
+        return
+
+    _etat['multi_processus'] = True
+    atexit.register(_fermer)
+    os.register_at_fork(after_in_child=_apres_fork)
+
+    @app.before_request
+    def debut_requete():
+        g._debut_metrique = time.perf_counter()
+
+    @app.after_request
+    def fin_requete(response):
+        debut = g.pop("_debut_metrique", None)
+        if debut is not None:
+            # La règle de routage (et non l'URL) borne le nombre de séries
+            endpoint = request.url_rule.rule if request.url_rule is not None else "inconnu"
+            HTTP_DUREE.observe(time.perf_counter() - debut, method=request.method, endpoint=endpoint)
+            HTTP_REQUETES.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+            _ecrire_si_besoin()
+        return response
+
+    # Le début est porté par le contexte d'exécution : rien ne reste en
+    # mémoire si la requête échoue
+    def avant_sql(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._debut_metrique = time.perf_counter()
+
+    def apres_sql(conn, cursor, statement, parameters, context, executemany):
+        debut = getattr(context, "_debut_metrique", None)
+        if debut is not None:
+            mots = statement.split(None, 1)
+            SQL_DUREE.observe(time.perf_counter() - debut, operation=mots[0].upper() if mots else "?")
+
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", avant_sql)
+        event.listen(db.engine, "after_cursor_execute", apres_sql)
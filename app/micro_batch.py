@@ -0,0 +1,121 @@
+"""
+Micro-batching : regrouper les appels concurrents en un seul lot
+
+Les threads qui soumettent un élément reçoivent une Future ; un thread de
+fond attend quelques millisecondes que d'autres éléments arrivent, appelle
+la fonction de lot une seule fois (une multiplication matricielle au lieu
+de N) puis distribue les résultats.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """File d'éléments traités par lots par un thread de fond"""
+
+    def __init__(self, fonction, max_attente_ms=5, max_lot=64, nom="micro-batch"):
+        """
+        Args:
+            fonction: Fonction de lot, liste d'éléments -> liste de résultats (même ordre)
+            max_attente_ms: Attente maximale après le premier élément d'un lot
+            max_lot: Taille qui déclenche le traitement immédiat du lot
+            nom: Nom du thread
+        """
+        self.fonction = fonction
+        self.max_attente = max_attente_ms / 1000
+        self.max_lot = max_lot
+        self.nom = nom
+        self._file = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.lots = 0
+        self.elements = 0
+        self.erreurs = 0
+        self.plus_grand_lot = 0
+
+    def _demarrer_si_besoin(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Après un fork (gunicorn --preload) le thread du parent
+                # n'existe plus et sa file ne doit pas être partagée
+                self._pid = os.getpid()
+                self._file = queue.Queue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._boucle, name=self.nom, daemon=True)
+                self._thread.start()
+
+    def soumettre(self, element):
+        """
+        Ajouter un élément au prochain lot
+
+        Returns:
+            Future: Résultat de l'élément
+        """
+        self._demarrer_si_besoin()
+        future = Future()
+        self._file.put((element, future))
+        return future
+
+    def executer(self, element, timeout=None):
+        """Soumettre un élément et attendre son résultat"""
+        return self.soumettre(element).result(timeout)
+
+    def _collecter(self):
+        lot = [self._file.get()]
+        limite = time.monotonic() + self.max_attente
+        while len(lot) < self.max_lot:
+            reste = limite - time.monotonic()
+            if reste <= 0:
+                break
+            try:
+                lot.append(self._file.get(timeout=reste))
+            except queue.Empty:
+                break
+        # Ce qui est déjà arrivé part dans ce lot, sans attente
+        while len(lot) < self.max_lot:
+            try:
+                lot.append(self._file.get_nowait())
+            except queue.Empty:
+                break
+        return lot
+
+    def _boucle(self):
+        from app import metrics
+
+        while True:
+            lot = self._collecter()
+            elements = [element for element, _ in lot]
+            try:
+                resultats = self.fonction(elements)
+            except Exception as e:
+                self.erreurs += 1
+                for _, future in lot:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), resultat in zip(lot, resultats):
+                future.set_result(resultat)
+
+            self.lots += 1
+            self.elements += len(lot)
+            self.plus_grand_lot = max(self.plus_grand_lot, len(lot))
+            if metrics.actif():
+                metrics.MICRO_LOT_TAILLE.observe(len(lot))
+
+    def stats(self):
+        return {
+            'lots': self.lots,
+            'elements': self.elements,
+            'taille_moyenne': round(self.elements / self.lots, 2) if self.lots else 0.0,
+            'plus_grand_lot': self.plus_grand_lot,
+            'en_attente': self._file.qsize(),
+            'erreurs': self.erreurs,
+            'max_attente_ms': self.max_attente * 1000,
+            'max_lot': self.max_lot,
+        }
@@ -0,0 +1,172 @@
+"""
+Mises à jour du schéma des bases existantes et audit des plans de requêtes
+
+`db.create_all()` crée les tables manquantes mais ne touche pas aux tables
+déjà présentes : les colonnes et index ajoutés aux modèles après coup
+doivent être créés ici.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+
+def creer_colonnes_manquantes(db):
+    """
+    Ajouter les colonnes déclarées sur les modèles mais absentes de la base
+
+    `ALTER TABLE ... ADD COLUMN` : la colonne doit être nullable ou avoir
+    un `server_default` (les lignes existantes reçoivent cette valeur).
+    Un autre worker qui a ajouté la colonne entre-temps n'est pas une
+    erreur.
+
+    Returns:
+        list: Colonnes créées ('table.colonne')
+    """
+    inspecteur = inspect(db.engine)
+    crees = []
+
+    for table in db.metadata.sorted_tables:
+        if not inspecteur.has_table(table.name):
+            continue
+        existantes = {colonne['name'] for colonne in inspecteur.get_columns(table.name)}
+        for colonne in table.columns:
+            if colonne.name in existantes:
+                continue
+            ddl = CreateColumn(colonne).compile(dialect=db.engine.dialect)
+            try:
+                with db.engine.begin() as connexion:
+                    connexion.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+            except DatabaseError:
+                if colonne.name not in {c['name'] for c in inspect(db.engine).get_columns(table.name)}:
+                    raise
+                continue
+            crees.append(f"{table.name}.{colonne.name}")
+
+    if crees:
+        db.engine.dispose()
+
+    return crees
+
+
+def creer_index_manquants(db):
+    """
+    Créer les index déclarés sur les modèles mais absents de la base
+
+    `CREATE INDEX IF NOT EXISTS` : plusieurs workers qui démarrent en même
+    temps ne se gênent pas. Sur une grosse table la création peut prendre
+    du temps ; lancer plutôt `flask db-upgrade` avant le déploiement.
+
+    Returns:
+        list: Noms des index créés
+    """
+    inspecteur = inspect(db.engine)
+    crees = []
+
+    with db.engine.begin() as connexion:
+        for table in db.metadata.sorted_tables:
+            if not inspecteur.has_table(table.name):
+                continue
+            existants = {index['name'] for index in inspecteur.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existants:
+                    connexion.execute(CreateIndex(index, if_not_exists=True))
+                    crees.append(index.name)
+
+    if crees:
+        # Les connexions déjà ouvertes gardent l'ancien schéma en cache :
+        # on les ferme pour que le planificateur voie les nouveaux index
+        db.engine.dispose()
+
+    return crees
+
+
+# ============================================================
+# AUDIT DES PLANS (SQLite)
+# ============================================================
+
+def requetes_critiques():
+    """
+    Les requêtes chaudes de l'application, construites comme dans le code appelant
+
+    Pages d'historique via `pagination.requete_keyset` (curseur d'exemple),
+    lots et rapport de la rétention via les `Politique`, réservations du
+    scheduler et de la file SMS.
+    """
+    from app import db
+    from app.models import Message, Historique, Rappel, OTP, Notification, SmsJob
+    from app.pagination import LIMITE_DEFAUT, decoder_curseur, encoder_curseur, requete_keyset
+    from app.retention import TAILLE_LOT, politiques
+    from app.scheduler import PROCESSING_TIMEOUT as TIMEOUT_RAPPELS
+    from app.sms_queue import PROCESSING_TIMEOUT as TIMEOUT_JOBS
+
+    maintenant = datetime.utcnow()
+    curseur = decoder_curseur(encoder_curseur(maintenant, 1))
+    messages = Message.query.filter_by(user_id=1)
+    historiques = Historique.query.filter_by(user_id=1)
+
+    requetes = {
+        'history': requete_keyset(messages, Message.timestamp, Message.id, LIMITE_DEFAUT),
+        'history_before': requete_keyset(messages, Message.timestamp, Message.id, LIMITE_DEFAUT, avant=curseur),
+        'history_since': requete_keyset(messages, Message.timestamp, Message.id, LIMITE_DEFAUT,
+                                        apres=curseur, recent_d_abord=False),
+        'historique': requete_keyset(historiques, Historique.timestamp, Historique.id, 20),
+        'historique_cursor': requete_keyset(historiques, Historique.timestamp, Historique.id, 20, avant=curseur),
+        'otp_verification': OTP.query.filter_by(user_id=1, code='000000', verified=False),
+        'rappels_utilisateur': Rappel.query.filter_by(user_id=1).order_by(Rappel.date_rappel),
+        'rappels_dus': db.session.query(Rappel.id)
+            .filter(Rappel.statut == 'pending', Rappel.date_rappel <= maintenant)
+            .filter(db.or_(Rappel.prochain_essai_at.is_(None), Rappel.prochain_essai_at <= maintenant))
+            .order_by(Rappel.date_rappel),
+        'rappels_abandonnes': db.session.query(Rappel.id, Rappel.tentatives, Rappel.updated_at)
+            .filter(Rappel.statut == 'processing', Rappel.updated_at < maintenant - TIMEOUT_RAPPELS),
+        'sms_jobs_dus': db.session.query(SmsJob.id)
+            .filter(SmsJob.statut == 'pending', SmsJob.prochain_essai_at <= maintenant)
+            .order_by(SmsJob.prochain_essai_at),
+        'sms_jobs_abandonnes': db.session.query(SmsJob.id)
+            .filter(SmsJob.statut == 'processing', SmsJob.updated_at < maintenant - TIMEOUT_JOBS),
+        'notifications_utilisateur': Notification.query.filter_by(user_id=1).order_by(Notification.created_at.desc()),
+    }
+    for nom, politique in politiques().items():
+        requetes[f'retention_{nom}_lot'] = politique.selection_lot(TAILLE_LOT, maintenant)
+        requetes[f'retention_{nom}_dry_run'] = politique.selection_expirees(maintenant)
+    return requetes
+
+
+def _plan_utilise_index(lignes):
+    """Un plan est accepté s'il ne contient aucun parcours complet de table ni tri temporaire"""
+    details = [ligne[-1] for ligne in lignes]
+    scans = [d for d in details if d.startswith("SCAN") and "USING" not in d]
+    tris = [d for d in details if "TEMP B-TREE" in d]
+    return not scans and not tris
+
+
+def auditer_plans(db):
+    """
+    Exécuter `EXPLAIN QUERY PLAN` sur chaque requête chaude
+
+    Returns:
+        list: [{'requete', 'plan', 'utilise_index'}, ...]
+    """
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError("L'audit des plans n'est disponible que pour SQLite")
+
+    resultats = []
+    with db.engine.connect() as connexion:
+        for nom, requete in requetes_critiques().items():
+            # Query ORM ou select() Core (rétention)
+            compilee = getattr(requete, 'statement', requete).compile(dialect=db.engine.dialect)
+            params = tuple(
+                valeur.isoformat(" ") if isinstance(valeur, datetime) else valeur
+                for valeur in (compilee.params[cle] for cle in compilee.positiontup)
+            )
+            lignes = connexion.exec_driver_sql(f"EXPLAIN QUERY PLAN {compilee}", params).all()
+            resultats.append({
+                'requete': nom,
+                'plan': [ligne[-1] for ligne in lignes],
+                'utilise_index': _plan_utilise_index(lignes),
+            })
+
+    return resultats
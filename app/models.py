@@ -2,11 +2,13 @@ from app import db, login_manager
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 
+from app.user_cache import UserCache
 
-# Charger un utilisateur via Flask-Login
+
+# Charger un utilisateur via Flask-Login (cache : voir app/user_cache.py)
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.charger(int(user_id))
 
 
 # ============================
@@ -29,10 +31,21 @@ class User(db.Model, UserMixin):
         return f"User('{self.username}', '{self.country}')"
 
 
+user_cache = UserCache(User)
+user_cache.brancher_session(db.session)
+
+
 # ============================
 #   enregistrement de message
 # ============================
 class Message(db.Model):
+    __table_args__ = (
+        # /api/history : messages d'un utilisateur triés par date
+        db.Index('ix_message_user_timestamp', 'user_id', 'timestamp'),
+        # Rétention : lignes plus anciennes que la limite, tous utilisateurs confondus
+        db.Index('ix_message_timestamp', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -49,6 +62,13 @@ class Message(db.Model):
 # ============================
 class Historique(db.Model):
     """Classe pour enregistrer l'historique des interactions du chatbot"""
+    __table_args__ = (
+        # /api/historique : historique d'un utilisateur, plus récent d'abord
+        db.Index('ix_historique_user_timestamp', 'user_id', 'timestamp'),
+        # Rétention : lignes plus anciennes que la limite, tous utilisateurs confondus
+        db.Index('ix_historique_timestamp', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User', backref=db.backref('historiques', lazy=True))
@@ -63,11 +83,63 @@ class Historique(db.Model):
         return f"Historique(user_id={self.user_id}, timestamp={self.timestamp})"
 
 
+# ============================
+#   État de conversation du chatbot
+# ============================
+class EtatDialogue(db.Model):
+    """Classe pour mémoriser l'étape de conversation en cours de chaque utilisateur"""
+    __tablename__ = 'etat_dialogue'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    etat = db.Column(db.String(50), nullable=False)  # attente_date_grossesse, attente_date_naissance
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"EtatDialogue(user_id={self.user_id}, etat='{self.etat}')"
+
+
+# ============================
+#   Limitation de débit (token buckets partagés entre workers)
+# ============================
+class RateLimitBucket(db.Model):
+    """Seau de jetons d'une clé (ex. 'otp_send:user:42'), voir app/rate_limit.py"""
+    __tablename__ = 'rate_limit_bucket'
+
+    cle = db.Column(db.String(120), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # time.time() du dernier jeton pris
+
+    def __repr__(self):
+        return f"RateLimitBucket(cle='{self.cle}', tokens={self.tokens:.2f})"
+
+
+# ============================
+#   Verrous de tâches (une seule exécution à la fois entre processus)
+# ============================
+class VerrouTache(db.Model):
+    """Bail d'une tâche de fond (ex. 'retention'), voir app/retention.py"""
+    __tablename__ = 'verrou_tache'
+
+    nom = db.Column(db.String(50), primary_key=True)
+    detenteur = db.Column(db.String(120), nullable=False)  # hôte:pid:jeton
+    expire_at = db.Column(db.Float, nullable=False)  # time.time() de fin du bail
+
+    def __repr__(self):
+        return f"VerrouTache(nom='{self.nom}', detenteur='{self.detenteur}')"
+
+
 # ============================
 #   RAPPEL twilio
 # ============================
 class Rappel(db.Model):
     """Classe pour gérer les rappels Twilio (SMS)"""
+    __table_args__ = (
+        # Sélection des rappels dus par le scheduler (statut = ? AND date_rappel <= ?)
+        db.Index('ix_rappel_statut_date', 'statut', 'date_rappel'),
+        # /api/rappel/liste : rappels d'un utilisateur triés par date
+        db.Index('ix_rappel_user_date', 'user_id', 'date_rappel'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User', backref=db.backref('rappels', lazy=True))
@@ -75,12 +147,16 @@ class Rappel(db.Model):
     titre = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
     date_rappel = db.Column(db.DateTime, nullable=False)
-    statut = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, snoozed, completed
+    statut = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, queued, sent, failed, snoozed, completed
     
     # Pour Twilio
     numero_telephone = db.Column(db.String(20), nullable=False)
     message_sms = db.Column(db.Text, nullable=True)
     sid_twilio = db.Column(db.String(100), nullable=True)  # SID du message envoyé
+
+    # Envois interrompus (worker arrêté en 'processing') : voir scheduler.reclamer_rappels
+    tentatives = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    prochain_essai_at = db.Column(db.DateTime, nullable=True)  # None : dès que date_rappel est passée
     
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -107,6 +183,13 @@ class Rappel(db.Model):
 # ============================
 class OTP(db.Model):
     """Classe pour gérer les codes OTP (One-Time Password)"""
+    __table_args__ = (
+        # Vérification : OTP non vérifié d'un utilisateur pour un code donné
+        db.Index('ix_otp_user_code_verified', 'user_id', 'code', 'verified'),
+        # Purge par lots des OTP expirés
+        db.Index('ix_otp_expire_at', 'expire_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User', backref=db.backref('otps', lazy=True))
@@ -141,6 +224,13 @@ class OTP(db.Model):
 # ============================
 class Notification(db.Model):
     """Classe pour gérer les notifications SMS"""
+    __table_args__ = (
+        # /api/notification/liste : notifications d'un utilisateur, plus récentes d'abord
+        db.Index('ix_notification_user_created', 'user_id', 'created_at'),
+        # Rétention : notifications plus anciennes que la limite
+        db.Index('ix_notification_created', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User', backref=db.backref('notifications', lazy=True))
@@ -167,4 +257,49 @@ class Notification(db.Model):
         """Marquer la notification comme lue"""
         self.lu = True
         self.lu_at = datetime.utcnow()
-        db.session.commit() 
\ No newline at end of file
+        db.session.commit()
+
+
+# ============================
+#   FILE D'ENVOI SMS
+# ============================
+class SmsJob(db.Model):
+    """Classe pour la file persistante des SMS sortants (envoi asynchrone)"""
+    __tablename__ = 'sms_job'
+    __table_args__ = (
+        db.Index('ix_sms_job_statut_essai', 'statut', 'prochain_essai_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(20), nullable=False)  # otp, rappel, notification
+    ref_id = db.Column(db.Integer, nullable=True)  # ID de l'OTP / du rappel / de la notification
+
+    destinataire = db.Column(db.String(20), nullable=False)
+    corps = db.Column(db.Text, nullable=False)
+
+    statut = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, sent, failed
+    tentatives = db.Column(db.Integer, nullable=False, default=0)
+    max_tentatives = db.Column(db.Integer, nullable=False, default=5)
+    prochain_essai_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    derniere_erreur = db.Column(db.Text, nullable=True)
+
+    sid_twilio = db.Column(db.String(100), nullable=True)  # SID du message envoyé
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"SmsJob(id={self.id}, type='{self.type}', statut='{self.statut}')"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'ref_id': self.ref_id,
+            'statut': self.statut,
+            'tentatives': self.tentatives,
+            'prochain_essai_at': self.prochain_essai_at.isoformat(),
+            'derniere_erreur': self.derniere_erreur,
+            'sid': self.sid_twilio,
+            'created_at': self.created_at.isoformat()
+        }
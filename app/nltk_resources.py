@@ -0,0 +1,115 @@
+"""
+Ressources NLTK hors-ligne :
+- Prefetch : téléchargement des ressources dans un bundle local + manifeste
+  (étape `release` du Procfile, ou à la construction de l'image)
+- Démarrage : simple vérification du manifeste (aucun accès réseau) ; en
+  production, create_app refuse de démarrer si le bundle est incomplet
+- Warm-up : chargement de punkt et WordNet avant la première requête
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+
+import nltk
+
+
+# Dossier du bundle de données NLTK (vendorisé dans l'image / sur Render)
+NLTK_PATH = os.environ.get("NLTK_DATA_DIR", os.path.join(os.getcwd(), "nltk_data"))
+MANIFEST_PATH = os.path.join(NLTK_PATH, "manifest.json")
+
+# Ressource -> chemin attendu dans le bundle
+RESSOURCES = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "wordnet": "corpora/wordnet",
+    "omw-1.4": "corpora/omw-1.4",
+    "stopwords": "corpora/stopwords",
+}
+
+
+def configurer_chemin(nltk_path=NLTK_PATH):
+    """Ajouter le bundle au chemin de recherche de NLTK"""
+    if nltk_path not in nltk.data.path:
+        nltk.data.path.append(nltk_path)
+
+
+def _present(nltk_path, chemin):
+    """Une ressource est présente décompressée ou sous forme de .zip"""
+    base = os.path.join(nltk_path, chemin)
+    return os.path.exists(base) or os.path.exists(base + ".zip")
+
+
+def prefetch(nltk_path=NLTK_PATH):
+    """
+    Télécharger toutes les ressources dans le bundle et écrire le manifeste
+
+    Returns:
+        dict: Le manifeste écrit
+    """
+    os.makedirs(nltk_path, exist_ok=True)
+
+    ressources = {}
+    for nom, chemin in RESSOURCES.items():
+        if not _present(nltk_path, chemin):
+            if not nltk.download(nom, download_dir=nltk_path, quiet=True):
+                raise RuntimeError(f"Téléchargement NLTK impossible : {nom}")
+        ressources[nom] = chemin
+
+    manifest = {
+        "nltk_version": nltk.__version__,
+        "created_at": datetime.utcnow().isoformat(),
+        "ressources": ressources,
+    }
+    with open(os.path.join(nltk_path, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def verifier_manifest(nltk_path=NLTK_PATH):
+    """
+    Vérifier (sans réseau) que le bundle contient toutes les ressources
+
+    Returns:
+        list: Noms des ressources manquantes (vide si le bundle est complet)
+    """
+    try:
+        with open(os.path.join(nltk_path, "manifest.json"), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return list(RESSOURCES)
+
+    ressources = manifest.get("ressources", {})
+    return [
+        nom for nom, chemin in RESSOURCES.items()
+        if nom not in ressources or not _present(nltk_path, chemin)
+    ]
+
+
+def rechauffer():
+    """
+    Charger punkt et WordNet (lazy par défaut) avant la première requête
+
+    Returns:
+        dict: Durée de chargement de chaque ressource en millisecondes
+    """
+    from nltk.corpus import wordnet
+
+    durees = {}
+
+    debut = time.perf_counter()
+    nltk.word_tokenize("bonjour")
+    durees["punkt"] = round((time.perf_counter() - debut) * 1000, 1)
+
+    debut = time.perf_counter()
+    wordnet.ensure_loaded()
+    nltk.stem.WordNetLemmatizer().lemmatize("vaccins")
+    durees["wordnet"] = round((time.perf_counter() - debut) * 1000, 1)
+
+    return durees
+
+
+if __name__ == "__main__":
+    from app.commands import nltk_prefetch
+    nltk_prefetch()
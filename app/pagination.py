@@ -0,0 +1,86 @@
+"""
+Pagination par curseur (keyset) sur (timestamp, id)
+
+Contrairement à OFFSET, chaque page est une recherche dans l'index
+(user_id, timestamp) à partir du dernier élément vu : le coût ne dépend
+pas de la profondeur de la page.
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+LIMITE_DEFAUT = 50
+LIMITE_MAX = 500
+
+
+def encoder_curseur(timestamp, id):
+    """Curseur opaque pour la position (timestamp, id)"""
+    brut = f"{timestamp.isoformat()}|{id}".encode("utf-8")
+    return base64.urlsafe_b64encode(brut).decode("ascii")
+
+
+def decoder_curseur(curseur):
+    """
+    Décoder un curseur
+
+    Raises:
+        ValueError: Curseur invalide
+    """
+    try:
+        brut = base64.urlsafe_b64decode(curseur.encode("ascii")).decode("utf-8")
+        timestamp, id = brut.split("|")
+        return datetime.fromisoformat(timestamp), int(id)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Curseur invalide : {curseur}") from e
+
+
+def lire_limite(valeur, defaut=LIMITE_DEFAUT):
+    """Taille de page demandée, bornée à [1, LIMITE_MAX]"""
+    if valeur is None:
+        return defaut
+    return max(1, min(int(valeur), LIMITE_MAX))
+
+
+def requete_keyset(requete, colonne_ts, colonne_id, limite, avant=None, apres=None, recent_d_abord=True):
+    """
+    Construire la requête d'une page triée par (timestamp, id)
+
+    Args:
+        requete: Requête déjà filtrée (par utilisateur)
+        colonne_ts, colonne_id: Colonnes de la clé de tri
+        limite: Taille de la page
+        avant: Curseur décodé, ne garder que les éléments plus anciens
+        apres: Curseur décodé, ne garder que les éléments plus récents
+        recent_d_abord: Ordre de lecture (plus récent ou plus ancien d'abord)
+
+    Returns:
+        Query: limitée à `limite + 1` lignes (la dernière signale une page suivante)
+    """
+    cle = tuple_(colonne_ts, colonne_id)
+    if avant is not None:
+        requete = requete.filter(cle < tuple_(*avant))
+    if apres is not None:
+        requete = requete.filter(cle > tuple_(*apres))
+
+    if recent_d_abord:
+        requete = requete.order_by(colonne_ts.desc(), colonne_id.desc())
+    else:
+        requete = requete.order_by(colonne_ts, colonne_id)
+
+    return requete.limit(limite + 1)
+
+
+def page_keyset(requete, colonne_ts, colonne_id, limite, avant=None, apres=None, recent_d_abord=True):
+    """
+    Lire une page d'une requête triée par (timestamp, id)
+
+    Args: voir requete_keyset
+
+    Returns:
+        tuple: (éléments, il_en_reste)
+    """
+    elements = requete_keyset(requete, colonne_ts, colonne_id, limite, avant, apres, recent_d_abord).all()
+    return elements[:limite], len(elements) > limite
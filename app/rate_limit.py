@@ -0,0 +1,221 @@
+"""
+Limitation de débit par token bucket
+
+- TokenBucket : un seau (ex. débit d'envoi vers Twilio)
+- MemoryRateLimiter : un seau par clé (utilisateur, numéro...) dans le processus
+- SQLiteRateLimiter : un seau par clé dans la table `rate_limit_bucket`,
+  partagé par tous les workers gunicorn
+"""
+
+import os
+import threading
+import time
+
+from app.cache import LRUCache
+
+
+class TokenBucket:
+    """Token bucket thread-safe : `rate` jetons/seconde, au plus `capacity` en réserve"""
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate: Jetons ajoutés par seconde (débit moyen autorisé)
+            capacity: Taille de la réserve (rafale maximale), par défaut `rate`
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _remplir(self):
+        maintenant = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (maintenant - self._last) * self.rate)
+        self._last = maintenant
+
+    def try_acquire(self, tokens=1):
+        """Prendre des jetons sans attendre (False si la réserve est insuffisante)"""
+        with self._lock:
+            self._remplir()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Prendre des jetons, en attendant qu'ils soient disponibles"""
+        while True:
+            with self._lock:
+                self._remplir()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                attente = (tokens - self._tokens) / self.rate
+            time.sleep(attente)
+
+    def attente(self, tokens=1):
+        """Secondes avant que `tokens` jetons soient disponibles (0 s'ils le sont déjà)"""
+        with self._lock:
+            self._remplir()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def rendre(self, tokens=1):
+        """Remettre des jetons pris pour une opération finalement refusée"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + tokens)
+
+
+# ============================================================
+# LIMITES PAR CLÉ
+# ============================================================
+
+class MemoryRateLimiter:
+    """Un token bucket par clé, en mémoire (LRU borné)"""
+
+    def __init__(self, rate, capacity, maxsize=10000):
+        """
+        Args:
+            rate: Jetons rendus par seconde
+            capacity: Rafale maximale par clé
+            maxsize: Nombre maximum de clés suivies
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        # Un seau inutilisé pendant capacity/rate secondes est plein : son
+        # expiration équivaut à le recréer
+        self._seaux = LRUCache(maxsize=maxsize, ttl=self.capacity / self.rate)
+        self._lock = threading.Lock()
+        self.refus = 0
+
+    def _seau(self, cle):
+        with self._lock:
+            seau = self._seaux.get(cle)
+            if seau is None:
+                seau = TokenBucket(self.rate, self.capacity)
+            # Réinséré à chaque accès : l'expiration part du dernier usage
+            self._seaux.set(cle, seau)
+            return seau
+
+    def autoriser(self, cle):
+        """
+        Prendre un jeton pour la clé
+
+        Returns:
+            tuple: (autorisé, secondes avant le prochain jeton si refusé)
+        """
+        seau = self._seau(cle)
+        if seau.try_acquire():
+            return True, 0.0
+        with self._lock:
+            self.refus += 1
+        return False, seau.attente()
+
+    def rendre(self, cle):
+        """Remettre un jeton pris pour une opération finalement refusée"""
+        self._seau(cle).rendre()
+
+    def stats(self):
+        return {'backend': 'memory', 'rate': self.rate, 'capacity': self.capacity,
+                'cles': len(self._seaux), 'refus': self.refus}
+
+
+class SQLiteRateLimiter:
+    """
+    Un token bucket par clé dans la base (table `rate_limit_bucket`)
+
+    Le remplissage et la prise du jeton sont faits par un seul UPSERT
+    (SQLite >= 3.35 ou Postgres) : deux workers ne peuvent pas prendre le
+    même jeton. Un seau en mémoire placé devant évite l'écriture quand le
+    refus est certain : le seau local n'a jamais accordé plus de jetons
+    que le seau partagé.
+    """
+
+    def __init__(self, rate, capacity, maxsize=10000):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.local = MemoryRateLimiter(rate, capacity, maxsize)
+        self.refus = 0
+
+    def autoriser(self, cle):
+        """
+        Prendre un jeton pour la clé
+
+        Returns:
+            tuple: (autorisé, secondes avant le prochain jeton si refusé)
+        """
+        from app import db
+
+        autorise, attente = self.local.autoriser(cle)
+        if not autorise:
+            return False, attente
+
+        plafond = "MIN" if db.engine.dialect.name == "sqlite" else "LEAST"
+        remplis = f"{plafond}(:capacite, rate_limit_bucket.tokens + (:maintenant - rate_limit_bucket.updated_at) * :rate)"
+        maintenant = time.time()
+        ligne = db.session.execute(
+            db.text(
+                "INSERT INTO rate_limit_bucket (cle, tokens, updated_at) VALUES (:cle, :capacite - 1, :maintenant) "
+                f"ON CONFLICT (cle) DO UPDATE SET tokens = {remplis} - 1, updated_at = :maintenant "
+                f"WHERE {remplis} >= 1 "
+                "RETURNING tokens"
+            ),
+            {'cle': cle, 'capacite': self.capacity, 'rate': self.rate, 'maintenant': maintenant},
+        ).first()
+        db.session.commit()
+        if ligne is not None:
+            return True, 0.0
+
+        # Refusé par le seau partagé : le jeton local est rendu
+        self.local.rendre(cle)
+        self.refus += 1
+        tokens = db.session.execute(
+            db.text("SELECT tokens, updated_at FROM rate_limit_bucket WHERE cle = :cle"), {'cle': cle}
+        ).first()
+        if tokens is None:
+            return False, 1.0 / self.rate
+        disponibles = min(self.capacity, tokens[0] + (maintenant - tokens[1]) * self.rate)
+        return False, max(0.0, (1 - disponibles) / self.rate)
+
+    def rendre(self, cle):
+        """Remettre un jeton pris pour une opération finalement refusée"""
+        from app import db
+
+        plafond = "MIN" if db.engine.dialect.name == "sqlite" else "LEAST"
+        db.session.execute(
+            db.text(f"UPDATE rate_limit_bucket SET tokens = {plafond}(:capacite, tokens + 1) WHERE cle = :cle"),
+            {'cle': cle, 'capacite': self.capacity},
+        )
+        db.session.commit()
+        self.local.rendre(cle)
+
+    def purger(self):
+        """Supprimer les seaux pleins (inutilisés depuis capacity/rate secondes)"""
+        from app import db
+
+        limite = time.time() - self.capacity / self.rate
+        supprimes = db.session.execute(
+            db.text("DELETE FROM rate_limit_bucket WHERE updated_at < :limite"), {'limite': limite}
+        ).rowcount
+        db.session.commit()
+        return supprimes
+
+    def stats(self):
+        return {'backend': 'sqlite', 'rate': self.rate, 'capacity': self.capacity,
+                'refus': self.refus, 'refus_locaux': self.local.refus}
+
+
+def creer_limiteur(nombre, periode, backend=None):
+    """
+    Limiteur par clé : `nombre` opérations par `periode` secondes et par clé
+
+    Args:
+        backend: 'memory' ou 'sqlite' (par défaut : variable RATE_LIMIT_BACKEND)
+    """
+    backend = backend or os.environ.get('RATE_LIMIT_BACKEND', 'sqlite')
+    if backend == 'memory':
+        return MemoryRateLimiter(nombre / periode, nombre)
+    if backend == 'sqlite':
+        return SQLiteRateLimiter(nombre / periode, nombre)
+
+    raise ValueError(f"Backend de limitation de débit inconnu : {backend}")
@@ -0,0 +1,378 @@
+"""
+Rétention des données : purge et archivage des lignes anciennes
+
+Une politique par table :
+- otp : supprimés OTP_RETENTION_H heures après leur expiration
+- notification : supprimées après NOTIFICATION_RETENTION_J jours
+- message, historique : archivés puis supprimés après
+  MESSAGE_RETENTION_J jours
+
+Les lignes sont traitées par petits lots (une transaction courte par lot,
+une pause entre deux) : le verrou d'écriture SQLite n'est jamais tenu
+longtemps et les requêtes du chat passent entre les lots.
+
+Archives : instance/archives/<table>/<AAAA-MM>.ndjson.gz, une ligne JSON
+par enregistrement, regroupées par mois de la donnée. Chaque lot ajoute un
+membre gzip au fichier (lisible avec zcat / gzip.open) ; il est écrit et
+synchronisé sur disque avant la suppression des lignes. Une interruption
+entre les deux peut archiver un lot deux fois, jamais le perdre.
+
+Une seule purge à la fois, tous processus confondus : executer() prend un
+bail dans la table `verrou_tache` (renouvelé à chaque lot) et ne fait rien
+si un autre processus le détient (scheduler embarqué dans plusieurs
+workers, `flask retention` lancé en parallèle...). Sans ce bail, deux
+processus liraient le même lot et l'archiveraient deux fois.
+
+Après la purge, `PRAGMA incremental_vacuum` rend au système les pages
+libérées (bases en auto_vacuum=INCREMENTAL, voir activer_auto_vacuum).
+"""
+
+import gzip
+import json
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, func, select
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARCHIVE_DIR = os.environ.get(
+    "RETENTION_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(BASE_DIR), "instance", "archives"),
+)
+
+TAILLE_LOT = int(os.environ.get("RETENTION_BATCH", 500))
+PAUSE_ENTRE_LOTS = float(os.environ.get("RETENTION_PAUSE_MS", 50)) / 1000
+PAGES_VACUUM = int(os.environ.get("RETENTION_VACUUM_PAGES", 2000))
+# Durée du bail : un détenteur arrêté sans le libérer bloque la purge au plus ce temps
+DUREE_VERROU = float(os.environ.get("RETENTION_VERROU_S", 900))
+
+MODES_AUTO_VACUUM = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+class Politique:
+    """Règle de rétention d'une table"""
+
+    def __init__(self, nom, modele, colonne, age, archiver=False):
+        """
+        Args:
+            nom: Nom de la politique (nom de la table)
+            modele: Modèle SQLAlchemy
+            colonne: Nom de la colonne date comparée à la limite
+            age: timedelta au-delà duquel une ligne est traitée
+            archiver: Écrire les lignes dans l'archive avant de les supprimer
+        """
+        self.nom = nom
+        self.modele = modele
+        self.colonne = colonne
+        self.age = age
+        self.archiver = archiver
+
+    @property
+    def table(self):
+        return self.modele.__table__
+
+    def limite(self, maintenant=None):
+        return (maintenant or datetime.utcnow()) - self.age
+
+    def condition(self, maintenant=None):
+        return self.table.c[self.colonne] < self.limite(maintenant)
+
+    def selection_lot(self, taille_lot, maintenant=None):
+        """
+        SELECT du prochain lot : lignes complètes si elles sont archivées, ids sinon
+
+        Parcours de l'index sur la colonne date (ix_<table>_<colonne>) dans
+        son ordre : seules les lignes expirées sont lues, sans tri, et une
+        table sans ligne expirée coûte une seule descente d'index.
+        """
+        table = self.table
+        colonnes = [table] if self.archiver else [table.c.id]
+        return (
+            select(*colonnes).where(self.condition(maintenant))
+            .order_by(table.c[self.colonne], table.c.id).limit(taille_lot)
+        )
+
+    def selection_expirees(self, maintenant=None):
+        """SELECT (nombre, plus ancienne date) des lignes expirées (rapport --dry-run)"""
+        return select(func.count(), func.min(self.table.c[self.colonne])).where(self.condition(maintenant))
+
+
+def politiques():
+    """Politiques configurées (âges lus dans l'environnement)"""
+    from app.models import OTP, Notification, Message, Historique
+
+    age_messages = timedelta(days=float(os.environ.get("MESSAGE_RETENTION_J", 365)))
+    liste = [
+        Politique("otp", OTP, "expire_at", timedelta(hours=float(os.environ.get("OTP_RETENTION_H", 24)))),
+        Politique("notification", Notification, "created_at",
+                  timedelta(days=float(os.environ.get("NOTIFICATION_RETENTION_J", 90)))),
+        Politique("message", Message, "timestamp", age_messages, archiver=True),
+        Politique("historique", Historique, "timestamp", age_messages, archiver=True),
+    ]
+    return {politique.nom: politique for politique in liste}
+
+
+class Verrou:
+    """
+    Bail exclusif sur une tâche, partagé entre processus (table `verrou_tache`)
+
+    Prise et renouvellement en un seul UPSERT conditionnel (SQLite >= 3.35
+    ou Postgres) : la ligne n'est écrite que si le bail a expiré ou
+    appartient déjà à ce détenteur.
+    """
+
+    def __init__(self, nom, duree=DUREE_VERROU):
+        self.nom = nom
+        self.duree = duree
+        self.detenteur = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquerir(self):
+        """
+        Prendre ou renouveler le bail
+
+        Returns:
+            bool: Bail détenu par ce processus
+        """
+        from app import db
+
+        maintenant = time.time()
+        ligne = db.session.execute(
+            db.text(
+                "INSERT INTO verrou_tache (nom, detenteur, expire_at) VALUES (:nom, :detenteur, :expire_at) "
+                "ON CONFLICT (nom) DO UPDATE SET detenteur = :detenteur, expire_at = :expire_at "
+                "WHERE verrou_tache.expire_at < :maintenant OR verrou_tache.detenteur = :detenteur "
+                "RETURNING detenteur"
+            ),
+            {'nom': self.nom, 'detenteur': self.detenteur, 'expire_at': maintenant + self.duree, 'maintenant': maintenant},
+        ).first()
+        db.session.commit()
+        return ligne is not None
+
+    prolonger = acquerir
+
+    def liberer(self):
+        from app import db
+
+        db.session.execute(
+            db.text("DELETE FROM verrou_tache WHERE nom = :nom AND detenteur = :detenteur"),
+            {'nom': self.nom, 'detenteur': self.detenteur},
+        )
+        db.session.commit()
+
+
+# ============================================================
+# ARCHIVES
+# ============================================================
+
+def _json(valeur):
+    if isinstance(valeur, (datetime, date)):
+        return valeur.isoformat()
+    raise TypeError(f"Type non sérialisable : {type(valeur).__name__}")
+
+
+def chemin_archive(nom, mois, dossier=None):
+    return os.path.join(dossier or ARCHIVE_DIR, nom, f"{mois}.ndjson.gz")
+
+
+def archiver_lignes(politique, lignes, dossier=None):
+    """
+    Ajouter des lignes aux archives de la table (un fichier par mois)
+
+    Returns:
+        list: Fichiers modifiés
+    """
+    par_mois = defaultdict(list)
+    for ligne in lignes:
+        valeur = ligne[politique.colonne]
+        par_mois[valeur.strftime("%Y-%m") if valeur else "sans-date"].append(ligne)
+
+    fichiers = []
+    for mois, groupe in sorted(par_mois.items()):
+        chemin = chemin_archive(politique.nom, mois, dossier)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        contenu = "".join(json.dumps(dict(ligne), ensure_ascii=False, default=_json) + "\n" for ligne in groupe)
+        # Mode ajout : chaque lot est un membre gzip complet
+        with open(chemin, "ab") as file:
+            file.write(gzip.compress(contenu.encode("utf-8")))
+            file.flush()
+            os.fsync(file.fileno())
+        fichiers.append(chemin)
+    return fichiers
+
+
+# ============================================================
+# PURGE
+# ============================================================
+
+def appliquer(politique, taille_lot=TAILLE_LOT, pause=PAUSE_ENTRE_LOTS, dossier_archive=None, maintenant=None,
+              verrou=None):
+    """
+    Traiter les lignes expirées d'une table, lot par lot
+
+    Args:
+        verrou: Verrou détenu, renouvelé avant chaque lot ; s'il a été perdu
+            (bail expiré puis repris ailleurs), le traitement s'arrête
+
+    Returns:
+        dict: {'table', 'supprimees', 'archivees', 'lots', 'fichiers', 'duree_s', 'interrompu'}
+    """
+    from app import db
+
+    debut = time.perf_counter()
+    table = politique.table
+    selection = politique.selection_lot(taille_lot, maintenant or datetime.utcnow())
+    resultat = {'table': politique.nom, 'supprimees': 0, 'archivees': 0, 'lots': 0, 'fichiers': [],
+                'interrompu': False}
+
+    while True:
+        if verrou is not None and not verrou.prolonger():
+            resultat['interrompu'] = True
+            break
+        if politique.archiver:
+            lignes = [dict(ligne) for ligne in db.session.execute(selection).mappings()]
+            ids = [ligne['id'] for ligne in lignes]
+        else:
+            ids = list(db.session.execute(selection).scalars())
+        if not ids:
+            db.session.rollback()
+            break
+
+        if politique.archiver:
+            for chemin in archiver_lignes(politique, lignes, dossier_archive):
+                if chemin not in resultat['fichiers']:
+                    resultat['fichiers'].append(chemin)
+            resultat['archivees'] += len(ids)
+
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        resultat['supprimees'] += len(ids)
+        resultat['lots'] += 1
+
+        if len(ids) < taille_lot:
+            break
+        if pause:
+            time.sleep(pause)
+
+    resultat['duree_s'] = round(time.perf_counter() - debut, 3)
+    return resultat
+
+
+def vacuum_incremental(pages=PAGES_VACUUM):
+    """
+    Rendre jusqu'à `pages` pages libres au système (SQLite en auto_vacuum=INCREMENTAL)
+
+    Returns:
+        dict: {'mode', 'pages_liberees', 'pages_libres'} (mode None hors SQLite)
+    """
+    from app import db
+
+    if db.engine.dialect.name != "sqlite":
+        return {'mode': None, 'pages_liberees': 0, 'pages_libres': None}
+
+    with db.engine.connect() as connexion:
+        mode = connexion.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        avant = connexion.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if mode == 2:
+            # Via execute(), sqlite3 n'avance que d'une étape dans un pragma
+            # sans colonnes (une seule page libérée) : executescript va au bout
+            connexion.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        apres = connexion.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+    return {'mode': MODES_AUTO_VACUUM.get(mode, mode), 'pages_liberees': avant - apres, 'pages_libres': apres}
+
+
+def activer_auto_vacuum():
+    """
+    Passer une base SQLite existante en auto_vacuum=INCREMENTAL
+
+    Demande un VACUUM complet (copie de toute la base, verrou exclusif) :
+    à faire une fois, application arrêtée. Les bases créées avec le profil
+    `production` sont déjà en mode incrémental.
+    """
+    from app import db
+
+    with db.engine.connect() as connexion:
+        connexion.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        connexion.exec_driver_sql("VACUUM")
+        return connexion.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+
+
+def executer(noms=None, taille_lot=TAILLE_LOT, pause=PAUSE_ENTRE_LOTS, vacuum=True, dossier_archive=None):
+    """
+    Appliquer les politiques (toutes, ou celles nommées) puis le vacuum incrémental
+
+    Rien n'est fait si un autre processus détient le verrou de la rétention.
+
+    Returns:
+        dict: {'verrou': bool, 'tables': [résultat par table], 'vacuum': {...}}
+    """
+    from app import db
+
+    configurees = politiques()
+    verrou = Verrou("retention")
+    if not verrou.acquerir():
+        return {'verrou': False, 'tables': []}
+    try:
+        resultats = []
+        for nom in (noms or configurees):
+            resultats.append(appliquer(configurees[nom], taille_lot, pause, dossier_archive, verrou=verrou))
+            if resultats[-1]['interrompu']:
+                break
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        verrou.liberer()
+    rapport = {'verrou': True, 'tables': resultats}
+    if vacuum and any(r['supprimees'] for r in resultats):
+        rapport['vacuum'] = vacuum_incremental()
+    return rapport
+
+
+def rapport_dry_run(noms=None):
+    """
+    Ce que executer() traiterait, sans rien modifier
+
+    Returns:
+        dict: {'tables': [{'table', 'action', 'limite', 'lignes', 'plus_ancienne', 'total'}],
+               'base': {'page_size', 'pages', 'pages_libres', 'auto_vacuum'} (SQLite)}
+    """
+    from app import db
+
+    configurees = politiques()
+    tables = []
+    for nom in (noms or configurees):
+        politique = configurees[nom]
+        maintenant = datetime.utcnow()
+        limite = politique.limite(maintenant)
+        lignes, plus_ancienne = db.session.execute(politique.selection_expirees(maintenant)).one()
+        total = db.session.execute(select(func.count()).select_from(politique.table)).scalar()
+        tables.append({
+            'table': nom,
+            'action': 'archiver' if politique.archiver else 'supprimer',
+            'limite': limite.isoformat(timespec='seconds'),
+            'lignes': lignes,
+            'plus_ancienne': plus_ancienne.isoformat(timespec='seconds') if plus_ancienne else None,
+            'total': total,
+        })
+    db.session.rollback()
+
+    rapport = {'tables': tables}
+    if db.engine.dialect.name == "sqlite":
+        with db.engine.connect() as connexion:
+            valeurs = {
+                nom: connexion.exec_driver_sql(f"PRAGMA {nom}").scalar()
+                for nom in ("page_size", "page_count", "freelist_count", "auto_vacuum")
+            }
+        rapport['base'] = {
+            'page_size': valeurs['page_size'],
+            'pages': valeurs['page_count'],
+            'pages_libres': valeurs['freelist_count'],
+            'auto_vacuum': MODES_AUTO_VACUUM.get(valeurs['auto_vacuum']),
+        }
+    return rapport
@@ -1,14 +1,24 @@
-from flask import Blueprint, render_template, url_for, flash, redirect, request, jsonify
-from app import db, bcrypt
-from app.models import User, Message, Historique, Rappel, OTP, Notification
+from flask import Blueprint, render_template, url_for, flash, redirect, request, jsonify, current_app, Response, stream_with_context
+from app import db, hachage
+from app.hachage import SurchargeHachage
+from app.models import User, Message, Historique, Rappel, OTP, Notification, SmsJob, user_cache
 from app.twilio_service import twilio_service
 from flask_login import login_user, current_user, logout_user, login_required
-from app.chatbot import get_bot_response
+from app.pagination import LIMITE_MAX, encoder_curseur, decoder_curseur, lire_limite, page_keyset
+from app.chatbot import get_bot_response, get_bot_responses, cache_stats
+from app import chatbot as module_chatbot
+from app.corpus_watcher import ecrire_corpus
+from app import metrics
+import json
+import os
 import re
 
 # Création du Blueprint
 main = Blueprint("main", __name__)
 
+# Nombre de lignes lues par aller-retour lors de l'export NDJSON
+TAILLE_LOT_EXPORT = 1000
+
 # ======================================================
 # HOME
 # ======================================================
@@ -42,7 +52,11 @@ def register():
             return redirect(url_for("main.register"))
         
 
-        hashed = bcrypt.generate_password_hash(password).decode("utf-8")
+        try:
+            hashed = hachage.hacher(password)
+        except SurchargeHachage as e:
+            flash(str(e), "warning")
+            return render_template("register.html", title="Inscription au chatbot"), 503
 
         user = User(
             first_name=first_name,
@@ -69,7 +83,15 @@ def login():
         username = request.form.get("username")
         password = request.form.get("password")
         user = User.query.filter_by(username=username).first()
-        if user and bcrypt.check_password_hash(user.password_hash, password):
+        try:
+            # Le hash est remis au coût courant s'il a changé (BCRYPT_LOG_ROUNDS)
+            valide = user is not None and hachage.verifier_et_rehacher(user, password)
+        except SurchargeHachage as e:
+            flash(str(e), "warning")
+            return render_template("login.html", title="Connexion sur le chatbot"), 503
+        if valide:
+            if db.session.dirty:
+                db.session.commit()
             login_user(user, remember=True)
             next_page = request.args.get("next")
             return redirect(next_page) if next_page else redirect(url_for("main.home"))
@@ -83,6 +105,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    user_cache.effacer_session()
     return redirect(url_for("main.login"))
 
 
@@ -100,31 +123,74 @@ def chatbot():
     user_message = data["message"].strip()
     if not user_message:
         return jsonify({"error": "Message vide"}), 400
-    # Enregistrement du message utilisateur
-    user_msg = Message(
-        content=user_message,
-        is_from_user=True,
-        author=current_user
-    )
-    db.session.add(user_msg)
     # Envoi du message au chatbot et obtention de la réponse
     try:
-        bot_reply = get_bot_response(user_message)
+        resultat = get_bot_response(
+            user_message,
+            user_id=current_user.id,
+            state_store=current_app.extensions["dialogue_state"]
+        )
     except Exception as e:
         print("Erreur chatbot :", e)
-        bot_reply = "Désolé, une erreur est survenue."
-    
-    bot_msg = Message(
-        content=bot_reply,
-        is_from_user=False,
-        author=current_user
-    )
-    db.session.add(bot_msg)
-    db.session.commit()
+        resultat = {"response": "Désolé, une erreur est survenue.", "tag": None, "score": None}
+    bot_reply = resultat["response"]
+    
+    # Enregistrement de l'échange, avec l'intent et la confiance : différé (write-behind) ou immédiat
+    tampon = current_app.extensions.get("write_behind")
+    if tampon is not None:
+        tampon.ajouter_echange(
+            current_user.id, user_message, bot_reply,
+            intent=resultat["tag"], confiance=resultat["score"]
+        )
+    else:
+        user_id = current_user.id
+        db.session.add_all([
+            Message(content=user_message, is_from_user=True, author=current_user),
+            Message(content=bot_reply, is_from_user=False, author=current_user),
+            Historique(
+                user_id=user_id,
+                message_utilisateur=user_message,
+                reponse_bot=bot_reply,
+                intent_detecte=resultat["tag"],
+                confiance=resultat["score"]
+            )
+        ])
+        db.session.commit()
 
-    
+    return jsonify({"response": bot_reply, "tag": resultat["tag"], "score": resultat["score"]})
+
+
+# Nombre maximum de messages par appel à /api/chat/batch
+MAX_BATCH_MESSAGES = 1000
+
+
+@main.route("/api/chat/batch", methods=['POST'])
+@login_required
+def chatbot_batch():
+    """Classer plusieurs messages en un seul appel (rejeu, analyses)"""
+    data = request.get_json()
+    messages = data.get("messages") if data else None
+
+    if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+        return jsonify({"error": "Liste de messages attendue"}), 400
+    if len(messages) > MAX_BATCH_MESSAGES:
+        return jsonify({"error": f"Maximum {MAX_BATCH_MESSAGES} messages par lot"}), 400
+
+    return jsonify({"results": get_bot_responses(messages)})
 
-    return jsonify({"response": bot_reply})
+
+@main.route("/api/chat/cache", methods=['GET'])
+@login_required
+def chatbot_cache_stats():
+    """Statistiques des caches du chatbot (taille, hits, misses)"""
+    return jsonify(cache_stats())
+
+
+@main.route("/api/auth/cache", methods=['GET'])
+@login_required
+def user_cache_stats():
+    """Statistiques du cache des utilisateurs connectés (hits processus / session, chargements DB)"""
+    return jsonify(user_cache.stats())
     
 
 
@@ -134,10 +200,49 @@ def chatbot():
 @main.route("/api/history")
 @login_required
 def history():
-    messages = Message.query.filter_by(user_id=current_user.id).order_by(Message.timestamp).all()
+    """
+    Historique des messages, paginé par curseur
+
+    Paramètres : `limit`, et `before` (messages plus anciens) ou `since`
+    (messages plus récents). Sans curseur : les derniers messages.
+    Les messages sont toujours renvoyés dans l'ordre chronologique.
+
+    Réponse : {data, has_more, before, since}. Sans aucun de ces
+    paramètres, ancien format (liste simple) pour les clients existants,
+    limité aux LIMITE_MAX derniers messages.
+    """
+    if not any(request.args.get(nom) for nom in ('limit', 'before', 'since')):
+        messages, _ = page_keyset(
+            Message.query.filter_by(user_id=current_user.id), Message.timestamp, Message.id, LIMITE_MAX
+        )
+        messages.reverse()
+        return jsonify([
+            {
+                "content": m.content,
+                "timestamp": m.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "is_from_user": m.is_from_user
+            }
+            for m in messages
+        ])
+
+    try:
+        limite = lire_limite(request.args.get('limit'))
+        avant = decoder_curseur(request.args['before']) if request.args.get('before') else None
+        apres = decoder_curseur(request.args['since']) if request.args.get('since') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    requete = Message.query.filter_by(user_id=current_user.id)
+    messages, il_en_reste = page_keyset(
+        requete, Message.timestamp, Message.id, limite,
+        avant=avant, apres=apres, recent_d_abord=apres is None
+    )
+    if apres is None:
+        messages.reverse()
 
     data = [
         {
+            "id": m.id,
             "content": m.content,
             "timestamp": m.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
             "is_from_user": m.is_from_user
@@ -145,7 +250,38 @@ def history():
         for m in messages
     ]
 
-    return jsonify(data)
+    premier, dernier = (messages[0], messages[-1]) if messages else (None, None)
+    return jsonify({
+        "data": data,
+        "has_more": il_en_reste,
+        "before": encoder_curseur(premier.timestamp, premier.id) if premier else None,
+        "since": encoder_curseur(dernier.timestamp, dernier.id) if dernier else request.args.get('since')
+    })
+
+
+@main.route("/api/history/export")
+@login_required
+def history_export():
+    """Export complet de l'historique en NDJSON (une ligne JSON par message), en streaming"""
+    user_id = current_user.id
+    requete = (
+        db.select(Message.id, Message.content, Message.timestamp, Message.is_from_user)
+        .where(Message.user_id == user_id)
+        .order_by(Message.timestamp, Message.id)
+        .execution_options(yield_per=TAILLE_LOT_EXPORT)
+    )
+
+    def generer():
+        # Lignes brutes lues par lots : aucun objet ORM n'est construit
+        for id, content, timestamp, is_from_user in db.session.execute(requete):
+            yield json.dumps({
+                "id": id,
+                "content": content,
+                "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "is_from_user": is_from_user
+            }, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generer()), mimetype="application/x-ndjson")
 
 
 # ======================================================
@@ -167,6 +303,8 @@ def send_otp():
         return jsonify({'error': 'Format de numéro invalide'}), 400
     
     result = twilio_service.envoyer_otp(user_id, phone_number)
+    if result.get('limite'):
+        return jsonify(result), 429, {'Retry-After': str(result['retry_after'])}
     return jsonify(result)
 
 
@@ -181,6 +319,8 @@ def verify_otp():
         return jsonify({'error': 'Données manquantes'}), 400
     
     result = twilio_service.verifier_otp(user_id, code)
+    if result.get('limite'):
+        return jsonify(result), 429, {'Retry-After': str(result['retry_after'])}
     
     if result['valid']:
         # Mettre à jour le statut de vérification
@@ -265,6 +405,19 @@ def liste_rappels():
     return jsonify(data)
 
 
+@main.route("/api/rappel/scheduler/stats", methods=['GET'])
+@login_required
+def stats_scheduler_rappels():
+    """Backlog et retard des rappels (métriques du scheduler)"""
+    from app.scheduler import etat_backlog
+
+    data = {'backlog': etat_backlog()}
+    scheduler = current_app.extensions.get("rappel_scheduler")
+    if scheduler:
+        data['scheduler'] = scheduler.stats()
+    return jsonify(data)
+
+
 # ======================================================
 # TWILIO - NOTIFICATIONS
 # ======================================================
@@ -343,6 +496,20 @@ def envoyer_notification_multiple():
     return jsonify(result)
 
 
+# ======================================================
+# TWILIO - FILE D'ENVOI
+# ======================================================
+
+@main.route("/api/sms/job/<int:job_id>", methods=['GET'])
+@login_required
+def statut_sms_job(job_id):
+    """Consulter l'état d'un SMS mis en file (mode async)"""
+    job = SmsJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': 'Non trouvé'}), 404
+    return jsonify(job.to_dict())
+
+
 # ======================================================
 # HISTORIQUE
 # ======================================================
@@ -350,7 +517,12 @@ def envoyer_notification_multiple():
 @main.route("/api/historique/enregistrer", methods=['POST'])
 @login_required
 def enregistrer_historique():
-    """Enregistrer une interaction dans l'historique"""
+    """
+    Enregistrer une interaction dans l'historique
+
+    /api/chat enregistre déjà l'intent et la confiance de chaque échange :
+    cette route ne sert plus qu'aux imports et aux clients externes.
+    """
     data = request.get_json()
     
     historique = Historique(
@@ -370,11 +542,29 @@ def enregistrer_historique():
 @main.route("/api/historique", methods=['GET'])
 @login_required
 def consulter_historique():
-    """Consulter l'historique de l'utilisateur"""
-    page = request.args.get('page', 1, type=int)
-    par_page = request.args.get('per_page', 20, type=int)
+    """
+    Consulter l'historique de l'utilisateur (plus récent d'abord, paginé par curseur)
+
+    Réponse : {data, has_more, next_cursor}. Sans `cursor`, ancienne
+    pagination par numéro (`page`, 1 par défaut) pour les clients existants :
+    la réponse garde total, pages et page (COUNT, et OFFSET dont le coût
+    croît avec la profondeur) ; next_cursor permet de passer au curseur.
+    """
+    try:
+        par_page = lire_limite(request.args.get('per_page'), defaut=20)
+        avant = decoder_curseur(request.args['cursor']) if request.args.get('cursor') else None
+        page = int(request.args.get('page') or 1) if avant is None else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    historiques = Historique.query.filter_by(user_id=current_user.id).order_by(Historique.timestamp.desc()).paginate(page=page, per_page=par_page)
+    requete = Historique.query.filter_by(user_id=current_user.id)
+    if page is not None:
+        pagination = requete.order_by(Historique.timestamp.desc(), Historique.id.desc()).paginate(
+            page=page, per_page=par_page, error_out=False
+        )
+        historiques, il_en_reste = pagination.items, pagination.has_next
+    else:
+        historiques, il_en_reste = page_keyset(requete, Historique.timestamp, Historique.id, par_page, avant=avant)
     
     data = [
         {
@@ -385,17 +575,84 @@ def consulter_historique():
             'confiance': h.confiance,
             'timestamp': h.timestamp.isoformat()
         }
-        for h in historiques.items
+        for h in historiques
     ]
     
-    return jsonify({
+    dernier = historiques[-1] if historiques else None
+    reponse = {
         'data': data,
-        'total': historiques.total,
-        'pages': historiques.pages,
-        'page': page
+        'has_more': il_en_reste,
+        'next_cursor': encoder_curseur(dernier.timestamp, dernier.id) if il_en_reste else None
+    }
+    if page is not None:
+        reponse.update(total=pagination.total, pages=pagination.pages, page=page)
+    return jsonify(reponse)
+
+
+# ======================================================
+# MÉTRIQUES
+# ======================================================
+
+@main.route("/metrics")
+def metrics_prometheus():
+    """Métriques au format texte Prometheus, agrégées sur tous les workers"""
+    # Sans session : protégé par un jeton si METRICS_TOKEN est défini
+    jeton = os.environ.get("METRICS_TOKEN")
+    if jeton and request.headers.get("Authorization") != f"Bearer {jeton}":
+        return jsonify({'error': "Non autorisé"}), 401
+
+    return Response(metrics.exporter(), content_type=metrics.CONTENT_TYPE)
+
+
+# ======================================================
+# ADMINISTRATION DU CORPUS
+# ======================================================
+
+def _jeton_admin_valide():
+    """Routes d'administration : désactivées tant que ADMIN_TOKEN n'est pas défini"""
+    jeton = os.environ.get("ADMIN_TOKEN")
+    return bool(jeton) and request.headers.get("Authorization") == f"Bearer {jeton}"
+
+
+@main.route("/api/admin/corpus", methods=['GET'])
+def corpus_version():
+    """Version du modèle d'intentions servie par ce worker"""
+    if not _jeton_admin_valide():
+        return jsonify({'error': "Non autorisé"}), 401
+
+    return jsonify({
+        'modele': module_chatbot.modele.infos(),
+        'rechargement': current_app.extensions["corpus_watcher"].stats(),
     })
 
 
+@main.route("/api/admin/corpus/reload", methods=['POST'])
+def corpus_reload():
+    """
+    Recharger le corpus en arrière-plan (réponse immédiate, 202)
+
+    Corps optionnel : un nouveau corpus JSON ({'intents': [...]}). Il est
+    validé puis écrit dans corpus.json ; les autres workers le voient
+    au prochain passage de leur surveillance (CORPUS_WATCH=1).
+    """
+    if not _jeton_admin_valide():
+        return jsonify({'error': "Non autorisé"}), 401
+
+    data = request.get_json(silent=True)
+    if data:
+        try:
+            ecrire_corpus(data, module_chatbot.CORPUS_PATH)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    current_app.extensions["corpus_watcher"].demander_rechargement(force=not data)
+    return jsonify({
+        'success': True,
+        'message': "Rechargement du corpus lancé",
+        'version_actuelle': module_chatbot.modele.version,
+    }), 202
+
+
 # ======================================================
 # TEST SMS
 # ======================================================
@@ -0,0 +1,264 @@
+"""
+Scheduler des rappels :
+- Sélection des rappels dus par lots via l'index (statut, date_rappel)
+- Réservation atomique (plusieurs workers sans double envoi)
+- Envoi via TwilioService et métriques de retard
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+
+# Un rappel resté en 'processing' plus longtemps est remis dans la file
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+
+# Reprises d'un rappel abandonné : base * 2^(tentative-1), plafonné
+RETRY_BASE_SECONDES = float(os.environ.get('RAPPEL_RETRY_BASE', 60))
+RETRY_MAX_SECONDES = float(os.environ.get('RAPPEL_RETRY_MAX', 1800))
+MAX_TENTATIVES = int(os.environ.get('RAPPEL_MAX_TENTATIVES', 3))
+
+
+def reclamer_rappels(limit=200):
+    """
+    Réserver atomiquement les rappels dus les plus anciens
+
+    La sélection `statut = 'pending' AND date_rappel <= maintenant ORDER BY
+    date_rappel` est servie par l'index (statut, date_rappel), sans parcourir
+    la table. Chaque rappel passe ensuite à 'processing' par un UPDATE
+    conditionnel : seul le worker dont l'UPDATE modifie la ligne l'envoie.
+
+    Returns:
+        list: Les Rappel réservés par cet appel
+    """
+    from app import db
+    from app.models import Rappel
+
+    maintenant = datetime.utcnow()
+
+    _recuperer_abandonnes(maintenant)
+
+    candidats = [
+        rappel_id for (rappel_id,) in db.session.query(Rappel.id)
+        .filter(Rappel.statut == 'pending', Rappel.date_rappel <= maintenant)
+        .filter(db.or_(Rappel.prochain_essai_at.is_(None), Rappel.prochain_essai_at <= maintenant))
+        .order_by(Rappel.date_rappel)
+        .limit(limit)
+    ]
+
+    reserves = []
+    for rappel_id in candidats:
+        modifies = Rappel.query.filter_by(id=rappel_id, statut='pending').update(
+            {'statut': 'processing', 'updated_at': maintenant},
+            synchronize_session=False
+        )
+        if modifies == 1:
+            reserves.append(rappel_id)
+    db.session.commit()
+
+    if not reserves:
+        return []
+    return Rappel.query.filter(Rappel.id.in_(reserves)).order_by(Rappel.date_rappel).all()
+
+
+def _delai_retry(tentatives):
+    return min(RETRY_BASE_SECONDES * 2 ** (tentatives - 1), RETRY_MAX_SECONDES)
+
+
+def _recuperer_abandonnes(maintenant):
+    """
+    Replanifier les rappels restés en 'processing' au-delà de PROCESSING_TIMEOUT
+
+    Même règle que la file SMS (sms_queue._recuperer_abandonnes) : l'envoi
+    interrompu compte comme une tentative, le rappel n'est repris qu'après
+    un backoff (prochain_essai_at) et passe en 'failed' à MAX_TENTATIVES.
+    Un rappel qui fait tomber son worker n'est donc pas renvoyé en boucle.
+    """
+    from app.models import Rappel
+
+    abandonnes = Rappel.query.with_entities(Rappel.id, Rappel.tentatives, Rappel.updated_at).filter(
+        Rappel.statut == 'processing',
+        Rappel.updated_at < maintenant - PROCESSING_TIMEOUT
+    ).all()
+
+    for rappel in abandonnes:
+        tentatives = rappel.tentatives + 1
+        valeurs = {'tentatives': tentatives, 'updated_at': maintenant}
+        if tentatives >= MAX_TENTATIVES:
+            valeurs['statut'] = 'failed'
+        else:
+            valeurs['statut'] = 'pending'
+            valeurs['prochain_essai_at'] = maintenant + timedelta(seconds=_delai_retry(tentatives))
+        # Conditionnel : un seul worker replanifie le rappel
+        Rappel.query.filter_by(id=rappel.id, statut='processing', updated_at=rappel.updated_at).update(
+            valeurs, synchronize_session=False
+        )
+
+
+def etat_backlog():
+    """
+    Rappels dus non encore envoyés (calculé en base, valable pour tous les workers)
+
+    Returns:
+        dict: {'dus': int, 'retard_max_s': float}
+    """
+    from app import db
+    from app.models import Rappel
+
+    maintenant = datetime.utcnow()
+    dus, plus_ancien = db.session.query(
+        db.func.count(Rappel.id), db.func.min(Rappel.date_rappel)
+    ).filter(Rappel.statut == 'pending', Rappel.date_rappel <= maintenant).one()
+
+    return {
+        'dus': dus,
+        'retard_max_s': round((maintenant - plus_ancien).total_seconds(), 1) if plus_ancien else 0.0
+    }
+
+
+class StatsRetard:
+    """Retard des envois (heure d'envoi - date_rappel) sur les derniers rappels"""
+
+    def __init__(self, taille=1000):
+        self._recents = deque(maxlen=taille)
+        self._lock = threading.Lock()
+        self.envoyes = 0
+        self.echecs = 0
+        self.retard_max = 0.0
+
+    def enregistrer(self, retard, succes):
+        with self._lock:
+            if succes:
+                self.envoyes += 1
+            else:
+                self.echecs += 1
+            self.retard_max = max(self.retard_max, retard)
+            self._recents.append(retard)
+
+    def stats(self):
+        with self._lock:
+            recents = sorted(self._recents)
+
+        def percentile(p):
+            if not recents:
+                return 0.0
+            return round(recents[min(len(recents) - 1, int(p * len(recents)))], 3)
+
+        return {
+            'envoyes': self.envoyes,
+            'echecs': self.echecs,
+            'retard_p50_s': percentile(0.50),
+            'retard_p95_s': percentile(0.95),
+            'retard_max_s': round(self.retard_max, 3),
+        }
+
+
+class RappelScheduler:
+    """Thread qui envoie les rappels arrivés à échéance"""
+
+    def __init__(self, app, service, batch=200, intervalle=30, intervalle_purge=None):
+        """
+        Args:
+            app: Application Flask
+            service: TwilioService utilisé pour l'envoi
+            batch: Nombre de rappels réservés à la fois
+            intervalle: Attente (secondes) entre deux passages quand rien n'est dû
+            intervalle_purge: Secondes entre deux passages de la rétention
+                (app/retention.py, par défaut RETENTION_INTERVALLE, 0 = jamais)
+
+        La première purge attend RETENTION_DELAI_DEMARRAGE secondes plus un
+        tirage aléatoire (jusqu'à 10 % de l'intervalle) : les workers qui
+        démarrent ensemble ne se présentent pas tous au verrou au boot.
+        """
+        self.app = app
+        self.service = service
+        self.batch = batch
+        self.intervalle = intervalle
+        if intervalle_purge is None:
+            intervalle_purge = float(os.environ.get("RETENTION_INTERVALLE", 3600))
+        self.intervalle_purge = intervalle_purge
+        self.delai_purge = float(os.environ.get("RETENTION_DELAI_DEMARRAGE", 300))
+        self._prochaine_purge = None
+        self.lignes_purgees = 0
+        self.retards = StatsRetard()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def executer(self):
+        """
+        Envoyer tous les rappels dus (par lots jusqu'à vider le backlog)
+
+        Returns:
+            int: Nombre de rappels traités
+        """
+        from app import db
+        from app.models import Rappel
+
+        traites = 0
+        while not self._stop.is_set():
+            rappels = reclamer_rappels(self.batch)
+            for rappel in rappels:
+                retard = (datetime.utcnow() - rappel.date_rappel).total_seconds()
+                result = self.service.envoyer_rappel(rappel.id)
+                if not result['success']:
+                    Rappel.query.filter_by(id=rappel.id).update(
+                        {'statut': 'failed', 'updated_at': datetime.utcnow()},
+                        synchronize_session=False
+                    )
+                    db.session.commit()
+                self.retards.enregistrer(retard, result['success'])
+            traites += len(rappels)
+            if len(rappels) < self.batch:
+                break
+        return traites
+
+    def start(self):
+        """Démarrer le thread du scheduler (recréé après un fork, sans effet s'il tourne déjà)"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return self
+        self._pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, name="rappel-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        """Arrêter le scheduler (le lot en cours se termine)"""
+        self._stop.set()
+        if self._thread and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _boucle(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    self.executer()
+                except Exception as e:
+                    print("Erreur scheduler rappels :", e)
+                self._purger_si_besoin()
+            self._stop.wait(self.intervalle)
+
+    def _purger_si_besoin(self):
+        if not self.intervalle_purge:
+            return
+        if self._prochaine_purge is None:
+            self._prochaine_purge = time.monotonic() + self.delai_purge + random.uniform(0, self.intervalle_purge / 10)
+        if time.monotonic() < self._prochaine_purge:
+            return
+        self._prochaine_purge = time.monotonic() + self.intervalle_purge
+        from app import retention
+
+        try:
+            rapport = retention.executer()
+            self.service.purger_limites()
+            self.lignes_purgees += sum(table['supprimees'] for table in rapport['tables'])
+        except Exception as e:
+            print("Erreur rétention :", e)
+
+    def stats(self):
+        return dict(self.retards.stats(), batch=self.batch, intervalle_s=self.intervalle, lignes_purgees=self.lignes_purgees)
@@ -0,0 +1,279 @@
+"""
+Moteur d'intentions sémantique (optionnel, INTENT_ENGINE=semantic) :
+- Encodeur de phrases multilingue chargé depuis un dossier local
+  (modèle Hugging Face enregistré avec `save_pretrained`)
+- Inférence CPU quantifiée en int8 (`torch.ao.quantization.quantize_dynamic`,
+  dépréciée par torch : si elle disparaît ou échoue, le modèle reste en
+  float32 au lieu de désactiver le moteur)
+- Encodage par lots, embeddings normalisés L2 (produit scalaire = cosinus)
+- Embeddings des patterns calculés une fois et mis en cache sur disque,
+  identifiés par le hash du corpus et l'empreinte du modèle
+- Rechargement du corpus incrémental : le modèle déjà chargé est réutilisé
+  et seuls les patterns nouveaux ou modifiés sont encodés
+
+torch et transformers ne sont importés qu'à l'activation du moteur.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+
+import numpy as np
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+INSTANCE_DIR = os.path.join(os.path.dirname(BASE_DIR), "instance")
+
+MODEL_DIR = os.environ.get(
+    "SEMANTIC_MODEL_DIR",
+    os.path.join(INSTANCE_DIR, "models", "paraphrase-multilingual-MiniLM-L12-v2"),
+)
+CACHE_DIR = os.environ.get("SEMANTIC_CACHE_DIR", os.path.join(INSTANCE_DIR, "semantic_cache"))
+
+# En dessous de ce score, la décision est laissée au TF-IDF
+SEUIL_SEMANTIQUE = float(os.environ.get("SEMANTIC_THRESHOLD", 0.55))
+TAILLE_LOT = int(os.environ.get("SEMANTIC_BATCH_SIZE", 32))
+LONGUEUR_MAX = 128
+
+
+def empreinte_modele(model_dir):
+    """Empreinte du modèle : config.json et taille de chaque fichier de poids"""
+    h = hashlib.sha256()
+    for nom in sorted(os.listdir(model_dir)):
+        chemin = os.path.join(model_dir, nom)
+        if not os.path.isfile(chemin):
+            continue
+        h.update(nom.encode("utf-8"))
+        if nom == "config.json":
+            with open(chemin, "rb") as file:
+                h.update(file.read())
+        else:
+            h.update(str(os.path.getsize(chemin)).encode("ascii"))
+    return h.hexdigest()
+
+
+def quantifier_int8(model):
+    """
+    Couches linéaires du modèle quantifiées en int8 (quantification dynamique)
+
+    Returns:
+        tuple: (modèle, quantifié ou non) ; le modèle float32 est renvoyé
+        tel quel si l'API de quantification est absente de cette version de
+        torch ou échoue sur cette plateforme
+    """
+    import torch
+
+    try:
+        from torch.ao.quantization import quantize_dynamic
+    except (ImportError, AttributeError) as e:
+        print("⚠️  Quantification int8 indisponible, modèle float32 :", e)
+        return model, False
+
+    try:
+        with warnings.catch_warnings():
+            # API dépréciée : l'avertissement est remplacé par le repli ci-dessous
+            warnings.simplefilter("ignore", DeprecationWarning)
+            warnings.simplefilter("ignore", UserWarning)
+            return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8), True
+    except (RuntimeError, AttributeError, NotImplementedError) as e:
+        print("⚠️  Quantification int8 en échec, modèle float32 :", e)
+        return model, False
+
+
+class SemanticMatcher:
+    """Classement des messages par similarité d'embeddings avec les patterns"""
+
+    def __init__(self, model_dir=MODEL_DIR, quantifier=True, taille_lot=TAILLE_LOT, threads=None):
+        """
+        Args:
+            model_dir: Dossier local du modèle (tokenizer + poids)
+            quantifier: Quantifier les couches linéaires en int8
+            taille_lot: Nombre de textes encodés par passe
+            threads: Threads torch (par défaut : réglage de torch)
+        """
+        self.model_dir = model_dir
+        self.quantifier = quantifier
+        # Quantification effective (False si torch ne la permet pas)
+        self.quantifie = quantifier
+        self.taille_lot = taille_lot
+        self.threads = threads
+        self.tokenizer = None
+        self.model = None
+        self.embeddings = None
+        self.tags = []
+        self.patterns = []
+
+    def deriver(self):
+        """
+        Moteur vide qui partage le tokenizer et le modèle déjà chargés
+
+        Pour un nouveau corpus : ni rechargement ni nouvelle quantification,
+        et le moteur servi garde ses embeddings jusqu'à la bascule.
+        """
+        moteur = SemanticMatcher(self.model_dir, self.quantifier, self.taille_lot, self.threads)
+        moteur.tokenizer = self.tokenizer
+        moteur.model = self.model
+        moteur.quantifie = self.quantifie
+        return moteur
+
+    def charger(self):
+        """
+        Charger tokenizer et modèle (sans accès réseau)
+
+        Raises:
+            ImportError: torch / transformers absents
+            OSError: Dossier du modèle introuvable
+        """
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        if not os.path.isdir(self.model_dir):
+            raise OSError(f"Modèle introuvable : {self.model_dir}")
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir, local_files_only=True)
+        model = AutoModel.from_pretrained(self.model_dir, local_files_only=True)
+        model.eval()
+        self.quantifie = False
+        if self.quantifier:
+            model, self.quantifie = quantifier_int8(model)
+        self.model = model
+        return self
+
+    def encoder(self, textes):
+        """
+        Embeddings normalisés des textes, encodés par lots
+
+        Returns:
+            np.ndarray: (len(textes), dimension) en float32
+        """
+        import torch
+
+        if self.model is None:
+            self.charger()
+
+        lots = []
+        for debut in range(0, len(textes), self.taille_lot):
+            lot = textes[debut:debut + self.taille_lot]
+            entree = self.tokenizer(
+                lot, padding=True, truncation=True, max_length=LONGUEUR_MAX, return_tensors="pt"
+            )
+            with torch.inference_mode():
+                sortie = self.model(**entree).last_hidden_state
+            # Moyenne des tokens réels (hors padding)
+            masque = entree["attention_mask"].unsqueeze(-1).to(sortie.dtype)
+            moyenne = (sortie * masque).sum(dim=1) / masque.sum(dim=1).clamp(min=1e-9)
+            lots.append(torch.nn.functional.normalize(moyenne, p=2, dim=1).numpy())
+
+        if not lots:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.ascontiguousarray(np.vstack(lots), dtype=np.float32)
+
+    def _chemin_cache(self, corpus_hash, cache_dir):
+        cle = hashlib.sha256(
+            f"{corpus_hash}|{empreinte_modele(self.model_dir)}|q={int(self.quantifie)}".encode("utf-8")
+        ).hexdigest()
+        return os.path.join(cache_dir, f"{cle}.npy")
+
+    def indexer(self, patterns, tags, corpus_hash, cache_dir=CACHE_DIR, precedent=None):
+        """
+        Embeddings des patterns : lus depuis le cache, ou calculés et sauvegardés
+
+        Args:
+            precedent: Moteur de la version précédente du corpus (même
+                modèle) ; ses embeddings sont repris pour les patterns
+                inchangés et seuls les autres sont encodés
+
+        Returns:
+            bool: True si les embeddings viennent du cache
+        """
+        patterns = list(patterns)
+        self.tags = list(tags)
+        self.patterns = patterns
+        chemin = self._chemin_cache(corpus_hash, cache_dir)
+        if os.path.exists(chemin):
+            self.embeddings = np.load(chemin, mmap_mode="r")
+            return True
+
+        self.embeddings = self._encoder_patterns(patterns, precedent)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, temporaire = tempfile.mkstemp(dir=cache_dir, suffix=".npy")
+            with os.fdopen(fd, "wb") as file:
+                np.save(file, self.embeddings)
+            os.replace(temporaire, chemin)
+            with open(chemin[:-4] + ".json", "w", encoding="utf-8") as file:
+                json.dump({'corpus_hash': corpus_hash, 'model_dir': self.model_dir,
+                           'patterns': len(self.tags), 'quantifie': self.quantifie}, file)
+            # Relu en mmap : pages partagées entre les workers
+            self.embeddings = np.load(chemin, mmap_mode="r")
+        except OSError as e:
+            print("⚠️  Embeddings sémantiques non sauvegardés :", e)
+        return False
+
+    def _encoder_patterns(self, patterns, precedent):
+        connus = {}
+        if precedent is not None and precedent.embeddings is not None and precedent.embeddings.size:
+            connus = {pattern: i for i, pattern in enumerate(precedent.patterns)}
+        nouveaux = list(dict.fromkeys(p for p in patterns if p not in connus))
+        if len(nouveaux) == len(patterns):
+            return self.encoder(patterns)
+
+        vecteurs = self.encoder(nouveaux) if nouveaux else None
+        positions = {pattern: i for i, pattern in enumerate(nouveaux)}
+        embeddings = np.empty((len(patterns), precedent.embeddings.shape[1]), dtype=np.float32)
+        for i, pattern in enumerate(patterns):
+            if pattern in positions:
+                embeddings[i] = vecteurs[positions[pattern]]
+            else:
+                embeddings[i] = precedent.embeddings[connus[pattern]]
+        return embeddings
+
+    def classer(self, textes):
+        """
+        Meilleur intent de chaque texte
+
+        Returns:
+            list: [(tag, score), ...] (le seuil est appliqué par l'appelant)
+        """
+        if not textes:
+            return []
+        similarites = self.encoder(textes) @ self.embeddings.T
+        meilleurs = similarites.argmax(axis=1)
+        return [
+            (self.tags[idx], float(similarites[i, idx]))
+            for i, idx in enumerate(meilleurs)
+        ]
+
+
+def creer_moteur(data, corpus_hash, model_dir=MODEL_DIR, cache_dir=CACHE_DIR, precedent=None):
+    """
+    Moteur sémantique prêt pour le corpus, ou None s'il ne peut pas être chargé
+
+    Le chatbot reste alors sur le TF-IDF seul.
+
+    Args:
+        precedent: Moteur servi pour l'ancienne version du corpus : s'il
+            utilise le même modèle, son encodeur est réutilisé (pas de
+            rechargement) et seuls les patterns nouveaux sont encodés
+    """
+    from app.intent_index import extraire_patterns
+
+    quantifier = os.environ.get("SEMANTIC_QUANTIZE", "1") == "1"
+    threads = int(os.environ["SEMANTIC_THREADS"]) if os.environ.get("SEMANTIC_THREADS") else None
+    try:
+        if (precedent is not None and precedent.model is not None
+                and precedent.model_dir == model_dir and precedent.quantifier == quantifier):
+            moteur = precedent.deriver()
+        else:
+            moteur, precedent = SemanticMatcher(model_dir, quantifier=quantifier, threads=threads).charger(), None
+        patterns, tags, _ = extraire_patterns(data)
+        moteur.indexer(patterns, tags, corpus_hash, cache_dir, precedent=precedent)
+    except (ImportError, OSError) as e:
+        print("⚠️  Moteur sémantique indisponible, TF-IDF seul :", e)
+        return None
+    return moteur
@@ -0,0 +1,371 @@
+"""
+File d'envoi SMS asynchrone :
+- Providers (Twilio, ou faux provider local pour les tests)
+- File persistante dans la table `sms_job`
+- Pool de workers (threads) avec retries et backoff exponentiel
+"""
+
+import itertools
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+# Backoff : base * 2^(tentative-1), plafonné
+RETRY_BASE_SECONDES = float(os.environ.get('SMS_RETRY_BASE', 5))
+RETRY_MAX_SECONDES = float(os.environ.get('SMS_RETRY_MAX', 600))
+MAX_TENTATIVES = int(os.environ.get('SMS_MAX_TENTATIVES', 5))
+
+# Un job resté en 'processing' plus longtemps est considéré abandonné
+# (worker tué pendant l'envoi) et remis dans la file
+PROCESSING_TIMEOUT = timedelta(minutes=5)
+
+
+# ============================================================
+# PROVIDERS
+# ============================================================
+
+class TwilioProvider:
+    """Envoi réel via l'API Twilio"""
+
+    def __init__(self, client, phone_sender):
+        self.client = client
+        self.phone_sender = phone_sender
+
+    def envoyer(self, destinataire, corps):
+        """Envoyer un SMS et renvoyer son SID"""
+        message = self.client.messages.create(
+            body=corps,
+            from_=self.phone_sender,
+            to=destinataire
+        )
+        return message.sid
+
+
+class FakeProvider:
+    """Provider local : garde les SMS en mémoire, peut simuler des échecs et de la latence"""
+
+    def __init__(self, echecs=0, latence=0.0):
+        """
+        Args:
+            echecs: Nombre de premiers envois qui lèvent une erreur
+            latence: Durée simulée d'un envoi (secondes)
+        """
+        self.echecs = echecs
+        self.latence = latence
+        self.envoyes = []
+        self._compteur = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def envoyer(self, destinataire, corps):
+        if self.latence:
+            time.sleep(self.latence)
+        with self._lock:
+            numero = next(self._compteur)
+            if numero <= self.echecs:
+                raise RuntimeError(f"Échec simulé de l'envoi n°{numero}")
+            sid = f"FAKE{numero:010d}"
+            self.envoyes.append({'sid': sid, 'to': destinataire, 'body': corps})
+        return sid
+
+
+# ============================================================
+# FILE PERSISTANTE
+# ============================================================
+
+def enqueue(type_job, destinataire, corps, ref_id=None, commit=True):
+    """
+    Ajouter un SMS à la file d'envoi
+
+    Returns:
+        SmsJob: Le job créé (son id sert de job id côté API)
+    """
+    from app import db
+    from app.models import SmsJob
+
+    job = SmsJob(
+        type=type_job,
+        ref_id=ref_id,
+        destinataire=destinataire,
+        corps=corps,
+        max_tentatives=MAX_TENTATIVES
+    )
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+    return job
+
+
+def enqueue_lot(type_job, messages, commit=True):
+    """
+    Ajouter plusieurs SMS à la file en un seul INSERT multi-lignes
+
+    Args:
+        type_job: Type commun des jobs (otp, rappel, notification)
+        messages: Liste de (destinataire, corps, ref_id)
+
+    Returns:
+        list: Id des jobs créés, dans l'ordre de `messages`
+    """
+    from sqlalchemy import insert
+    from app import db
+    from app.models import SmsJob
+
+    if not messages:
+        return []
+    # L'ordre des lignes de RETURNING n'est pas garanti (et le demander
+    # ramène SQLite à un INSERT par ligne) : rapprochement par contenu, les
+    # jobs identiques étant interchangeables
+    par_contenu = {}
+    for job_id, destinataire, corps, ref_id in db.session.execute(
+        insert(SmsJob).returning(SmsJob.id, SmsJob.destinataire, SmsJob.corps, SmsJob.ref_id),
+        [
+            {'type': type_job, 'ref_id': ref_id, 'destinataire': destinataire,
+             'corps': corps, 'max_tentatives': MAX_TENTATIVES}
+            for destinataire, corps, ref_id in messages
+        ]
+    ):
+        par_contenu.setdefault((destinataire, corps, ref_id), []).append(job_id)
+    ids = [par_contenu[message].pop() for message in map(tuple, messages)]
+    if commit:
+        db.session.commit()
+    return ids
+
+
+def reclamer_jobs(limit=10):
+    """
+    Réserver atomiquement des jobs prêts à être envoyés
+
+    Chaque job passe de 'pending' à 'processing' par un UPDATE conditionnel ;
+    seul le worker dont l'UPDATE a modifié la ligne le traite, ce qui évite
+    les doubles envois entre threads et entre processus.
+
+    Returns:
+        list: Les SmsJob réservés par cet appel
+    """
+    from app import db
+    from app.models import SmsJob
+
+    maintenant = datetime.utcnow()
+    _recuperer_abandonnes(maintenant)
+
+    candidats = [
+        job_id for (job_id,) in db.session.query(SmsJob.id)
+        .filter(SmsJob.statut == 'pending', SmsJob.prochain_essai_at <= maintenant)
+        .order_by(SmsJob.prochain_essai_at)
+        .limit(limit)
+    ]
+
+    reserves = []
+    for job_id in candidats:
+        modifies = SmsJob.query.filter_by(id=job_id, statut='pending').update(
+            {'statut': 'processing', 'updated_at': maintenant},
+            synchronize_session=False
+        )
+        if modifies == 1:
+            reserves.append(job_id)
+    db.session.commit()
+
+    if not reserves:
+        return []
+    return SmsJob.query.filter(SmsJob.id.in_(reserves)).order_by(SmsJob.prochain_essai_at).all()
+
+
+def _delai_retry(tentatives):
+    return min(RETRY_BASE_SECONDES * 2 ** (tentatives - 1), RETRY_MAX_SECONDES)
+
+
+def _recuperer_abandonnes(maintenant):
+    """
+    Replanifier les jobs restés en 'processing' au-delà de PROCESSING_TIMEOUT
+
+    Worker tué ou bloqué pendant l'envoi : l'essai compte comme une
+    tentative, avec le même backoff qu'un échec, et le job passe en
+    'failed' à max_tentatives. Un job qui fait tomber son worker n'est
+    donc pas repris indéfiniment, et un envoi lent mais réussi a le temps
+    d'être enregistré 'sent' avant une nouvelle réservation.
+    """
+    from types import SimpleNamespace
+    from app import db
+    from app.models import SmsJob
+
+    abandonnes = db.session.query(
+        SmsJob.id, SmsJob.type, SmsJob.ref_id, SmsJob.tentatives, SmsJob.max_tentatives, SmsJob.updated_at
+    ).filter(
+        SmsJob.statut == 'processing',
+        SmsJob.updated_at < maintenant - PROCESSING_TIMEOUT
+    ).all()
+
+    for job in abandonnes:
+        tentatives = job.tentatives + 1
+        valeurs = {
+            'tentatives': tentatives,
+            'derniere_erreur': "Délai de traitement dépassé (worker arrêté pendant l'envoi ?)",
+            'updated_at': maintenant,
+        }
+        if tentatives >= job.max_tentatives:
+            valeurs['statut'] = 'failed'
+        else:
+            valeurs['statut'] = 'pending'
+            valeurs['prochain_essai_at'] = maintenant + timedelta(seconds=_delai_retry(tentatives))
+        # Conditionnel : un seul worker replanifie le job
+        modifies = SmsJob.query.filter_by(id=job.id, statut='processing', updated_at=job.updated_at).update(
+            valeurs, synchronize_session=False
+        )
+        if modifies == 1 and valeurs['statut'] == 'failed':
+            _finaliser(SimpleNamespace(type=job.type, ref_id=job.ref_id, statut='failed', sid_twilio=None))
+
+
+def _finaliser(job):
+    """Reporter le résultat de l'envoi sur l'objet métier (OTP, rappel, notification)"""
+    from app.models import OTP, Rappel, Notification
+
+    if job.ref_id is None:
+        return
+
+    maintenant = datetime.utcnow()
+    if job.type == 'otp':
+        otp = OTP.query.get(job.ref_id)
+        if otp and job.statut == 'sent':
+            otp.sid_twilio = job.sid_twilio
+    elif job.type == 'rappel':
+        rappel = Rappel.query.get(job.ref_id)
+        if rappel:
+            if job.statut == 'sent':
+                rappel.statut = 'sent'
+                rappel.sid_twilio = job.sid_twilio
+            else:
+                rappel.statut = 'failed'
+            rappel.updated_at = maintenant
+    elif job.type == 'notification':
+        notification = Notification.query.get(job.ref_id)
+        if notification:
+            if job.statut == 'sent':
+                notification.sid_twilio = job.sid_twilio
+                notification.envoye = True
+                notification.envoye_at = maintenant
+            else:
+                notification.statut_twilio = 'failed'
+
+
+def traiter_job(job, provider):
+    """
+    Envoyer un job réservé et enregistrer le résultat
+
+    En cas d'échec, le job est replanifié avec un backoff exponentiel
+    jusqu'à `max_tentatives`, puis marqué 'failed'.
+
+    Returns:
+        bool: True si le SMS est parti
+    """
+    from app import db, metrics
+
+    try:
+        with metrics.span(metrics.SMS_DUREE, path="queue"):
+            sid = provider.envoyer(job.destinataire, job.corps)
+    except Exception as e:
+        job.tentatives += 1
+        job.derniere_erreur = str(e)
+        if job.tentatives >= job.max_tentatives:
+            job.statut = 'failed'
+            _finaliser(job)
+        else:
+            job.statut = 'pending'
+            job.prochain_essai_at = datetime.utcnow() + timedelta(seconds=_delai_retry(job.tentatives))
+        db.session.commit()
+        return False
+
+    job.tentatives += 1
+    job.statut = 'sent'
+    job.sid_twilio = sid
+    job.derniere_erreur = None
+    _finaliser(job)
+    db.session.commit()
+    return True
+
+
+def vider_file(provider, batch=50):
+    """
+    Traiter tous les jobs prêts (utile en test et en mode synchrone)
+
+    Returns:
+        dict: {'sent': int, 'failed': int}
+    """
+    sent = 0
+    failed = 0
+    while True:
+        jobs = reclamer_jobs(batch)
+        if not jobs:
+            break
+        for job in jobs:
+            if traiter_job(job, provider):
+                sent += 1
+            else:
+                failed += 1
+    return {'sent': sent, 'failed': failed}
+
+
+# ============================================================
+# POOL DE WORKERS
+# ============================================================
+
+class SmsWorkerPool:
+    """Threads qui vident la file `sms_job` en continu"""
+
+    def __init__(self, app, provider, nb_workers=2, batch=10, intervalle=0.5):
+        """
+        Args:
+            app: Application Flask (chaque thread ouvre son propre app context)
+            provider: Provider utilisé pour l'envoi
+            nb_workers: Nombre de threads d'envoi
+            batch: Nombre de jobs réservés à la fois par un thread
+            intervalle: Attente (secondes) quand la file est vide
+        """
+        self.app = app
+        self.provider = provider
+        self.nb_workers = nb_workers
+        self.batch = batch
+        self.intervalle = intervalle
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+
+    def start(self):
+        """
+        Démarrer les threads d'envoi
+
+        Sans effet s'ils tournent déjà dans ce processus ; après un fork
+        (gunicorn --preload) les threads du parent n'existent plus et
+        sont recréés.
+        """
+        if self._pid == os.getpid() and any(t.is_alive() for t in self._threads):
+            return self
+        self._pid = os.getpid()
+        self._threads = []
+        self._stop = threading.Event()
+        for i in range(self.nb_workers):
+            thread = threading.Thread(target=self._boucle, name=f"sms-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=10):
+        """Arrêter les threads (les envois en cours se terminent)"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _boucle(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    jobs = reclamer_jobs(self.batch)
+                    for job in jobs:
+                        traiter_job(job, self.provider)
+                except Exception as e:
+                    print("Erreur worker SMS :", e)
+                    jobs = []
+            if not jobs:
+                self._stop.wait(self.intervalle)
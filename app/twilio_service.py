@@ -3,13 +3,37 @@ Service Twilio pour gérer :
 - OTP (One-Time Password)
 - Rappels (Reminders)
 - Notifications
+
+Deux modes d'envoi (variable SMS_QUEUE_MODE) :
+- sync  : le SMS part pendant la requête
+- async : le SMS est mis en file (table sms_job) et envoyé par les workers
 """
 
+import math
 import os
 import random
 import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from sqlalchemy import insert, select, update
 from twilio.rest import Client
+from app.sms_queue import TwilioProvider, FakeProvider, SmsWorkerPool, enqueue, enqueue_lot
+from app.rate_limit import TokenBucket, creer_limiteur
+from app import metrics
+
+
+# Envois groupés : taille des requêtes IN et des lots de commits
+TAILLE_PAQUET_SQL = 500
+TAILLE_LOT_COMMIT = 100
+
+# OTP : validité, fenêtre de regroupement des renvois, limites par clé
+DUREE_VALIDITE_OTP = timedelta(minutes=10)
+FENETRE_RENVOI_OTP = int(os.environ.get('OTP_RESEND_WINDOW', 60))
+OTP_ENVOIS_MAX = int(os.environ.get('OTP_SEND_MAX', 3))
+OTP_VERIFICATIONS_MAX = int(os.environ.get('OTP_VERIFY_MAX', 5))
+OTP_PERIODE_LIMITE = int(os.environ.get('OTP_LIMIT_PERIOD', 600))
 
 
 class TwilioService:
@@ -25,7 +49,51 @@ class TwilioService:
             self.client = Client(self.account_sid, self.auth_token)
         else:
             self.client = None
+
+        # Provider d'envoi : Twilio, ou faux provider local (SMS_PROVIDER=fake)
+        if os.environ.get('SMS_PROVIDER') == 'fake':
+            self.provider = FakeProvider()
+        elif self.client:
+            self.provider = TwilioProvider(self.client, self.phone_sender)
+        else:
+            self.provider = None
             print("⚠️  Twilio non configuré - variables d'environnement manquantes")
+
+        self.mode_async = os.environ.get('SMS_QUEUE_MODE', 'sync') == 'async'
+
+        # Envois : par utilisateur et par numéro ; vérifications : par utilisateur
+        self.limite_envoi_otp = creer_limiteur(OTP_ENVOIS_MAX, OTP_PERIODE_LIMITE)
+        self.limite_verification_otp = creer_limiteur(OTP_VERIFICATIONS_MAX, OTP_PERIODE_LIMITE)
+        # Deux demandes simultanées pour le même numéro ne créent qu'un OTP
+        self._verrous_otp = [threading.Lock() for _ in range(64)]
+
+    def _envoyer_sms(self, destinataire, corps):
+        """Envoyer un SMS immédiatement et renvoyer son SID"""
+        with metrics.span(metrics.SMS_DUREE, path="sync"):
+            return self.provider.envoyer(destinataire, corps)
+
+    def _disponible(self):
+        """
+        Un provider est exigé dans les deux modes : en async, un job mis en
+        file sans provider ne serait jamais envoyé et l'appelant croirait
+        l'envoi en cours
+        """
+        return self.provider is not None
+
+    def demarrer_workers(self, app, nb_workers=None):
+        """
+        Démarrer un pool de threads qui vide la file d'envoi
+
+        Args:
+            app: Application Flask
+            nb_workers: Nombre de threads (par défaut : SMS_QUEUE_WORKERS)
+
+        Returns:
+            SmsWorkerPool
+        """
+        if nb_workers is None:
+            nb_workers = int(os.environ.get('SMS_QUEUE_WORKERS', 2))
+        return SmsWorkerPool(app, self.provider, nb_workers=nb_workers).start()
     
     # ============================================================
     # OTP (ONE-TIME PASSWORD)
@@ -39,49 +107,110 @@ class TwilioService:
     def envoyer_otp(self, user_id, phone_number):
         """
         Générer et envoyer un OTP par SMS
+
+        Une nouvelle demande pour le même numéro dans les FENETRE_RENVOI_OTP
+        secondes réutilise l'OTP en cours (aucun SMS, aucune écriture).
+        Au-delà, au plus OTP_ENVOIS_MAX envois par OTP_PERIODE_LIMITE
+        secondes, par utilisateur et par numéro.
         
         Args:
             user_id: ID de l'utilisateur
             phone_number: Numéro de téléphone (au format +33...)
         
         Returns:
-            dict: {'success': bool, 'otp_id': int, 'message': str}
+            dict: {'success': bool, 'otp_id': int, 'job_id': int (mode async),
+                   'coalesce': bool, 'message': str}
+                  ou {'success': False, 'limite': True, 'retry_after': int, 'message': str}
         """
         # Import local pour éviter les imports circulaires
         from app import db
         from app.models import OTP
         
-        if not self.client:
+        if not self._disponible():
             return {'success': False, 'message': 'Twilio non configuré'}
-        
+
+        verrou = self._verrous_otp[hash((user_id, phone_number)) % len(self._verrous_otp)]
+        with verrou:
+            maintenant = datetime.utcnow()
+            en_cours = OTP.query.filter(
+                OTP.user_id == user_id,
+                OTP.phone_number == phone_number,
+                OTP.verified == False,  # noqa: E712
+                OTP.expire_at > maintenant,
+                OTP.created_at >= maintenant - timedelta(seconds=FENETRE_RENVOI_OTP),
+            ).order_by(OTP.created_at.desc()).first()
+            if en_cours is not None:
+                return {
+                    'success': True,
+                    'otp_id': en_cours.id,
+                    'coalesce': True,
+                    'message': 'Un code vient déjà d\'être envoyé à ce numéro'
+                }
+
+            # Un refus sur un seau rend les jetons déjà pris : une demande
+            # refusée pour le numéro ne consomme pas le quota de l'utilisateur
+            pris = []
+            for cle in (f"otp_send:user:{user_id}", f"otp_send:phone:{phone_number}"):
+                autorise, attente = self.limite_envoi_otp.autoriser(cle)
+                if not autorise:
+                    for cle_prise in pris:
+                        self.limite_envoi_otp.rendre(cle_prise)
+                    return self._refus_limite(attente)
+                pris.append(cle)
+
+            return self._creer_et_envoyer_otp(db, OTP, user_id, phone_number)
+
+    @staticmethod
+    def _refus_limite(attente):
+        retry_after = max(1, math.ceil(attente))
+        return {
+            'success': False,
+            'valid': False,
+            'limite': True,
+            'retry_after': retry_after,
+            'message': f'Trop de tentatives, réessayez dans {retry_after} s'
+        }
+
+    def _creer_et_envoyer_otp(self, db, OTP, user_id, phone_number):
         try:
             # Générer le code OTP
             code_otp = self.generer_otp()
+            corps = f"Votre code OTP est : {code_otp}\nValide pendant 10 minutes."
             
             # Sauvegarder l'OTP en base
             otp = OTP(
                 user_id=user_id,
                 code=code_otp,
                 phone_number=phone_number,
-                expire_at=datetime.utcnow() + timedelta(minutes=10)
+                expire_at=datetime.utcnow() + DUREE_VALIDITE_OTP
             )
             db.session.add(otp)
+
+            if self.mode_async:
+                db.session.flush()
+                job = enqueue('otp', phone_number, corps, ref_id=otp.id, commit=False)
+                db.session.commit()
+                return {
+                    'success': True,
+                    'otp_id': otp.id,
+                    'job_id': job.id,
+                    'coalesce': False,
+                    'message': "OTP en cours d'envoi"
+                }
+
             db.session.commit()
             
             # Envoyer le SMS
-            message = self.client.messages.create(
-                body=f"Votre code OTP est : {code_otp}\nValide pendant 10 minutes.",
-                from_=self.phone_sender,
-                to=phone_number
-            )
+            sid = self._envoyer_sms(phone_number, corps)
             
             # Mettre à jour le SID Twilio
-            otp.sid_twilio = message.sid
+            otp.sid_twilio = sid
             db.session.commit()
             
             return {
                 'success': True,
                 'otp_id': otp.id,
+                'coalesce': False,
                 'message': 'OTP envoyé avec succès'
             }
         
@@ -96,12 +225,21 @@ class TwilioService:
             user_id: ID de l'utilisateur
             code: Le code OTP à vérifier
         
+        Au plus OTP_VERIFICATIONS_MAX essais par OTP_PERIODE_LIMITE secondes
+        et par utilisateur (un code à 6 chiffres ne résiste pas à un essai
+        exhaustif non limité).
+
         Returns:
             dict: {'valid': bool, 'message': str}
+                  ou {'valid': False, 'limite': True, 'retry_after': int, 'message': str}
         """
         # Import local pour éviter les imports circulaires
         from app import db
         from app.models import OTP
+
+        autorise, attente = self.limite_verification_otp.autoriser(f"otp_verify:user:{user_id}")
+        if not autorise:
+            return self._refus_limite(attente)
         
         try:
             otp = OTP.query.filter_by(
@@ -126,6 +264,32 @@ class TwilioService:
         
         except Exception as e:
             return {'valid': False, 'message': str(e)}
+
+    def purger_otp(self, taille_lot=1000):
+        """
+        Supprimer par lots les OTP expirés (politique `otp` de app/retention.py)
+        et les seaux de limitation pleins
+
+        Passe par retention.executer : même verrou que la rétention
+        planifiée, qui ne tourne donc jamais en même temps.
+
+        Returns:
+            int | None: Nombre d'OTP supprimés (None : rétention déjà en
+            cours dans un autre processus, rien n'a été fait)
+        """
+        from app import retention
+
+        rapport = retention.executer(['otp'], taille_lot=taille_lot)
+        if not rapport['verrou']:
+            return None
+        self.purger_limites()
+        return sum(table['supprimees'] for table in rapport['tables'])
+
+    def purger_limites(self):
+        """Supprimer les seaux de limitation pleins (backend sqlite)"""
+        for limiteur in (self.limite_envoi_otp, self.limite_verification_otp):
+            if hasattr(limiteur, 'purger'):
+                limiteur.purger()
     
     # ============================================================
     # RAPPELS (REMINDERS)
@@ -139,13 +303,13 @@ class TwilioService:
             rappel_id: ID du rappel
         
         Returns:
-            dict: {'success': bool, 'message': str}
+            dict: {'success': bool, 'sid' | 'job_id' (mode async), 'message': str}
         """
         # Import local pour éviter les imports circulaires
         from app import db
         from app.models import Rappel
         
-        if not self.client:
+        if not self._disponible():
             return {'success': False, 'message': 'Twilio non configuré'}
         
         try:
@@ -161,20 +325,28 @@ class TwilioService:
             # Construire le message SMS
             message_sms = rappel.message_sms or f"Rappel : {rappel.titre}\n{rappel.description or ''}"
             
+            if self.mode_async:
+                # 'queued' : le scheduler ne le reprendra pas pendant l'attente dans la file
+                rappel.statut = 'queued'
+                rappel.updated_at = datetime.utcnow()
+                job = enqueue('rappel', phone_number, message_sms, ref_id=rappel.id, commit=False)
+                db.session.commit()
+                return {
+                    'success': True,
+                    'message': "Rappel en cours d'envoi",
+                    'job_id': job.id
+                }
+            
             # Envoyer le SMS
-            message = self.client.messages.create(
-                body=message_sms,
-                from_=self.phone_sender,
-                to=phone_number
-            )
+            sid = self._envoyer_sms(phone_number, message_sms)
             
             # Mettre à jour le rappel
-            rappel.marquer_envoye(message.sid)
+            rappel.marquer_envoye(sid)
             
             return {
                 'success': True,
                 'message': 'Rappel envoyé avec succès',
-                'sid': message.sid
+                'sid': sid
             }
         
         except Exception as e:
@@ -194,13 +366,13 @@ class TwilioService:
             contenu: Contenu de la notification
         
         Returns:
-            dict: {'success': bool, 'notification_id': int, 'message': str}
+            dict: {'success': bool, 'notification_id': int, 'job_id': int (mode async), 'message': str}
         """
         # Import local pour éviter les imports circulaires
         from app import db
         from app.models import User, Notification
         
-        if not self.client:
+        if not self._disponible():
             return {'success': False, 'message': 'Twilio non configuré'}
         
         try:
@@ -220,16 +392,22 @@ class TwilioService:
             
             # Construire le message SMS
             message_text = f"{titre}\n{contenu}"
+
+            if self.mode_async:
+                job = enqueue('notification', user.phone_number, message_text, ref_id=notification.id, commit=False)
+                db.session.commit()
+                return {
+                    'success': True,
+                    'notification_id': notification.id,
+                    'job_id': job.id,
+                    'message': "Notification en cours d'envoi"
+                }
             
             # Envoyer le SMS
-            message = self.client.messages.create(
-                body=message_text,
-                from_=self.phone_sender,
-                to=user.phone_number
-            )
+            sid = self._envoyer_sms(user.phone_number, message_text)
             
             # Sauvegarder le SID Twilio
-            notification.sid_twilio = message.sid
+            notification.sid_twilio = sid
             notification.envoye = True
             notification.envoye_at = datetime.utcnow()
             db.session.commit()
@@ -243,35 +421,162 @@ class TwilioService:
         except Exception as e:
             return {'success': False, 'message': str(e)}
     
-    def envoyer_notification_multiple(self, user_ids, titre, contenu):
+    def envoyer_notification_multiple(self, user_ids, titre, contenu, max_concurrence=None, debit=None):
         """
         Envoyer une notification à plusieurs utilisateurs
         
+        Les numéros sont lus en une requête (par paquets) et les
+        notifications insérées par un seul INSERT multi-lignes. Les SMS
+        partent ensuite via un pool de threads borné, limité par un token
+        bucket au débit du provider ; les statuts sont enregistrés par
+        UPDATE groupés, un commit par lot.
+        
         Args:
             user_ids: Liste d'IDs d'utilisateurs
             titre: Titre de la notification
             contenu: Contenu de la notification
+            max_concurrence: Envois simultanés (défaut : SMS_MAX_CONCURRENCE)
+            debit: Messages par seconde autorisés (défaut : SMS_DEBIT_MAX)
         
         Returns:
-            dict: {'success': bool, 'sent': int, 'failed': int}
+            dict: {'success': bool, 'sent': int, 'failed': int, 'results': list,
+                   'duree_s': float, 'debit_msg_s': float}
         """
-        sent = 0
-        failed = 0
+        # Import local pour éviter les imports circulaires
+        from app import db
+        from app.models import User, Notification
+        
+        debut = time.perf_counter()
+        if max_concurrence is None:
+            max_concurrence = int(os.environ.get('SMS_MAX_CONCURRENCE', 8))
+        if debit is None:
+            debit = float(os.environ.get('SMS_DEBIT_MAX', 10))
         
+        user_ids = list(dict.fromkeys(user_ids))
+        results = {}
+        
+        # Charger les numéros (par paquets pour la limite de paramètres SQLite) :
+        # des tuples, pas des instances User expirées au premier commit
+        telephones = {}
+        for i in range(0, len(user_ids), TAILLE_PAQUET_SQL):
+            paquet = user_ids[i:i + TAILLE_PAQUET_SQL]
+            telephones.update(db.session.execute(
+                select(User.id, User.phone_number).where(User.id.in_(paquet))
+            ).all())
+        
+        destinataires = []
         for user_id in user_ids:
-            result = self.envoyer_notification(user_id, titre, contenu)
-            if result['success']:
-                sent += 1
+            if not telephones.get(user_id):
+                results[user_id] = {'user_id': user_id, 'success': False, 'message': 'Utilisateur ou numéro non trouvé'}
+            elif not self._disponible():
+                results[user_id] = {'user_id': user_id, 'success': False, 'message': 'Twilio non configuré'}
             else:
-                failed += 1
+                destinataires.append((user_id, telephones[user_id]))
+        
+        message_text = f"{titre}\n{contenu}"
+        
+        try:
+            # Toutes les notifications en un INSERT multi-lignes. L'ordre des
+            # lignes de RETURNING n'est pas garanti : rapprochement par user_id
+            # (unique dans l'envoi)
+            notification_ids = dict(db.session.execute(
+                insert(Notification).returning(Notification.user_id, Notification.id),
+                [{'user_id': user_id, 'titre': titre, 'contenu': contenu, 'type': 'sms'}
+                 for user_id, _ in destinataires]
+            ).all()) if destinataires else {}
+            envois = [
+                (user_id, phone_number, notification_ids[user_id])
+                for user_id, phone_number in destinataires
+            ]
+            
+            if self.mode_async:
+                job_ids = enqueue_lot(
+                    'notification',
+                    [(phone_number, message_text, notification_id) for _, phone_number, notification_id in envois],
+                    commit=False
+                )
+                db.session.commit()
+                for (user_id, _, notification_id), job_id in zip(envois, job_ids):
+                    results[user_id] = {'user_id': user_id, 'success': True, 'notification_id': notification_id, 'job_id': job_id}
+            else:
+                # Libérer le verrou d'écriture avant les envois
+                db.session.commit()
+                self._envoyer_en_parallele(envois, message_text, results, max_concurrence, debit)
+        
+        except Exception as e:
+            db.session.rollback()
+            for user_id, _ in destinataires:
+                results.setdefault(user_id, {'user_id': user_id, 'success': False, 'message': str(e)})
+        
+        duree = time.perf_counter() - debut
+        ordonnes = [results[user_id] for user_id in user_ids]
+        sent = sum(1 for r in ordonnes if r['success'])
+        failed = len(ordonnes) - sent
         
         return {
             'success': failed == 0,
             'sent': sent,
             'failed': failed,
-            'message': f'{sent} envoyées, {failed} échouées'
+            'message': f'{sent} envoyées, {failed} échouées',
+            'results': ordonnes,
+            'duree_s': round(duree, 3),
+            'debit_msg_s': round(sent / duree, 2) if duree > 0 else 0.0
         }
     
+    def _envoyer_en_parallele(self, envois, message_text, results, max_concurrence, debit):
+        """
+        Envoyer via un pool borné + token bucket
+        
+        Les statuts sont écrits par lots de TAILLE_LOT_COMMIT : un UPDATE
+        executemany par clé primaire et un commit par lot.
+        
+        Args:
+            envois: Liste de (user_id, numéro, notification_id)
+        """
+        from app import db
+        from app.models import Notification
+        
+        limiteur = TokenBucket(rate=debit)
+        statuts = []
+        
+        def envoyer(phone_number):
+            limiteur.acquire()
+            return self._envoyer_sms(phone_number, message_text)
+        
+        def enregistrer():
+            # Succès et échecs n'ont pas les mêmes colonnes : un executemany par forme
+            for valeurs in (
+                [ligne for ligne in statuts if 'sid_twilio' in ligne],
+                [ligne for ligne in statuts if 'sid_twilio' not in ligne],
+            ):
+                if valeurs:
+                    db.session.execute(update(Notification), valeurs)
+            db.session.commit()
+            statuts.clear()
+        
+        # Les threads ne font que l'appel HTTP : la session reste dans ce thread
+        with ThreadPoolExecutor(max_workers=max_concurrence) as pool:
+            futures = {
+                pool.submit(envoyer, phone_number): (user_id, notification_id)
+                for user_id, phone_number, notification_id in envois
+            }
+            for future in as_completed(futures):
+                user_id, notification_id = futures[future]
+                try:
+                    sid = future.result()
+                except Exception as e:
+                    statuts.append({'id': notification_id, 'statut_twilio': 'failed'})
+                    results[user_id] = {'user_id': user_id, 'success': False, 'notification_id': notification_id, 'message': str(e)}
+                else:
+                    statuts.append({'id': notification_id, 'sid_twilio': sid, 'envoye': True, 'envoye_at': datetime.utcnow()})
+                    results[user_id] = {'user_id': user_id, 'success': True, 'notification_id': notification_id, 'sid': sid}
+                
+                if len(statuts) >= TAILLE_LOT_COMMIT:
+                    enregistrer()
+        
+        if statuts:
+            enregistrer()
+    
     # ============================================================
     # UTILITAIRES
     # ============================================================
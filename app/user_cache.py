@@ -0,0 +1,201 @@
+"""
+Cache de l'utilisateur connecté (user_loader de Flask-Login)
+
+Flask-Login recharge l'utilisateur à chaque requête authentifiée. Pour
+éviter ce SELECT :
+- Cache par processus : les colonnes de chaque utilisateur (jamais
+  l'instance ORM, liée à une session) dans un LRU avec TTL
+- Instantané dans la session Flask (USER_SESSION_SNAPSHOT=1) : les mêmes
+  colonnes, sans le hash du mot de passe, signées dans le cookie ; la
+  requête n'a alors besoin d'aucun cache côté serveur
+
+À chaque requête, une instance détachée est reconstruite puis attachée à
+la session SQLAlchemy sans SELECT (`merge(load=False)`) : relations et
+modifications fonctionnent comme avec un User chargé depuis la base.
+
+Invalidation : toute modification d'un User par l'ORM (flush puis commit)
+retire l'utilisateur du cache du processus. Les autres workers gardent
+leur copie au plus USER_CACHE_TTL secondes, et un instantané de session au
+plus USER_SNAPSHOT_TTL secondes. Les `query.update()` en masse ne passent
+pas par ces événements.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, event
+from sqlalchemy.orm import make_transient_to_detached, object_session
+
+from app.cache import LRUCache
+
+
+DEFAULT_TTL = float(os.environ.get("USER_CACHE_TTL", 60))
+DEFAULT_MAX_USERS = int(os.environ.get("USER_CACHE_SIZE", 10000))
+SNAPSHOT_TTL = float(os.environ.get("USER_SNAPSHOT_TTL", 30))
+
+CLE_SESSION = "_user_snapshot"
+# Jamais copiées dans le cookie de session
+COLONNES_PRIVEES = ("password_hash",)
+
+
+class UserCache:
+    """Utilisateurs récemment chargés, par id"""
+
+    def __init__(self, modele, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAX_USERS,
+                 snapshot_session=None, snapshot_ttl=SNAPSHOT_TTL):
+        """
+        Args:
+            modele: Classe du modèle utilisateur (User)
+            ttl: Durée de vie d'une entrée du cache du processus (secondes)
+            maxsize: Nombre maximum d'utilisateurs en cache
+            snapshot_session: Utiliser l'instantané de session (par défaut USER_SESSION_SNAPSHOT)
+            snapshot_ttl: Durée de vie d'un instantané de session (secondes)
+        """
+        self.modele = modele
+        # Colonnes de la table (le mapper n'est pas encore configuré ici)
+        self.colonnes = [c.key for c in modele.__table__.columns]
+        self.colonnes_datetime = {c.key for c in modele.__table__.columns if isinstance(c.type, DateTime)}
+        if snapshot_session is None:
+            snapshot_session = os.environ.get("USER_SESSION_SNAPSHOT") == "1"
+        self.snapshot_session = snapshot_session
+        self.snapshot_ttl = snapshot_ttl
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        # Date de la dernière modification connue de chaque utilisateur :
+        # les instantanés de session plus anciens sont ignorés
+        self._modifies = LRUCache(maxsize=maxsize, ttl=snapshot_ttl)
+        self._lock = threading.Lock()
+        self.hits_session = 0
+        self.chargements_db = 0
+        self.invalidations = 0
+
+        event.listen(modele, "after_update", self._apres_modification)
+        event.listen(modele, "after_delete", self._apres_modification)
+
+    # ------------------------------------------------------------
+    # Chargement
+    # ------------------------------------------------------------
+
+    def charger(self, user_id):
+        """
+        Utilisateur attaché à la session courante, ou None s'il n'existe pas
+
+        Args:
+            user_id: Identifiant (int)
+        """
+        from app import db
+
+        if self.snapshot_session:
+            colonnes = self._lire_session(user_id)
+            if colonnes is not None:
+                with self._lock:
+                    self.hits_session += 1
+                return self._attacher(db, colonnes)
+
+        colonnes = self._cache.get(user_id)
+        if colonnes is not None:
+            return self._attacher(db, colonnes)
+
+        user = db.session.get(self.modele, user_id)
+        with self._lock:
+            self.chargements_db += 1
+        if user is None:
+            return None
+        colonnes = {nom: getattr(user, nom) for nom in self.colonnes}
+        self._cache.set(user_id, colonnes)
+        if self.snapshot_session:
+            self._ecrire_session(colonnes)
+        return user
+
+    def _attacher(self, db, colonnes):
+        user = self.modele(**colonnes)
+        make_transient_to_detached(user)
+        # Aucun SELECT : l'instance est ajoutée telle quelle à l'identity map
+        # (ou celle déjà chargée dans la requête est renvoyée)
+        return db.session.merge(user, load=False)
+
+    def _lire_session(self, user_id):
+        from flask import session
+
+        instantane = session.get(CLE_SESSION)
+        if not instantane or instantane.get("id") != user_id:
+            return None
+        if instantane["t"] + self.snapshot_ttl < time.time():
+            return None
+        modifie = self._modifies.get(user_id)
+        if modifie is not None and modifie >= instantane["t"]:
+            return None
+
+        colonnes = dict(instantane["colonnes"])
+        for nom in self.colonnes_datetime:
+            if colonnes.get(nom):
+                colonnes[nom] = datetime.fromisoformat(colonnes[nom])
+        return colonnes
+
+    def _ecrire_session(self, colonnes):
+        from flask import session
+
+        publiques = {}
+        for nom, valeur in colonnes.items():
+            if nom in COLONNES_PRIVEES:
+                continue
+            publiques[nom] = valeur.isoformat() if isinstance(valeur, datetime) else valeur
+        session[CLE_SESSION] = {"id": colonnes["id"], "t": time.time(), "colonnes": publiques}
+
+    def effacer_session(self):
+        """Retirer l'instantané du cookie (déconnexion)"""
+        from flask import session
+
+        session.pop(CLE_SESSION, None)
+
+    # ------------------------------------------------------------
+    # Invalidation
+    # ------------------------------------------------------------
+
+    def invalider(self, user_id):
+        """Retirer un utilisateur du cache (à appeler après une modification hors ORM)"""
+        self._retirer(user_id)
+        with self._lock:
+            self.invalidations += 1
+
+    def _retirer(self, user_id):
+        self._cache.pop(user_id)
+        self._modifies.set(user_id, time.time())
+
+    def _apres_modification(self, mapper, connection, target):
+        # Retiré dès le flush, puis à nouveau après le commit : une requête
+        # concurrente a pu relire l'ancienne ligne entre les deux
+        self.invalider(target.id)
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault("users_modifies", set()).add(target.id)
+
+    def brancher_session(self, session):
+        """Invalider après chaque commit les utilisateurs modifiés dans la transaction"""
+        def apres_commit(sess):
+            for user_id in sess.info.pop("users_modifies", ()):
+                self._retirer(user_id)
+
+        def apres_rollback(sess, transaction):
+            sess.info.pop("users_modifies", None)
+
+        event.listen(session, "after_commit", apres_commit)
+        event.listen(session, "after_soft_rollback", apres_rollback)
+
+    def vider(self):
+        self._cache.clear()
+
+    def stats(self):
+        cache = self._cache.stats()
+        with self._lock:
+            hits_session = self.hits_session
+            chargements_db = self.chargements_db
+        total = cache['hits'] + hits_session + chargements_db
+        return {
+            'processus': cache,
+            'session': {'active': self.snapshot_session, 'ttl': self.snapshot_ttl, 'hits': hits_session},
+            'chargements_db': chargements_db,
+            'invalidations': self.invalidations,
+            'hit_rate': round((cache['hits'] + hits_session) / total, 4) if total else 0.0,
+        }
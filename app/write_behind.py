@@ -0,0 +1,256 @@
+"""
+Écriture différée (write-behind) des échanges du chatbot
+
+Les paires message utilisateur / réponse du bot (et la ligne Historique
+correspondante) sont gardées en mémoire puis insérées en une seule
+transaction toutes les N millisecondes ou dès N échanges, ce qui sort le
+commit (et son fsync) du temps de réponse de /api/chat.
+
+Échecs d'écriture :
+- Le tampon est borné (max_en_attente) : au-delà, les nouveaux échanges
+  partent directement dans le fichier de rejets
+- Un lot en échec est remis en file, et le thread espace ses essais
+  (backoff exponentiel, BACKOFF_MAX secondes au plus)
+- Chaque échange compte ses tentatives. Sur une erreur propre aux données
+  (clé étrangère vers un utilisateur supprimé...) ou quand un échange
+  atteint max_tentatives, le lot est réessayé échange par échange : les
+  lignes fautives vont au fichier de rejets (une ligne JSON par échange,
+  instance/write_behind_rejets.ndjson) et ne bloquent plus les autres
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+
+BACKOFF_MAX = 30.0
+# Erreurs qui ne disparaîtront pas en réessayant la même ligne
+ERREURS_DONNEES = (IntegrityError, DataError)
+
+
+class WriteBehindBuffer:
+    """Tampon d'échanges vidé en lot par un thread de fond"""
+
+    def __init__(self, app, intervalle_ms=200, max_echanges=200, max_en_attente=10000,
+                 max_tentatives=8, fichier_rejets=None):
+        """
+        Args:
+            app: Application Flask (le thread ouvre son propre app context)
+            intervalle_ms: Délai maximum avant l'écriture d'un échange
+            max_echanges: Nombre d'échanges qui déclenche un flush immédiat
+            max_en_attente: Échanges gardés en mémoire au plus
+            max_tentatives: Écritures tentées pour un échange avant son rejet
+            fichier_rejets: Fichier des échanges rejetés (défaut : instance/write_behind_rejets.ndjson)
+        """
+        self.app = app
+        self.intervalle = intervalle_ms / 1000
+        self.max_echanges = max_echanges
+        self.max_en_attente = max_en_attente
+        self.max_tentatives = max_tentatives
+        self.fichier_rejets = fichier_rejets or os.path.join(app.instance_path, "write_behind_rejets.ndjson")
+        self._echanges = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._rejets_lock = threading.Lock()
+        self._reveil = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.flushes = 0
+        self.lignes_ecrites = 0
+        self.erreurs = 0
+        self.echecs_consecutifs = 0
+        self.rejetes = 0
+        self.dernier_flush_ms = 0.0
+        atexit.register(self.fermer)
+
+    def _demarrer_si_besoin(self):
+        # Le thread est créé dans le processus qui écrit : après un fork
+        # (gunicorn --preload) le thread du parent n'existe plus
+        if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._boucle, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def ajouter_echange(self, user_id, message, reponse, intent=None, confiance=None):
+        """Mettre en attente un échange (horodaté maintenant)"""
+        echange = {
+            'user_id': user_id,
+            'message': message,
+            'reponse': reponse,
+            'intent': intent,
+            'confiance': confiance,
+            'timestamp': datetime.utcnow(),
+            'tentatives': 0,
+        }
+        with self._lock:
+            self._demarrer_si_besoin()
+            deborde = len(self._echanges) >= self.max_en_attente
+            if not deborde:
+                self._echanges.append(echange)
+            plein = len(self._echanges) >= self.max_echanges
+        if deborde:
+            self._rejeter([echange], "tampon plein")
+        if plein:
+            self._reveil.set()
+
+    def flush(self):
+        """
+        Écrire tous les échanges en attente en une transaction
+
+        Returns:
+            int: Nombre d'échanges écrits
+        """
+        from app import db
+
+        with self._flush_lock:
+            with self._lock:
+                echanges, self._echanges = self._echanges, []
+            if not echanges:
+                self.echecs_consecutifs = 0
+                return 0
+
+            debut = time.perf_counter()
+            with self.app.app_context():
+                try:
+                    self._inserer(db, echanges)
+                    db.session.commit()
+                    ecrits = len(echanges)
+                except Exception as e:
+                    db.session.rollback()
+                    self.erreurs += 1
+                    print("⚠️  Erreur write-behind :", e)
+                    for echange in echanges:
+                        echange['tentatives'] += 1
+                    if isinstance(e, ERREURS_DONNEES) or any(
+                        echange['tentatives'] >= self.max_tentatives for echange in echanges
+                    ):
+                        ecrits = self._isoler(db, echanges)
+                    else:
+                        self.echecs_consecutifs += 1
+                        self._remettre(echanges)
+                        return 0
+
+            self.echecs_consecutifs = 0 if ecrits else self.echecs_consecutifs + 1
+            if ecrits:
+                self.flushes += 1
+                self.lignes_ecrites += 3 * ecrits
+                self.dernier_flush_ms = round((time.perf_counter() - debut) * 1000, 2)
+            return ecrits
+
+    def _inserer(self, db, echanges):
+        from app.models import Message, Historique
+
+        messages = []
+        historiques = []
+        for e in echanges:
+            messages.append({'user_id': e['user_id'], 'content': e['message'], 'is_from_user': True, 'timestamp': e['timestamp']})
+            messages.append({'user_id': e['user_id'], 'content': e['reponse'], 'is_from_user': False, 'timestamp': e['timestamp']})
+            historiques.append({
+                'user_id': e['user_id'],
+                'message_utilisateur': e['message'],
+                'reponse_bot': e['reponse'],
+                'intent_detecte': e['intent'],
+                'confiance': e['confiance'],
+                'timestamp': e['timestamp'],
+            })
+        db.session.execute(db.insert(Message), messages)
+        db.session.execute(db.insert(Historique), historiques)
+
+    def _isoler(self, db, echanges):
+        """
+        Réessayer un lot échange par échange : les lignes fautives sont
+        rejetées, les autres écrites (ou remises en file si la base est
+        indisponible et qu'il leur reste des tentatives)
+
+        Returns:
+            int: Nombre d'échanges écrits
+        """
+        ecrits = 0
+        a_remettre = []
+        for echange in echanges:
+            try:
+                self._inserer(db, [echange])
+                db.session.commit()
+                ecrits += 1
+            except Exception as e:
+                db.session.rollback()
+                if isinstance(e, ERREURS_DONNEES) or echange['tentatives'] >= self.max_tentatives:
+                    self._rejeter([echange], f"{type(e).__name__}: {getattr(e, 'orig', None) or e}")
+                else:
+                    a_remettre.append(echange)
+        self._remettre(a_remettre)
+        return ecrits
+
+    def _remettre(self, echanges):
+        """Remettre des échanges en tête de file pour le prochain essai, dans la limite du tampon"""
+        if not echanges:
+            return
+        with self._lock:
+            self._echanges[:0] = echanges
+            exces = len(self._echanges) - self.max_en_attente
+            # Les plus anciens (en tête) partent aux rejets
+            rejetes, self._echanges = (self._echanges[:exces], self._echanges[exces:]) if exces > 0 else ([], self._echanges)
+        if rejetes:
+            self._rejeter(rejetes, "tampon plein")
+
+    def _rejeter(self, echanges, raison):
+        """Ajouter des échanges au fichier de rejets (une ligne JSON chacun)"""
+        lignes = "".join(
+            json.dumps(dict(echange, timestamp=echange['timestamp'].isoformat(), raison=raison), ensure_ascii=False) + "\n"
+            for echange in echanges
+        )
+        with self._rejets_lock:
+            self.rejetes += len(echanges)
+            try:
+                os.makedirs(os.path.dirname(self.fichier_rejets), exist_ok=True)
+                with open(self.fichier_rejets, "a", encoding="utf-8") as file:
+                    file.write(lignes)
+            except OSError as e:
+                print(f"⚠️  {len(echanges)} échange(s) perdu(s), fichier de rejets illisible :", e)
+
+    def _attente(self):
+        if not self.echecs_consecutifs:
+            return self.intervalle
+        return min(self.intervalle * 2 ** self.echecs_consecutifs, BACKOFF_MAX)
+
+    def _boucle(self):
+        while not self._stop.is_set():
+            if self.echecs_consecutifs:
+                # Base en échec : pas de réveil anticipé quand le tampon se remplit
+                self._stop.wait(self._attente())
+            else:
+                self._reveil.wait(self.intervalle)
+                self._reveil.clear()
+            self.flush()
+
+    def fermer(self):
+        """Arrêter le thread et écrire ce qui reste (arrêt du processus)"""
+        self._stop.set()
+        self._reveil.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(5)
+        self.flush()
+        # Plus d'essai possible après l'arrêt : ce qui reste va aux rejets
+        with self._lock:
+            restants, self._echanges = self._echanges, []
+        if restants:
+            self._rejeter(restants, "arrêt du processus")
+
+    def stats(self):
+        return {
+            'en_attente': len(self._echanges),
+            'flushes': self.flushes,
+            'lignes_ecrites': self.lignes_ecrites,
+            'erreurs': self.erreurs,
+            'echecs_consecutifs': self.echecs_consecutifs,
+            'rejetes': self.rejetes,
+            'max_en_attente': self.max_en_attente,
+            'dernier_flush_ms': self.dernier_flush_ms,
+        }
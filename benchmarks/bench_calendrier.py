@@ -0,0 +1,125 @@
+"""
+Calendrier vaccinal (app/calendrier.py) : réponse du chatbot et calcul en masse
+
+- Réponse pour une date de naissance : ancien calcul (boucle timedelta et
+  strftime à chaque appel), moteur sans cache, moteur avec cache
+- Dates de toutes les doses pour N enfants : boucle Python date par date
+  contre une passe vectorisée (matrice enfants x doses)
+- Création des rappels SMS pour N enfants sur une base temporaire
+
+Usage :
+    python benchmarks/bench_calendrier.py --enfants 10000
+    python benchmarks/bench_calendrier.py --requetes 5000 --output calendrier.json
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from outils import ecrire_json, environnement, mesurer
+
+
+def ancienne_reponse(calendrier, saisie):
+    """Calcul d'origine : mois * 30 jours, tout recalculé à chaque message"""
+    naissance = datetime.strptime(saisie, "%d/%m/%Y")
+    response = "💉 **Calendrier de vaccination pour votre enfant :**\n\n"
+    for vaccin, mois in zip(calendrier.vaccins, calendrier.mois.tolist()):
+        response += f"• {vaccin} : {(naissance + timedelta(days=mois * 30)).strftime('%d %B %Y')}\n"
+    return response
+
+
+def naissances_aleatoires(n, graine=0):
+    rng = random.Random(graine)
+    origine = date.today() - timedelta(days=730)
+    return [origine + timedelta(days=rng.randrange(730)) for _ in range(n)]
+
+
+def bench_reponses(calendrier, nb_requetes, nb_dates):
+    from app import calendrier as moteur
+
+    saisies = [d.strftime("%d/%m/%Y") for d in naissances_aleatoires(nb_dates, graine=1)]
+    requetes = [random.Random(2).choice(saisies) for _ in range(nb_requetes)]
+    return {
+        'ancien_calcul': mesurer(lambda s: ancienne_reponse(calendrier, s), requetes),
+        'moteur_sans_cache': mesurer(moteur.texte_vaccination, requetes, preparation=moteur.calendrier_cache.clear),
+        'moteur_avec_cache': mesurer(moteur.texte_vaccination, requetes),
+    }
+
+
+def bench_masse(calendrier, nb_enfants):
+    naissances = naissances_aleatoires(nb_enfants)
+
+    debut = time.perf_counter()
+    boucle = [[n + timedelta(days=int(mois) * 30) for mois in calendrier.mois] for n in naissances]
+    boucle_s = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    matrice = calendrier.dates_lot(naissances)
+    vectorise_s = time.perf_counter() - debut
+
+    assert matrice.shape == (len(boucle), len(calendrier))
+    return {
+        'enfants': nb_enfants,
+        'doses': matrice.size,
+        'boucle_timedelta_ms': round(boucle_s * 1000, 2),
+        'vectorise_ms': round(vectorise_s * 1000, 2),
+    }
+
+
+def bench_rappels(nb_enfants):
+    with tempfile.TemporaryDirectory() as dossier:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(dossier, 'bench.db')}"
+        os.environ.setdefault('CORPUS_WATCH', "0")
+
+        from app import create_app, db
+        from app.calendrier import generer_rappels_vaccination
+        from app.models import User
+
+        app = create_app()
+        with app.app_context():
+            db.session.add_all([
+                User(first_name="Bench", last_name=str(i), username=f"bench{i}", country="BF",
+                     password_hash="x", phone_number=f"+2267000{i:04d}")
+                for i in range(nb_enfants)
+            ])
+            db.session.commit()
+            enfants = list(zip(range(1, nb_enfants + 1), naissances_aleatoires(nb_enfants)))
+            premier = generer_rappels_vaccination(enfants)
+            relance = generer_rappels_vaccination(enfants)
+            db.engine.dispose()
+    return {'premier_passage': premier, 'relance': relance}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requetes", type=int, default=2000, help="Réponses du chatbot mesurées")
+    parser.add_argument("--dates", type=int, default=200, help="Dates de naissance distinctes parmi les requêtes")
+    parser.add_argument("--enfants", type=int, default=10000)
+    parser.add_argument("--rappels", type=int, default=1000, help="Enfants pour la création de rappels (0 = ignorer)")
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    from app.calendrier import vaccination
+
+    resultats = {'reponses': bench_reponses(vaccination, args.requetes, args.dates)}
+    for nom, r in resultats['reponses'].items():
+        print(f"{nom:>18} : p50={r['p50_ms']}ms  p99={r['p99_ms']}ms")
+
+    resultats['masse'] = r = bench_masse(vaccination, args.enfants)
+    print(f"{r['enfants']} enfants ({r['doses']} doses) : boucle {r['boucle_timedelta_ms']}ms, "
+          f"vectorisé {r['vectorise_ms']}ms")
+
+    if args.rappels:
+        resultats['rappels'] = r = bench_rappels(args.rappels)
+        print(f"rappels : {r['premier_passage']['crees']} créés en {r['premier_passage']['duree_s']}s, "
+              f"relance {r['relance']['duree_s']}s ({r['relance']['deja_presents']} déjà présents)")
+
+    if args.output:
+        ecrire_json({'environnement': environnement(), 'parametres': vars(args), 'mesures': resultats}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Benchmark du chemin critique du chatbot et des routes HTTP
+
+Un corpus d'intentions synthétique (taille configurable) est compilé puis
+installé dans le chatbot à la place du corpus réel. Étapes mesurées :
+- preprocess_text (cache froid / chaud)
+- vectorizer.transform
+- similarité + argmax (index inversé, balayage complet, lot)
+- get_bot_response (cache de décisions froid / chaud)
+- /api/chat et /api/history via le client de test Flask, sur une base
+  SQLite temporaire peuplée d'utilisateurs et d'historique synthétiques
+
+Les résultats (p50/p95/p99 en ms, débit) sont écrits en JSON ; --comparer
+signale les étapes dont le p95 dépasse celui d'un résultat précédent.
+
+Usage :
+    python benchmarks/bench_chatbot.py --intents 200 --patterns 20 --output bench.json
+    python benchmarks/bench_chatbot.py --comparer bench.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from outils import comparer, ecrire_json, environnement, mesurer, resumer
+
+SYLLABES = ["ma", "ni", "ko", "te", "ru", "sa", "lo", "be", "fi", "da", "mu", "pe", "zo", "gri", "van"]
+
+
+# ============================================================
+# DONNÉES SYNTHÉTIQUES
+# ============================================================
+
+def generer_vocabulaire(taille, rng):
+    mots = set()
+    while len(mots) < taille:
+        mots.add("".join(rng.choice(SYLLABES) for _ in range(rng.randint(2, 4))))
+    return sorted(mots)
+
+
+def generer_corpus(nb_intents, patterns_par_intent, vocabulaire, rng):
+    """
+    Corpus au format corpus.json : chaque intent a un thème de mots
+    propres, ses patterns mélangent mots du thème et mots quelconques
+
+    Returns:
+        tuple: (corpus, themes par intent)
+    """
+    intents = []
+    themes = []
+    for i in range(nb_intents):
+        theme = rng.sample(vocabulaire, 8)
+        patterns = [
+            " ".join(rng.sample(theme, 3) + rng.sample(vocabulaire, 2))
+            for _ in range(patterns_par_intent)
+        ]
+        intents.append({'tag': f"intent_{i}", 'patterns': patterns, 'responses': [f"Réponse {i}"]})
+        themes.append(theme)
+    return {'intents': intents}, themes
+
+
+def generer_messages(n, themes, vocabulaire, rng):
+    """Messages uniques : 80 % proches d'un intent, 20 % hors sujet"""
+    messages = []
+    for i in range(n):
+        if rng.random() < 0.8:
+            mots = rng.sample(rng.choice(themes), 2) + rng.sample(vocabulaire, 1)
+        else:
+            mots = rng.sample(vocabulaire, 3)
+        messages.append(" ".join(mots) + f" {i}")
+    return messages
+
+
+# ============================================================
+# ÉTAPES DU CHATBOT
+# ============================================================
+
+def bench_chatbot(chatbot, messages):
+    mesures = {}
+
+    def vider_pretraitement():
+        chatbot.lemma_cache.clear()
+        chatbot.preprocess_cache.clear()
+
+    mesures['preprocess_text_froid'] = mesurer(chatbot.preprocess_text, messages, preparation=vider_pretraitement)
+    # La passe froide vide les caches avant chaque appel : les remplir
+    textes = [chatbot.preprocess_text(m) for m in messages]
+    mesures['preprocess_text_chaud'] = mesurer(chatbot.preprocess_text, messages)
+
+    modele = chatbot.modele
+    mesures['vectorizer_transform'] = mesurer(lambda t: modele.vectorizer.transform([t]), textes)
+
+    vecteurs = [modele.vectorizer.transform([t]) for t in textes]
+    index = modele.inverted_index
+    mesures['similarite_index_inverse'] = mesurer(lambda v: index.top_k(v.indices, v.data, k=1), vecteurs)
+    X = modele.X
+    mesures['similarite_balayage'] = mesurer(lambda v: (X @ v.T).toarray().argmax(), vecteurs)
+
+    lots = [textes[i:i + 100] for i in range(0, len(textes), 100)]
+    lot = mesurer(lambda textes_lot: chatbot._classer_textes(textes_lot, modele), lots)
+    lot['messages_par_s'] = round(len(textes) / (lot['moyenne_ms'] * lot['n'] / 1000), 1) if lot['n'] else 0.0
+    mesures['classement_lot_100'] = lot
+
+    mesures['get_bot_response_froid'] = mesurer(
+        chatbot.get_bot_response, messages, preparation=chatbot.decision_cache.clear
+    )
+    chatbot.classer_messages(messages)
+    mesures['get_bot_response_chaud'] = mesurer(chatbot.get_bot_response, messages)
+    return mesures
+
+
+# ============================================================
+# ROUTES HTTP
+# ============================================================
+
+def peupler_base(db, nb_users, messages_par_user, rng, vocabulaire):
+    """Insérer utilisateurs et historique synthétiques en lot"""
+    from datetime import datetime, timedelta
+    from app.models import User, Message
+
+    db.session.execute(db.insert(User), [
+        {
+            'first_name': "Bench", 'last_name': str(i), 'username': f"bench{i}",
+            'country': "BF", 'password_hash': "x",
+        }
+        for i in range(nb_users)
+    ])
+    db.session.commit()
+    user_ids = [u.id for u in User.query.filter(User.username.like("bench%"))]
+
+    origine = datetime.utcnow() - timedelta(days=30)
+    for user_id in user_ids:
+        db.session.execute(db.insert(Message), [
+            {
+                'user_id': user_id,
+                'content': " ".join(rng.sample(vocabulaire, 4)),
+                'is_from_user': j % 2 == 0,
+                'timestamp': origine + timedelta(seconds=j * 30),
+            }
+            for j in range(messages_par_user)
+        ])
+    db.session.commit()
+    return user_ids
+
+
+def bench_http(args, messages, rng, vocabulaire):
+    dossier = tempfile.mkdtemp(prefix="bench_chatbot_")
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(dossier, 'bench.db')}"
+    os.environ['CHAT_WRITE_BEHIND'] = "1" if args.write_behind else "0"
+
+    from app import create_app, db
+    from app.models import Message
+    from app.pagination import encoder_curseur
+
+    app = create_app()
+    with app.app_context():
+        user_ids = peupler_base(db, args.users, args.historique, rng, vocabulaire)
+
+    # Un client (donc une session connectée) par utilisateur
+    clients = {}
+    for user_id in user_ids:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        clients[user_id] = client
+
+    def requete(fonction, n):
+        latences = []
+        debut_total = time.perf_counter()
+        for i in range(n):
+            debut = time.perf_counter()
+            reponse = fonction(i)
+            latences.append(time.perf_counter() - debut)
+            if reponse.status_code != 200:
+                raise RuntimeError(f"Statut {reponse.status_code} : {reponse.get_data(as_text=True)[:200]}")
+        return resumer(latences, time.perf_counter() - debut_total)
+
+    def chat(i):
+        return clients[rng.choice(user_ids)].post("/api/chat", json={'message': messages[i % len(messages)]})
+
+    def history(i):
+        return clients[rng.choice(user_ids)].get("/api/history?limit=50")
+
+    # Curseur vers le début de l'historique : page la plus profonde
+    with app.app_context():
+        curseurs = {}
+        for user_id in user_ids:
+            m = Message.query.filter_by(user_id=user_id).order_by(Message.timestamp, Message.id).offset(50).first()
+            if m is not None:
+                curseurs[user_id] = encoder_curseur(m.timestamp, m.id)
+
+    def history_profonde(i):
+        user_id = rng.choice(list(curseurs))
+        return clients[user_id].get(f"/api/history?limit=50&before={curseurs[user_id]}")
+
+    mesures = {
+        'api_chat': requete(chat, args.requetes),
+        'api_history': requete(history, args.requetes),
+    }
+    if curseurs:
+        mesures['api_history_page_profonde'] = requete(history_profonde, args.requetes)
+
+    tampon = app.extensions.get("write_behind")
+    if tampon is not None:
+        tampon.fermer()
+    return mesures
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--intents", type=int, default=100, help="Nombre d'intents du corpus synthétique")
+    parser.add_argument("--patterns", type=int, default=10, help="Patterns par intent")
+    parser.add_argument("--vocabulaire", type=int, default=5000, help="Taille du vocabulaire synthétique")
+    parser.add_argument("--messages", type=int, default=1000, help="Messages par étape du chatbot")
+    parser.add_argument("--users", type=int, default=50, help="Utilisateurs synthétiques")
+    parser.add_argument("--historique", type=int, default=500, help="Messages d'historique par utilisateur")
+    parser.add_argument("--requetes", type=int, default=500, help="Requêtes HTTP par route")
+    parser.add_argument("--write-behind", action="store_true", help="Activer le write-behind pour /api/chat")
+    parser.add_argument("--sans-http", action="store_true", help="Ne mesurer que le chatbot")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    parser.add_argument("--comparer", help="Résultat JSON de référence")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Hausse de p95 tolérée avec --comparer")
+    args = parser.parse_args()
+
+    rng = random.Random(args.graine)
+    vocabulaire = generer_vocabulaire(args.vocabulaire, rng)
+    corpus, themes = generer_corpus(args.intents, args.patterns, vocabulaire, rng)
+    messages = generer_messages(args.messages, themes, vocabulaire, rng)
+
+    from app import chatbot
+    from app.intent_index import compiler_index
+
+    debut = time.perf_counter()
+    index = compiler_index(corpus, "bench", chatbot.preprocess_text)
+    compilation_s = time.perf_counter() - debut
+    chatbot.installer_index(index)
+
+    mesures = bench_chatbot(chatbot, messages)
+    if not args.sans_http:
+        mesures.update(bench_http(args, messages, rng, vocabulaire))
+
+    resultats = {
+        'environnement': environnement(),
+        'parametres': {k: v for k, v in vars(args).items() if k not in ('output', 'comparer')},
+        'index': {'patterns': index.X.shape[0], 'termes': index.X.shape[1], 'compilation_s': round(compilation_s, 3)},
+        'mesures': mesures,
+    }
+
+    print(f"Index : {resultats['index']}")
+    for nom, m in mesures.items():
+        print(f"{nom:>28} : p50={m['p50_ms']:>9}ms  p95={m['p95_ms']:>9}ms  p99={m['p99_ms']:>9}ms  {m['debit_s']:>10}/s")
+
+    if args.output:
+        ecrire_json(resultats, args.output)
+
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as file:
+            reference = json.load(file)
+        regressions = comparer(resultats, reference, args.tolerance)
+        for nom, avant, apres in regressions:
+            print(f"⚠️  Régression {nom} : p95 {avant}ms -> {apres}ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Débit de connexion (POST /login) sous concurrence, bcrypt dans le worker
+web ou dans un pool de processus (app/hachage.py)
+
+Des threads clients se connectent en boucle pendant qu'une sonde mesure
+la latence d'une page légère (GET /), pour voir si une rafale de
+connexions ralentit le reste du trafic du worker.
+
+Usage :
+    python benchmarks/bench_login.py --rounds 12 --clients 8 --duree 5
+    python benchmarks/bench_login.py --processus 0 1 2 --output login.json
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from outils import ecrire_json, environnement, resumer
+
+
+def preparer_app(rounds, nb_users, db_path):
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(rounds)
+    os.environ.setdefault('CORPUS_WATCH', "0")
+
+    from app import create_app, db, hachage
+    from app.models import User
+
+    app = create_app()
+    hachage.processus = 0
+    pw_hash = hachage.hacher("mot-de-passe")
+    with app.app_context():
+        db.session.add_all([
+            User(first_name="Bench", last_name=str(i), username=f"bench{i}", country="SN", password_hash=pw_hash)
+            for i in range(nb_users)
+        ])
+        db.session.commit()
+    return app, hachage
+
+
+def configurer_pool(hachage, processus, max_en_cours):
+    hachage.arreter()
+    hachage.processus = processus
+    hachage._places = threading.BoundedSemaphore(max_en_cours)
+    if processus > 0:
+        # Processus du pool lancés avant la mesure
+        hachage.demarrer()
+        hachage._obtenir_pool().submit(int).result()
+
+
+def charge(app, nb_clients, nb_users, duree):
+    latences_login, latences_sonde, erreurs = [], [], []
+    lock = threading.Lock()
+    depart = threading.Barrier(nb_clients + 1)
+    fin = []
+
+    def client(i):
+        c = app.test_client()
+        locales = []
+        depart.wait()
+        n = i
+        while time.perf_counter() < fin[0]:
+            debut = time.perf_counter()
+            r = c.post("/login", data={"username": f"bench{n % nb_users}", "password": "mot-de-passe"})
+            locales.append(time.perf_counter() - debut)
+            if r.status_code != 302:
+                erreurs.append(r.status_code)
+            c.get("/logout")
+            n += nb_clients
+        with lock:
+            latences_login.extend(locales)
+
+    def sonde():
+        c = app.test_client()
+        depart.wait()
+        while time.perf_counter() < fin[0]:
+            debut = time.perf_counter()
+            c.get("/")
+            latences_sonde.append(time.perf_counter() - debut)
+            time.sleep(0.01)
+
+    fin.append(time.perf_counter() + duree + 0.5)
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(nb_clients)]
+    threads.append(threading.Thread(target=sonde))
+    debut = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ecoule = time.perf_counter() - debut
+
+    return {
+        'login': resumer(latences_login, ecoule),
+        'sonde_get_accueil': resumer(latences_sonde),
+        'erreurs': len(erreurs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--processus", type=int, nargs="+", default=[0, 1, 2], help="0 = hachage dans le worker")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duree", type=float, default=5.0)
+    parser.add_argument("--max-en-cours", type=int, default=64)
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        app, hachage = preparer_app(args.rounds, args.users, os.path.join(dossier, "bench.db"))
+        resultats = {}
+        for processus in args.processus:
+            configurer_pool(hachage, processus, args.max_en_cours)
+            nom = "inline" if processus == 0 else f"pool_{processus}"
+            resultats[nom] = r = charge(app, args.clients, args.users, args.duree)
+            print(
+                f"{nom:>8} : {r['login']['debit_s']:>6}/s  login p50={r['login']['p50_ms']}ms "
+                f"p99={r['login']['p99_ms']}ms  |  GET / p50={r['sonde_get_accueil']['p50_ms']}ms "
+                f"p99={r['sonde_get_accueil']['p99_ms']}ms  erreurs={r['erreurs']}"
+            )
+        hachage.arreter()
+
+    if args.output:
+        ecrire_json({'environnement': environnement(), 'parametres': vars(args), 'mesures': resultats}, args.output)
+
+
+if __name__ == "__main__":
+    main()
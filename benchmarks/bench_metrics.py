@@ -0,0 +1,101 @@
+"""
+Coût de l'instrumentation (app/metrics.py)
+
+- Micro-benchmark : Compteur.inc, Histogramme.observe, span()
+- /api/chat et /api/history avec METRICS_ENABLED=0 puis 1, sur le même
+  corpus synthétique que bench_chatbot.py
+
+Usage :
+    python benchmarks/bench_metrics.py --requetes 1000 --output metrics.json
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from outils import ecrire_json, environnement
+import bench_chatbot
+
+
+def micro_benchmark(n):
+    from app import metrics
+
+    registre = metrics.Registre()
+    compteur = registre.compteur("bench_total", "Bench", ("endpoint",))
+    histogramme = registre.histogramme("bench_seconds", "Bench", ("stage",))
+
+    def boucle(fonction):
+        debut = time.perf_counter()
+        for _ in range(n):
+            fonction()
+        return round((time.perf_counter() - debut) / n * 1e6, 3)
+
+    def avec_span():
+        with metrics.span(histogramme, stage="x"):
+            pass
+
+    return {
+        'vide_us': boucle(lambda: None),
+        'compteur_inc_us': boucle(lambda: compteur.inc(endpoint="/api/chat")),
+        'histogramme_observe_us': boucle(lambda: histogramme.observe(0.001, stage="x")),
+        'span_us': boucle(avec_span),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000, help="Appels par micro-benchmark")
+    parser.add_argument("--intents", type=int, default=100)
+    parser.add_argument("--patterns", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--historique", type=int, default=200)
+    parser.add_argument("--requetes", type=int, default=500, help="Requêtes HTTP par route et par mode")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+    args.write_behind = False
+
+    os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="bench_metrics_"))
+
+    rng = random.Random(args.graine)
+    vocabulaire = bench_chatbot.generer_vocabulaire(5000, rng)
+    corpus, themes = bench_chatbot.generer_corpus(args.intents, args.patterns, vocabulaire, rng)
+    messages = bench_chatbot.generer_messages(args.requetes, themes, vocabulaire, rng)
+
+    from app import chatbot
+    from app.intent_index import compiler_index
+    chatbot.installer_index(compiler_index(corpus, "bench", chatbot.preprocess_text))
+
+    micro = micro_benchmark(args.iterations)
+    print("Micro (µs par appel) :", micro)
+
+    http = {}
+    for mode in ("0", "1"):
+        os.environ["METRICS_ENABLED"] = mode
+        chatbot.decision_cache.clear()
+        http[f"metriques_{mode}"] = bench_chatbot.bench_http(args, messages, random.Random(args.graine), vocabulaire)
+
+    surcout = {}
+    for route in http["metriques_0"]:
+        sans, avec = http["metriques_0"][route], http["metriques_1"][route]
+        surcout[route] = {
+            'p50_ms': round(avec['p50_ms'] - sans['p50_ms'], 4),
+            'moyenne_ms': round(avec['moyenne_ms'] - sans['moyenne_ms'], 4),
+            'relatif': round(avec['moyenne_ms'] / sans['moyenne_ms'] - 1, 4) if sans['moyenne_ms'] else None,
+        }
+        print(f"{route:>28} : sans={sans['moyenne_ms']}ms  avec={avec['moyenne_ms']}ms  "
+              f"surcoût={surcout[route]['moyenne_ms']}ms ({surcout[route]['relatif']:+.1%})")
+
+    if args.output:
+        ecrire_json({
+            'environnement': environnement(),
+            'micro_us': micro,
+            'http': http,
+            'surcout': surcout,
+        }, args.output)
+
+
+if __name__ == "__main__":
+    main()
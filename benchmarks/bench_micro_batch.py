@@ -0,0 +1,95 @@
+"""
+Micro-batching du classement (app/micro_batch.py) sous charge concurrente
+
+N threads envoient des messages uniques (cache de décisions froid) à
+get_bot_response, sans puis avec micro-batching, sur un corpus
+synthétique. Rapporte latence par message et débit total.
+
+Usage :
+    python benchmarks/bench_micro_batch.py --threads 16 --messages 4000 --attente-ms 2 5
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from outils import ecrire_json, environnement, resumer
+import bench_chatbot
+
+
+def charge(chatbot, messages, nb_threads):
+    """Répartir les messages entre les threads et mesurer chaque appel"""
+    latences = []
+    lock = threading.Lock()
+    depart = threading.Barrier(nb_threads)
+
+    def client(part):
+        locales = []
+        depart.wait()
+        for message in part:
+            debut = time.perf_counter()
+            chatbot.get_bot_response(message)
+            locales.append(time.perf_counter() - debut)
+        with lock:
+            latences.extend(locales)
+
+    threads = [threading.Thread(target=client, args=(messages[i::nb_threads],)) for i in range(nb_threads)]
+    debut = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resumer(latences, time.perf_counter() - debut)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--intents", type=int, default=200)
+    parser.add_argument("--patterns", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=4000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--attente-ms", type=float, nargs="+", default=[2.0, 5.0])
+    parser.add_argument("--max-lot", type=int, default=64)
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    rng = random.Random(args.graine)
+    vocabulaire = bench_chatbot.generer_vocabulaire(5000, rng)
+    corpus, themes = bench_chatbot.generer_corpus(args.intents, args.patterns, vocabulaire, rng)
+    messages = bench_chatbot.generer_messages(args.messages, themes, vocabulaire, rng)
+
+    from app import chatbot
+    from app.intent_index import compiler_index
+    from app.micro_batch import MicroBatcher
+
+    chatbot.installer_index(compiler_index(corpus, "bench", chatbot.preprocess_text))
+    # Le prétraitement est mis en cache pour ne mesurer que le classement
+    for message in messages:
+        chatbot.preprocess_text(message.strip().lower())
+
+    resultats = {}
+    chatbot.micro_batcher = None
+    chatbot.decision_cache.clear()
+    resultats['direct'] = charge(chatbot, messages, args.threads)
+
+    for attente in args.attente_ms:
+        batcher = MicroBatcher(chatbot._classer_lot, max_attente_ms=attente, max_lot=args.max_lot)
+        chatbot.micro_batcher = batcher
+        chatbot.decision_cache.clear()
+        mesure = charge(chatbot, messages, args.threads)
+        mesure['lots'] = batcher.stats()
+        resultats[f"lot_{attente:g}ms"] = mesure
+    chatbot.micro_batcher = None
+
+    for nom, m in resultats.items():
+        taille = f"  lot moyen={m['lots']['taille_moyenne']}" if 'lots' in m else ""
+        print(f"{nom:>12} : {m['debit_s']:>9}/s  p50={m['p50_ms']}ms  p95={m['p95_ms']}ms  p99={m['p99_ms']}ms{taille}")
+
+    if args.output:
+        ecrire_json({'environnement': environnement(), 'parametres': vars(args), 'mesures': resultats}, args.output)
+
+
+if __name__ == "__main__":
+    main()
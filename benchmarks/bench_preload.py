@@ -0,0 +1,111 @@
+"""
+Mémoire des workers gunicorn avec et sans --preload (GUNICORN_PRELOAD)
+
+Démarre gunicorn (gunicorn.conf.py du projet) sur une base temporaire,
+attend que tous les workers répondent, leur envoie quelques requêtes puis
+relève RSS / PSS / USS du master et de chaque worker (app/memoire.py,
+Linux uniquement). L'USS moyen d'un worker est le coût mémoire d'un
+worker supplémentaire.
+
+Usage :
+    python benchmarks/bench_preload.py --workers 4
+    python benchmarks/bench_preload.py --workers 2 4 8 --output preload.json
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from outils import ROOT, ecrire_json, environnement
+from app.memoire import processus_enfants, rapport
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def demarrer(preload, workers, port, dossier):
+    env = dict(
+        os.environ,
+        GUNICORN_PRELOAD="1" if preload else "0",
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(port),
+        DATABASE_URL=f"sqlite:///{os.path.join(dossier, 'bench.db')}",
+        METRICS_DIR=os.path.join(dossier, "metrics"),
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "cours:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def attendre_workers(process, workers, port, timeout):
+    """Secondes jusqu'à ce que tous les workers soient lancés et que le port réponde"""
+    debut = time.perf_counter()
+    while time.perf_counter() - debut < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn s'est arrêté (code {process.returncode})")
+        if len(processus_enfants(process.pid)) >= workers:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2).read()
+                return time.perf_counter() - debut
+            except OSError:
+                pass
+        time.sleep(0.1)
+    raise RuntimeError("gunicorn n'est pas prêt")
+
+
+def mesurer(preload, workers, requetes, timeout):
+    port = port_libre()
+    with tempfile.TemporaryDirectory() as dossier:
+        process = demarrer(preload, workers, port, dossier)
+        try:
+            demarrage = attendre_workers(process, workers, port, timeout)
+            # Quelques requêtes pour que chaque worker ait servi du trafic
+            for _ in range(requetes):
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=5).read()
+            time.sleep(0.5)
+            resultat = rapport(process.pid)
+        finally:
+            process.terminate()
+            process.wait(30)
+
+    uss = [w['uss_kb'] for w in resultat['workers']]
+    resultat['demarrage_s'] = round(demarrage, 2)
+    resultat['uss_moyen_worker_mb'] = round(sum(uss) / len(uss) / 1024, 1) if uss else 0.0
+    return resultat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[4])
+    parser.add_argument("--requetes", type=int, default=50, help="Requêtes envoyées avant la mesure")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    resultats = {}
+    for workers in args.workers:
+        for preload in (False, True):
+            nom = f"{workers}w_{'preload' if preload else 'sans_preload'}"
+            r = resultats[nom] = mesurer(preload, workers, args.requetes, args.timeout)
+            total = r['total']
+            print(
+                f"{nom:>18} : USS/worker={r['uss_moyen_worker_mb']} MB  "
+                f"PSS total={total['pss_kb'] / 1024:.1f} MB  RSS total={total['rss_kb'] / 1024:.1f} MB  "
+                f"démarrage={r['demarrage_s']}s"
+            )
+
+    if args.output:
+        ecrire_json({'environnement': environnement(), 'parametres': vars(args), 'mesures': resultats}, args.output)
+
+
+if __name__ == "__main__":
+    main()
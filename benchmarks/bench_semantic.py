@@ -0,0 +1,106 @@
+"""
+Latence CPU du moteur d'intentions sémantique (app/semantic_matcher.py)
+
+Pour chaque variante (int8 quantifié, et float32 avec --float32) :
+- temps de chargement du modèle et d'encodage des patterns du corpus
+- latence par requête seule (p50/p95/p99)
+- débit par lots de tailles croissantes
+- part des patterns du corpus rattachés au bon intent
+La même mesure est faite pour le TF-IDF, à titre de référence.
+
+Nécessite torch, transformers et un modèle enregistré localement :
+    python benchmarks/bench_semantic.py --model-dir instance/models/paraphrase-multilingual-MiniLM-L12-v2
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+from outils import ecrire_json, environnement, mesurer
+
+
+def bench_variante(model_dir, quantifier, patterns, tags, corpus_hash, requetes, tailles_lot, threads):
+    from app.semantic_matcher import SemanticMatcher
+
+    debut = time.perf_counter()
+    moteur = SemanticMatcher(model_dir, quantifier=quantifier, threads=threads).charger()
+    chargement_s = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    moteur.indexer(patterns, tags, corpus_hash, cache_dir=tempfile.mkdtemp(prefix="bench_semantic_"))
+    indexation_s = time.perf_counter() - debut
+
+    resultat = {
+        'chargement_s': round(chargement_s, 3),
+        'indexation_s': round(indexation_s, 3),
+        'requete_seule': mesurer(lambda texte: moteur.classer([texte]), requetes),
+        'lots': {},
+    }
+    for taille in tailles_lot:
+        moteur.taille_lot = taille
+        lots = [requetes[i:i + taille] for i in range(0, len(requetes), taille)]
+        mesure = mesurer(moteur.classer, lots)
+        mesure['requetes_par_s'] = round(len(requetes) / (mesure['moyenne_ms'] * mesure['n'] / 1000), 1)
+        resultat['lots'][str(taille)] = mesure
+
+    decisions = moteur.classer(list(patterns))
+    resultat['precision_patterns'] = round(sum(d[0] == t for d, t in zip(decisions, tags)) / len(tags), 4)
+    return resultat
+
+
+def main():
+    from app.semantic_matcher import MODEL_DIR
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--requetes", type=int, default=200, help="Nombre de requêtes mesurées")
+    parser.add_argument("--tailles-lot", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, default=None, help="Threads torch")
+    parser.add_argument("--float32", action="store_true", help="Mesurer aussi le modèle non quantifié")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    from app import chatbot
+    from app.intent_index import extraire_patterns, lire_corpus
+
+    data, corpus_hash = lire_corpus()
+    patterns, tags, _ = extraire_patterns(data)
+    rng = random.Random(args.graine)
+    requetes = [rng.choice(patterns).lower() for _ in range(args.requetes)]
+
+    resultats = {'environnement': environnement(), 'patterns': len(patterns), 'variantes': {}}
+
+    chatbot.installer_moteur_semantique(None)
+    resultats['tfidf'] = {
+        'requete_seule': mesurer(
+            lambda texte: chatbot.classer_messages([texte]), requetes, preparation=chatbot.decision_cache.clear
+        ),
+        'precision_patterns': round(
+            sum(d[0] == t for d, t in zip(chatbot.classer_messages(list(patterns)), tags)) / len(tags), 4
+        ),
+    }
+
+    variantes = [("int8", True)] + ([("float32", False)] if args.float32 else [])
+    for nom, quantifier in variantes:
+        resultats['variantes'][nom] = bench_variante(
+            args.model_dir, quantifier, patterns, tags, corpus_hash, requetes, args.tailles_lot, args.threads
+        )
+
+    tfidf = resultats['tfidf']
+    print(f"{'tfidf':>8} : p50={tfidf['requete_seule']['p50_ms']}ms  p95={tfidf['requete_seule']['p95_ms']}ms  "
+          f"précision={tfidf['precision_patterns']}")
+    for nom, r in resultats['variantes'].items():
+        seule = r['requete_seule']
+        debits = ", ".join(f"lot {t}: {m['requetes_par_s']}/s" for t, m in r['lots'].items())
+        print(f"{nom:>8} : p50={seule['p50_ms']}ms  p95={seule['p95_ms']}ms  p99={seule['p99_ms']}ms  "
+              f"précision={r['precision_patterns']}  chargement={r['chargement_s']}s  "
+              f"indexation={r['indexation_s']}s  {debits}")
+
+    if args.output:
+        ecrire_json(resultats, args.output)
+
+
+if __name__ == "__main__":
+    main()
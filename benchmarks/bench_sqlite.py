@@ -0,0 +1,161 @@
+"""
+Benchmark de concurrence SQLite : débit d'écriture du chat par profil
+
+Simule plusieurs workers gunicorn (processus) qui enregistrent chacun des
+paires de messages avec un commit par requête (comme /api/chat sans
+write-behind), pendant que d'autres processus lisent l'historique.
+
+Usage :
+    python benchmarks/bench_sqlite.py --ecrivains 4 --lecteurs 2 --duree 5
+    python benchmarks/bench_sqlite.py --profils default production --output sqlite.json
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from outils import ecrire_json, percentile
+
+
+def creer_app_bench(db_path, profil):
+    """Application minimale (sans routes ni chatbot) sur la base de test"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    os.environ['DB_PROFILE'] = profil
+
+    from flask import Flask
+    from app import db
+    from app.database import configurer_base, activer_pragmas
+    import app.models  # noqa: F401  (enregistre les tables)
+
+    app = Flask("bench_sqlite")
+    configurer_base(app)
+    db.init_app(app)
+    activer_pragmas(app, db)
+    return app, db
+
+
+def attendre(barriere, duree):
+    # Tous les processus démarrent la mesure en même temps, imports terminés
+    barriere.wait()
+    return time.time() + duree
+
+
+def ecrivain(db_path, profil, barriere, duree, user_id, resultats):
+    from sqlalchemy.exc import OperationalError
+    from app.models import Message
+
+    app, db = creer_app_bench(db_path, profil)
+    commits = 0
+    erreurs = 0
+    latences = []
+    fin = attendre(barriere, duree)
+    with app.app_context():
+        while time.time() < fin:
+            t0 = time.perf_counter()
+            try:
+                db.session.add(Message(content="question", is_from_user=True, user_id=user_id))
+                db.session.add(Message(content="réponse", is_from_user=False, user_id=user_id))
+                db.session.commit()
+                commits += 1
+                latences.append(time.perf_counter() - t0)
+            except OperationalError:
+                db.session.rollback()
+                erreurs += 1
+    resultats.put(('ecrivain', commits, erreurs, latences))
+
+
+def lecteur(db_path, profil, barriere, duree, user_id, resultats):
+    from sqlalchemy.exc import OperationalError
+    from app.models import Message
+
+    app, db = creer_app_bench(db_path, profil)
+    lectures = 0
+    erreurs = 0
+    fin = attendre(barriere, duree)
+    with app.app_context():
+        while time.time() < fin:
+            try:
+                Message.query.filter_by(user_id=user_id).order_by(Message.timestamp.desc()).limit(50).all()
+                db.session.rollback()
+                lectures += 1
+            except OperationalError:
+                db.session.rollback()
+                erreurs += 1
+    resultats.put(('lecteur', lectures, erreurs, []))
+
+
+def executer_profil(profil, nb_ecrivains, nb_lecteurs, duree):
+    dossier = tempfile.mkdtemp(prefix="bench_sqlite_")
+    db_path = os.path.join(dossier, "bench.db")
+
+    app, db = creer_app_bench(db_path, profil)
+    from app.models import User
+    with app.app_context():
+        db.create_all()
+        user = User(first_name="Bench", last_name="Mark", username="bench", country="BF", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.engine.dispose()
+
+    ctx = multiprocessing.get_context("spawn")
+    resultats = ctx.Queue()
+    barriere = ctx.Barrier(nb_ecrivains + nb_lecteurs)
+    processus = [ctx.Process(target=ecrivain, args=(db_path, profil, barriere, duree, user_id, resultats)) for _ in range(nb_ecrivains)]
+    processus += [ctx.Process(target=lecteur, args=(db_path, profil, barriere, duree, user_id, resultats)) for _ in range(nb_lecteurs)]
+    for p in processus:
+        p.start()
+
+    commits = lectures = erreurs = 0
+    latences = []
+    for _ in processus:
+        role, nombre, nb_erreurs, lat = resultats.get()
+        erreurs += nb_erreurs
+        if role == 'ecrivain':
+            commits += nombre
+            latences.extend(lat)
+        else:
+            lectures += nombre
+    for p in processus:
+        p.join()
+
+    return {
+        'profil': profil,
+        'ecrivains': nb_ecrivains,
+        'lecteurs': nb_lecteurs,
+        'commits': commits,
+        'commits_par_s': round(commits / duree, 1),
+        'lectures_par_s': round(lectures / duree, 1),
+        'lectures': lectures,
+        'erreurs_verrou': erreurs,
+        'commit_p50_ms': round(percentile(latences, 0.50) * 1000, 2),
+        'commit_p95_ms': round(percentile(latences, 0.95) * 1000, 2),
+        'commit_p99_ms': round(percentile(latences, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profils", nargs="+", default=["default", "production"])
+    parser.add_argument("--ecrivains", type=int, default=4)
+    parser.add_argument("--lecteurs", type=int, default=2)
+    parser.add_argument("--duree", type=float, default=5.0, help="Durée par profil (secondes)")
+    parser.add_argument("--output", help="Fichier JSON de sortie")
+    args = parser.parse_args()
+
+    resultats = [executer_profil(p, args.ecrivains, args.lecteurs, args.duree) for p in args.profils]
+    for r in resultats:
+        print(
+            f"{r['profil']:>10} : {r['commits_par_s']:>8} commits/s  "
+            f"p50={r['commit_p50_ms']}ms p95={r['commit_p95_ms']}ms p99={r['commit_p99_ms']}ms  "
+            f"lectures/s={r['lectures_par_s']}  erreurs={r['erreurs_verrou']}"
+        )
+
+    if args.output:
+        ecrire_json(resultats, args.output)
+
+
+if __name__ == "__main__":
+    main()
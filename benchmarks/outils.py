@@ -0,0 +1,112 @@
+"""
+Fonctions communes aux benchmarks : mesure, percentiles, sortie JSON
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(valeurs, p):
+    """Percentile p (0-1) d'une liste, par rang le plus proche"""
+    if not valeurs:
+        return 0.0
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(p * len(valeurs)))]
+
+
+def resumer(latences, duree=None):
+    """
+    Résumé d'une série de latences (secondes)
+
+    Args:
+        latences: Durée de chaque opération
+        duree: Durée murale totale (par défaut : somme des latences)
+
+    Returns:
+        dict: n, p50/p95/p99/moyenne en ms, débit en opérations par seconde
+    """
+    if duree is None:
+        duree = sum(latences)
+    n = len(latences)
+    return {
+        'n': n,
+        'p50_ms': round(percentile(latences, 0.50) * 1000, 4),
+        'p95_ms': round(percentile(latences, 0.95) * 1000, 4),
+        'p99_ms': round(percentile(latences, 0.99) * 1000, 4),
+        'moyenne_ms': round(sum(latences) / n * 1000, 4) if n else 0.0,
+        'debit_s': round(n / duree, 1) if duree else 0.0,
+    }
+
+
+def mesurer(fonction, entrees, preparation=None):
+    """
+    Appeler `fonction` sur chaque entrée et résumer les latences
+
+    Args:
+        fonction: Fonction à un argument
+        entrees: Arguments successifs
+        preparation: Appelée avant chaque appel, hors mesure (ex. vider un cache)
+    """
+    latences = []
+    debut_total = time.perf_counter()
+    for entree in entrees:
+        if preparation is not None:
+            preparation()
+        debut = time.perf_counter()
+        fonction(entree)
+        latences.append(time.perf_counter() - debut)
+    duree = time.perf_counter() - debut_total if preparation is None else None
+    return resumer(latences, duree)
+
+
+def environnement():
+    """Version du code et de la machine, pour comparer des résultats"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def ecrire_json(resultats, chemin):
+    with open(chemin, "w", encoding="utf-8") as file:
+        json.dump(resultats, file, indent=2, ensure_ascii=False)
+
+
+def comparer(actuel, reference, tolerance):
+    """
+    Comparer le p95 de chaque mesure à un résultat de référence
+
+    Args:
+        actuel, reference: {'mesures': {nom: résumé}}
+        tolerance: Hausse relative acceptée (0.2 = +20 %)
+
+    Returns:
+        list: Régressions [(nom, p95_reference, p95_actuel), ...]
+    """
+    regressions = []
+    for nom, mesure in actuel['mesures'].items():
+        ancienne = reference.get('mesures', {}).get(nom)
+        if not ancienne or not ancienne.get('p95_ms'):
+            continue
+        if mesure['p95_ms'] > ancienne['p95_ms'] * (1 + tolerance):
+            regressions.append((nom, ancienne['p95_ms'], mesure['p95_ms']))
+    return regressions
@@ -0,0 +1,109 @@
+"""
+Configuration gunicorn (chargée automatiquement depuis le dossier courant)
+"""
+
+import gc
+import os
+import time
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# Plusieurs threads par worker (gthread) : requêtes concurrentes dans un
+# même processus, regroupées par le micro-batching du chatbot
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+
+# bcrypt dans un pool de processus par worker (app/hachage.py). Réservé à
+# gunicorn : hors gunicorn (python cours.py), le mode spawn du pool
+# réexécuterait le script principal et donc create_app() dans chaque processus
+os.environ.setdefault("BCRYPT_PROCESSUS", "1")
+
+# GUNICORN_PRELOAD=1 : l'application (modèle d'intentions, NLTK) est chargée
+# une fois dans le master puis partagée par les workers en copy-on-write.
+# Le ramasse-miettes est suspendu pendant le chargement puis les objets sont
+# gelés (gc.freeze) : les collectes des workers ne réécrivent plus leurs
+# en-têtes, ce qui dupliquerait les pages partagées.
+preload_app = os.environ.get("GUNICORN_PRELOAD") == "1"
+if preload_app:
+    gc.disable()
+
+# Threads de fond de l'application, arrêtés dans le master avant les forks
+# et redémarrés dans chaque worker
+THREADS_APPLICATION = ("corpus_watcher", "sms_workers", "rappel_scheduler")
+_arretes_avant_fork = []
+
+
+def on_starting(server):
+    """Repartir de métriques vides à chaque démarrage du master"""
+    from app.metrics import reinitialiser_dossier
+
+    reinitialiser_dossier()
+
+
+def _rechauffer_nltk(server, qui):
+    from app.nltk_resources import rechauffer
+
+    debut = time.perf_counter()
+    durees = rechauffer()
+    total = (time.perf_counter() - debut) * 1000
+    server.log.info("%s : warm-up NLTK %.1f ms %s", qui, total, durees)
+
+
+def when_ready(server):
+    """Avec preload : préparer dans le master tout ce que les workers partageront"""
+    if not server.cfg.preload_app:
+        return
+
+    app = server.app.wsgi()
+    # Aucun thread ne doit tenir un verrou ou une connexion au moment du fork
+    for nom in THREADS_APPLICATION:
+        extension = app.extensions.get(nom)
+        # Le watcher sans surveillance (CORPUS_WATCH=0) n'a pas de thread
+        if extension is not None and getattr(extension, "surveiller", True):
+            extension.stop()
+            _arretes_avant_fork.append(nom)
+
+    _rechauffer_nltk(server, "Master")
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """
+    Sans preload : charger punkt et WordNet dans chaque worker avant sa
+    première requête. Avec preload : ils sont hérités du master, il reste à
+    relancer les threads de fond arrêtés avant le fork.
+    """
+    if not server.cfg.preload_app:
+        _rechauffer_nltk(server, f"Worker {worker.pid}")
+        return
+
+    gc.enable()
+    app = worker.app.wsgi()
+    for nom in _arretes_avant_fork:
+        app.extensions[nom].start()
+
+
+def post_worker_init(worker):
+    """Lancer le pool de hachage bcrypt avant la première connexion"""
+    hachage = worker.wsgi.extensions.get("hachage")
+    if hachage:
+        hachage.demarrer()
+
+
+def worker_exit(server, worker):
+    """Écrire les échanges du chatbot encore en attente avant l'arrêt du worker"""
+    tampon = getattr(worker, "wsgi", None) and worker.wsgi.extensions.get("write_behind")
+    if tampon:
+        tampon.fermer()
+    hachage = getattr(worker, "wsgi", None) and worker.wsgi.extensions.get("hachage")
+    if hachage:
+        hachage.arreter()
+
+
+def child_exit(server, worker):
+    """Garder les métriques d'un worker arrêté (même tué) dans l'archive"""
+    from app.metrics import archiver_processus
+
+    archiver_processus(worker.pid)